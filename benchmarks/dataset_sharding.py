@@ -0,0 +1,119 @@
+# MIT License
+
+# Copyright (c) 2021 MARL @ SJTU
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# pragma: no cover
+"""Scaling benchmark for sharded offline dataset on a single machine. Producers push episodes
+concurrently, and the insertion rate is measured until all episodes have been written. Then a
+consumer pipe is opened to measure the sampling rate.
+
+Example:
+
+    python benchmarks/dataset_sharding.py --num-shards 1 2 4 8 --num-producers 16
+"""
+
+from argparse import ArgumentParser
+
+import os
+import sys
+import time
+
+import numpy as np
+import ray
+
+# make the package importable when running from a source checkout, for Ray workers too
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ["PYTHONPATH"] = os.pathsep.join(
+    filter(None, [ROOT, os.environ.get("PYTHONPATH")])
+)
+
+from malib.utils.episode import Episode
+from malib.backend.offline_dataset_server import OfflineDataset, resolve_batch_info
+
+
+@ray.remote(num_cpus=0)
+def produce(writer, n_episode: int, episode_length: int, obs_dim: int):
+    episode = {
+        Episode.CUR_OBS: np.random.random((episode_length, obs_dim)).astype(np.float32),
+        Episode.ACTION: np.zeros(episode_length, dtype=np.int64),
+        Episode.REWARD: np.zeros(episode_length, dtype=np.float32),
+        Episode.DONE: np.zeros(episode_length, dtype=np.bool_),
+    }
+    for _ in range(n_episode):
+        writer.put_nowait_batch([episode])
+
+
+def bench(num_shards: int, args):
+    capacity = args.num_producers * args.n_episode * args.episode_length
+    server = (
+        OfflineDataset.as_remote(num_cpus=0)
+        .options(max_concurrency=100)
+        .remote(table_capacity=capacity, num_shards=num_shards)
+    )
+    name, writer = ray.get(server.start_producer_pipe.remote(name="sharding"))
+
+    start = time.perf_counter()
+    ray.get(
+        [
+            produce.remote(writer, args.n_episode, args.episode_length, args.obs_dim)
+            for _ in range(args.num_producers)
+        ]
+    )
+    while ray.get(server.get_table_size.remote(name)) < capacity:
+        time.sleep(0.01)
+    insert_rate = capacity / (time.perf_counter() - start)
+
+    queue_id, reader = ray.get(
+        server.start_consumer_pipe.remote(
+            name=name, batch_size=args.batch_size, zero_copy=True
+        )
+    )
+    resolve_batch_info(reader.get())
+    start = time.perf_counter()
+    for _ in range(args.n_batch):
+        resolve_batch_info(reader.get())
+    sample_rate = args.n_batch / (time.perf_counter() - start)
+
+    ray.get(server.end_consumer_pipe.remote(queue_id))
+    ray.get(server.end_producer_pipe.remote(name))
+    ray.kill(server)
+    return insert_rate, sample_rate
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser("Sharded dataset benchmark.")
+    parser.add_argument("--num-shards", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--num-producers", type=int, default=16)
+    parser.add_argument("--n-episode", type=int, default=50)
+    parser.add_argument("--episode-length", type=int, default=200)
+    parser.add_argument("--obs-dim", type=int, default=128)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--n-batch", type=int, default=200)
+
+    args = parser.parse_args()
+
+    ray.init()
+    print(f"{'shards':>8} {'rows/s inserted':>16} {'batch/s sampled':>16}")
+    for num_shards in args.num_shards:
+        insert_rate, sample_rate = bench(num_shards, args)
+        print(f"{num_shards:>8} {insert_rate:>16.0f} {sample_rate:>16.1f}")
+    ray.shutdown()
@@ -0,0 +1,107 @@
+# MIT License
+
+# Copyright (c) 2021 MARL @ SJTU
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# pragma: no cover
+"""Measure the learner-side latency of retrieving a batch from a consumer pipe, with and without
+zero-copy transport.
+
+Example:
+
+    python benchmarks/dataset_transport.py --obs-shape 4 84 84 --batch-size 256
+"""
+
+from argparse import ArgumentParser
+
+import os
+import sys
+import time
+
+import numpy as np
+import ray
+
+# make the package importable when running from a source checkout, for Ray workers too
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ["PYTHONPATH"] = os.pathsep.join(
+    filter(None, [ROOT, os.environ.get("PYTHONPATH")])
+)
+
+from malib.utils.episode import Episode
+from malib.backend.offline_dataset_server import OfflineDataset, resolve_batch_info
+
+
+def bench(server: OfflineDataset, name: str, args, zero_copy: bool) -> float:
+    """Return the average seconds for retrieving and resolving a batch."""
+
+    queue_id, queue = server.start_consumer_pipe(
+        name=name,
+        batch_size=args.batch_size,
+        prefetch_depth=args.prefetch_depth,
+        zero_copy=zero_copy,
+    )
+    # warm up
+    for _ in range(5):
+        resolve_batch_info(queue.get())
+
+    start = time.perf_counter()
+    for _ in range(args.n_round):
+        batch, _ = resolve_batch_info(queue.get())
+        # touch the data, as a learner does
+        batch.to_torch()
+    cost = (time.perf_counter() - start) / args.n_round
+    server.end_consumer_pipe(queue_id)
+    return cost
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser("Dataset transport benchmark.")
+    parser.add_argument("--obs-shape", type=int, nargs="+", default=[4, 84, 84])
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--capacity", type=int, default=2000)
+    parser.add_argument("--prefetch-depth", type=int, default=2)
+    parser.add_argument("--n-round", type=int, default=50)
+
+    args = parser.parse_args()
+
+    ray.init()
+    server = OfflineDataset(table_capacity=args.capacity)
+    name, writer = server.start_producer_pipe(name="dataset_transport")
+    obs_shape = tuple(args.obs_shape)
+    writer.put(
+        {
+            Episode.CUR_OBS: np.random.random((args.capacity,) + obs_shape).astype(
+                np.float32
+            ),
+            Episode.REWARD: np.zeros(args.capacity, dtype=np.float32),
+        }
+    )
+    while len(server.buffers[name]) < args.capacity:
+        time.sleep(0.1)
+
+    batch_bytes = args.batch_size * np.prod(obs_shape) * 4
+    print(f"batch size: {batch_bytes / 1024 ** 2:.1f} MB")
+    for zero_copy in [False, True]:
+        cost = bench(server, name, args, zero_copy)
+        print(f"zero_copy={zero_copy}: {cost * 1e3:.2f} ms/batch")
+
+    server.end_producer_pipe(name)
+    ray.shutdown()
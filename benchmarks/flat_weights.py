@@ -0,0 +1,100 @@
+# MIT License
+
+# Copyright (c) 2021 MARL @ SJTU
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# pragma: no cover
+"""Compare nested and flat (packed) state dicts of a policy with many small tensors, for the time of
+exporting, serializing, deserializing and loading weights, i.e., a weights sync between a learner and
+an inference server.
+
+Example:
+
+    python benchmarks/flat_weights.py --layers 8 32 128 --hidden 64
+"""
+
+from argparse import ArgumentParser
+
+import pickle
+import os
+import sys
+import time
+
+import torch.nn as nn
+
+from gym import spaces
+
+# make the package importable when running from a source checkout, for Ray workers too
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ["PYTHONPATH"] = os.pathsep.join(
+    filter(None, [ROOT, os.environ.get("PYTHONPATH")])
+)
+
+from malib.rl.common.policy import Policy
+
+
+class MLPPolicy(Policy):
+    def __init__(self, layers: int, hidden: int):
+        super().__init__(
+            spaces.Box(-1.0, 1.0, shape=(hidden,)), spaces.Discrete(2), {}, {}
+        )
+        self.net = nn.Sequential(
+            *[
+                nn.Sequential(nn.Linear(hidden, hidden), nn.LayerNorm(hidden))
+                for _ in range(layers)
+            ]
+        )
+        self.register_state(self.net, "net")
+
+    def compute_action(self, *args, **kwargs):
+        raise NotImplementedError
+
+
+def bench(layers: int, hidden: int, flat: bool, n_round: int) -> float:
+    """Return the average seconds of a weights sync."""
+
+    learner, server = MLPPolicy(layers, hidden), MLPPolicy(layers, hidden)
+    export = learner.flat_state_dict if flat else learner.state_dict
+    server.load_state_dict(pickle.loads(pickle.dumps(export())))
+
+    start = time.perf_counter()
+    for _ in range(n_round):
+        server.load_state_dict(pickle.loads(pickle.dumps(export())))
+    return (time.perf_counter() - start) / n_round
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser("Flat weights benchmark.")
+    parser.add_argument("--layers", type=int, nargs="+", default=[8, 32, 128])
+    parser.add_argument("--hidden", type=int, default=64)
+    parser.add_argument("--n-round", type=int, default=50)
+
+    args = parser.parse_args()
+
+    for layers in args.layers:
+        n_tensors = layers * 4
+        n_bytes = layers * (args.hidden + 3) * args.hidden * 4
+        nested = bench(layers, args.hidden, False, args.n_round)
+        flat = bench(layers, args.hidden, True, args.n_round)
+        print(
+            f"{n_tensors} tensors, {n_bytes / 1024 ** 2:.2f} MB: nested {nested * 1e3:.2f} ms, "
+            f"flat {flat * 1e3:.2f} ms"
+        )
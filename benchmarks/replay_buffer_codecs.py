@@ -0,0 +1,95 @@
+# MIT License
+
+# Copyright (c) 2021 MARL @ SJTU
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# pragma: no cover
+"""Benchmark for column codecs of replay tables. It reports the bytes per stored row and the sampling
+rate, with plain columns and with codecs inferred from spaces, for an Open Spiel like table whose
+observations are binary tensors produced as float64 arrays.
+
+Example:
+
+    python benchmarks/replay_buffer_codecs.py --obs-dim 288 --n-action 9
+"""
+
+from argparse import ArgumentParser
+
+import os
+import sys
+import time
+
+import numpy as np
+
+from gym import spaces
+
+# make the package importable when running from a source checkout, for Ray workers too
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ["PYTHONPATH"] = os.pathsep.join(
+    filter(None, [ROOT, os.environ.get("PYTHONPATH")])
+)
+
+from malib.utils.episode import Episode
+from malib.utils.codecs import infer_codecs
+from malib.utils.replay_buffer import ReplayBuffer
+
+
+def gen_data(n: int, obs_dim: int, n_action: int) -> dict:
+    return {
+        Episode.CUR_OBS: (np.random.random((n, obs_dim)) > 0.8).astype(np.float64),
+        Episode.NEXT_OBS: (np.random.random((n, obs_dim)) > 0.8).astype(np.float64),
+        Episode.ACTION_MASK: (np.random.random((n, n_action)) > 0.5).astype(np.float64),
+        Episode.ACTION: np.random.randint(n_action, size=n),
+        Episode.REWARD: np.random.random(n).astype(np.float32),
+        Episode.DONE: np.random.random(n) > 0.95,
+    }
+
+
+def bench(codecs: dict, args):
+    """Return bytes per row and sampled batches per second."""
+
+    buffer = ReplayBuffer(size=args.capacity, codecs=codecs)
+    buffer.add_batch(gen_data(args.capacity, args.obs_dim, args.n_action))
+    row_bytes = sum(v.nbytes for v in buffer.data.values()) / args.capacity
+
+    start = time.perf_counter()
+    for _ in range(args.n_round):
+        buffer.sample(args.batch_size)
+    return row_bytes, args.n_round / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser("Replay table codec benchmark.")
+    parser.add_argument("--capacity", type=int, default=100000)
+    parser.add_argument("--obs-dim", type=int, default=288)
+    parser.add_argument("--n-action", type=int, default=9)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--n-round", type=int, default=2000)
+
+    args = parser.parse_args()
+
+    codecs = infer_codecs(
+        spaces.MultiBinary(args.obs_dim), spaces.Discrete(args.n_action)
+    )
+    print(f"{'codecs':>8} {'bytes/row':>10} {'batch/s':>10} {'us/batch':>10}")
+    for name, _codecs in [("none", None), ("inferred", codecs)]:
+        row_bytes, rate = bench(_codecs, args)
+        print(f"{name:>8} {row_bytes:>10.0f} {rate:>10.1f} {1e6 / rate:>10.1f}")
@@ -0,0 +1,94 @@
+# MIT License
+
+# Copyright (c) 2021 MARL @ SJTU
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# pragma: no cover
+"""Micro-benchmark for `ReplayBuffer.add_batch`. The insertion cost should stay flat as the
+table capacity grows, since each insertion only touches the rows it writes.
+
+Example:
+
+    python benchmarks/replay_buffer_insert.py --capacities 1000 10000 100000 --obs-shape 4 84 84
+"""
+
+from argparse import ArgumentParser
+
+import os
+import sys
+import time
+
+import numpy as np
+
+# make the package importable when running from a source checkout, for Ray workers too
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ["PYTHONPATH"] = os.pathsep.join(
+    filter(None, [ROOT, os.environ.get("PYTHONPATH")])
+)
+
+from malib.utils.episode import Episode
+from malib.utils.replay_buffer import ReplayBuffer
+
+
+def gen_episode(length: int, obs_shape, obs_dtype) -> dict:
+    return {
+        Episode.CUR_OBS: np.zeros((length,) + obs_shape, dtype=obs_dtype),
+        Episode.NEXT_OBS: np.zeros((length,) + obs_shape, dtype=obs_dtype),
+        Episode.ACTION: np.zeros(length, dtype=np.int64),
+        Episode.REWARD: np.zeros(length, dtype=np.float32),
+        Episode.DONE: np.zeros(length, dtype=np.bool_),
+    }
+
+
+def bench_insert(capacity: int, episode: dict, n_insert: int) -> float:
+    """Return the average seconds per `add_batch` call on a full table."""
+
+    buffer = ReplayBuffer(size=capacity)
+    # fill the table first, so that every measured insertion overwrites old rows
+    episode_len = len(episode[Episode.REWARD])
+    for _ in range(capacity // episode_len + 1):
+        buffer.add_batch(episode)
+
+    start = time.perf_counter()
+    for _ in range(n_insert):
+        buffer.add_batch(episode)
+    return (time.perf_counter() - start) / n_insert
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser("Replay buffer insertion benchmark.")
+    parser.add_argument(
+        "--capacities", type=int, nargs="+", default=[1000, 10000, 100000]
+    )
+    parser.add_argument("--obs-shape", type=int, nargs="+", default=[4, 84, 84])
+    parser.add_argument("--obs-dtype", type=str, default="uint8")
+    parser.add_argument("--episode-length", type=int, default=100)
+    parser.add_argument("--n-insert", type=int, default=200)
+
+    args = parser.parse_args()
+
+    episode = gen_episode(
+        args.episode_length, tuple(args.obs_shape), np.dtype(args.obs_dtype)
+    )
+    print(f"{'capacity':>12} {'us/insert':>12} {'rows/s':>14}")
+    for capacity in args.capacities:
+        cost = bench_insert(capacity, episode, args.n_insert)
+        print(f"{capacity:>12} {cost * 1e6:>12.1f} {args.episode_length / cost:>14.0f}")
@@ -0,0 +1,95 @@
+# MIT License
+
+# Copyright (c) 2021 MARL @ SJTU
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# pragma: no cover
+"""Compare the sampling throughput of uniform and prioritized tables.
+
+Example:
+
+    python benchmarks/replay_buffer_sample.py --capacity 1000000 --batch-size 256
+"""
+
+from argparse import ArgumentParser
+
+import os
+import sys
+import time
+
+import numpy as np
+
+# make the package importable when running from a source checkout, for Ray workers too
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ["PYTHONPATH"] = os.pathsep.join(
+    filter(None, [ROOT, os.environ.get("PYTHONPATH")])
+)
+
+from malib.utils.episode import Episode
+from malib.utils.replay_buffer import ReplayBuffer, PrioritizedReplayBuffer
+
+
+def fill(buffer: ReplayBuffer, capacity: int, obs_dim: int, block: int = 10000):
+    for start in range(0, capacity, block):
+        n = min(block, capacity - start)
+        buffer.add_batch(
+            {
+                Episode.CUR_OBS: np.random.random((n, obs_dim)).astype(np.float32),
+                Episode.ACTION: np.random.randint(0, 10, size=n),
+                Episode.REWARD: np.random.random(n).astype(np.float32),
+                Episode.DONE: np.zeros(n, dtype=np.bool_),
+            }
+        )
+
+
+def bench(buffer: ReplayBuffer, batch_size: int, n_round: int, update: bool):
+    """Return sampled batches per second, with or without priority updating."""
+
+    start = time.perf_counter()
+    for _ in range(n_round):
+        _, indices = buffer.sample(batch_size)
+        if update:
+            buffer.update_priorities(indices, np.random.random(batch_size))
+    return n_round / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser("Replay buffer sampling benchmark.")
+    parser.add_argument("--capacity", type=int, default=int(1e6))
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--obs-dim", type=int, default=32)
+    parser.add_argument("--n-round", type=int, default=1000)
+
+    args = parser.parse_args()
+
+    uniform = ReplayBuffer(size=args.capacity)
+    prioritized = PrioritizedReplayBuffer(size=args.capacity)
+    fill(uniform, args.capacity, args.obs_dim)
+    fill(prioritized, args.capacity, args.obs_dim)
+
+    results = {
+        "uniform": bench(uniform, args.batch_size, args.n_round, False),
+        "prioritized": bench(prioritized, args.batch_size, args.n_round, False),
+        "prioritized+update": bench(prioritized, args.batch_size, args.n_round, True),
+    }
+    print(f"{'table':>20} {'batch/s':>12} {'rows/s':>14}")
+    for k, v in results.items():
+        print(f"{k:>20} {v:>12.1f} {v * args.batch_size:>14.0f}")
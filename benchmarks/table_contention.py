@@ -0,0 +1,161 @@
+# MIT License
+
+# Copyright (c) 2021 MARL @ SJTU
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# pragma: no cover
+"""Contention benchmark for data tables. A single writer thread keeps inserting episodes while
+reader threads keep sampling, and the insertion and sampling rates are measured with the table
+guarded by a reader-writer lock, or accessed lock-free.
+
+The writer is paced at `--insert-rate` rows per second, so that both modes spend the same CPU time
+on insertion and the sampling rates are comparable, which matters with fewer cores than threads.
+Pass `--insert-rate 0` for an unpaced writer. Under the lock, the writer is also delayed by
+readers, so the achieved insertion rate falls behind the target. Modes are run in alternating order
+for `--repeats` rounds after a warm-up, and medians are reported, as thread scheduling makes single
+runs noisy. The CPU time of readers per batch measures the sampling cost without scheduling effects.
+
+Example:
+
+    python benchmarks/table_contention.py --capacity 100000 --num-readers 1 4
+"""
+
+from argparse import ArgumentParser, Namespace
+from contextlib import nullcontext
+
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+from readerwriterlock import rwlock
+
+# make the package importable when running from a source checkout, for Ray workers too
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ["PYTHONPATH"] = os.pathsep.join(
+    filter(None, [ROOT, os.environ.get("PYTHONPATH")])
+)
+
+from malib.utils.episode import Episode
+from malib.utils.replay_buffer import ReplayBuffer
+
+
+def gen_episode(length: int, obs_dim: int) -> dict:
+    return {
+        Episode.CUR_OBS: np.random.random((length, obs_dim)).astype(np.float32),
+        Episode.NEXT_OBS: np.random.random((length, obs_dim)).astype(np.float32),
+        Episode.ACTION: np.zeros(length, dtype=np.int64),
+        Episode.REWARD: np.zeros(length, dtype=np.float32),
+        Episode.DONE: np.zeros(length, dtype=np.bool_),
+    }
+
+
+def bench(lock_free: bool, num_readers: int, args):
+    """Return inserted rows per second, sampled batches per second, and reader CPU time per batch in \
+    microseconds."""
+
+    buffer = ReplayBuffer(size=args.capacity)
+    episode = gen_episode(args.episode_length, args.obs_dim)
+    while len(buffer) < args.capacity:
+        buffer.add_batch(episode)
+
+    marker = rwlock.RWLockFair()
+    wlock = nullcontext() if lock_free else marker.gen_wlock()
+    stop = threading.Event()
+    counts = [0] * (num_readers + 1)
+    cpu_times = [0.0] * (num_readers + 1)
+
+    def write():
+        start = time.perf_counter()
+        while not stop.is_set():
+            with wlock:
+                buffer.add_batch(episode)
+            counts[0] += args.episode_length
+            if args.insert_rate > 0:
+                # sleep until the schedule of the target rate
+                delay = start + counts[0] / args.insert_rate - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+
+    def read(i: int):
+        rlock = nullcontext() if lock_free else marker.gen_rlock()
+        start = time.thread_time()
+        while not stop.is_set():
+            with rlock:
+                buffer.sample(args.batch_size)
+            counts[i] += 1
+        cpu_times[i] = time.thread_time() - start
+
+    threads = [threading.Thread(target=write)] + [
+        threading.Thread(target=read, args=(i + 1,)) for i in range(num_readers)
+    ]
+    for thread in threads:
+        thread.start()
+    time.sleep(args.duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    num_batches = sum(counts[1:])
+    return (
+        counts[0] / args.duration,
+        num_batches / args.duration,
+        1e6 * sum(cpu_times) / max(num_batches, 1),
+    )
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser("Data table contention benchmark.")
+    parser.add_argument("--capacity", type=int, default=100000)
+    parser.add_argument("--num-readers", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--episode-length", type=int, default=200)
+    parser.add_argument("--obs-dim", type=int, default=128)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument(
+        "--insert-rate",
+        type=float,
+        default=200000,
+        help="target of inserted rows per second, 0 for an unpaced writer",
+    )
+
+    args = parser.parse_args()
+
+    print(
+        f"{'mode':>10} {'readers':>8} {'rows/s inserted':>16} {'batch/s sampled':>16} "
+        f"{'cpu us/batch':>13}"
+    )
+    # warm up allocators and caches, the first run is slower regardless of the mode
+    bench(True, 1, Namespace(**{**vars(args), "duration": 1.0}))
+    for num_readers in args.num_readers:
+        results = {False: [], True: []}
+        for i in range(args.repeats):
+            for lock_free in (False, True) if i % 2 == 0 else (True, False):
+                results[lock_free].append(bench(lock_free, num_readers, args))
+        for lock_free in (False, True):
+            insert_rate, sample_rate, cpu_time = np.median(results[lock_free], axis=0)
+            mode = "lock-free" if lock_free else "rwlock"
+            print(
+                f"{mode:>10} {num_readers:>8} {insert_rate:>16.0f} {sample_rate:>16.1f} "
+                f"{cpu_time:>13.1f}"
+            )
@@ -0,0 +1,148 @@
+# MIT License
+
+# Copyright (c) 2021 MARL @ SJTU
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# pragma: no cover
+"""Measure bytes per update and end-to-end sync latency of weights transfer with each wire format, i.e.,
+a learner pushes weights of a drifting MLP critic to the parameter server, then a rollout worker pulls
+and decodes them.
+
+Example:
+
+    python benchmarks/weight_transfer.py --hidden 1024 --layers 4 --drift 1e-4
+"""
+
+from argparse import ArgumentParser
+
+import pickle
+import os
+import sys
+import time
+
+import numpy as np
+import ray
+import torch
+
+# make the package importable when running from a source checkout, for Ray workers too
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ["PYTHONPATH"] = os.pathsep.join(
+    filter(None, [ROOT, os.environ.get("PYTHONPATH")])
+)
+
+from malib.backend.parameter_server import ParameterServer, WeightPublisher
+from malib.utils.codecs import WIRE_FORMATS, encode_weights, decode_weights
+from malib.common.strategy_spec import StrategySpec
+from malib import rl
+
+
+def gen_weights(hidden: int, layers: int) -> dict:
+    return {
+        "critic": {
+            f"layer{i}.weight": torch.randn(hidden, hidden) * hidden**-0.5
+            for i in range(layers)
+        }
+    }
+
+
+def drift(weights: dict, scale: float) -> dict:
+    return {
+        "critic": {
+            k: v + scale * torch.randn_like(v) for k, v in weights["critic"].items()
+        }
+    }
+
+
+def bench(server, spec_id: str, wire_format: str, args):
+    """Return bytes per update, and the average seconds of push, pull and decode."""
+
+    publisher = WeightPublisher(server, wire_format=wire_format)
+    weights = gen_weights(args.hidden, args.layers)
+    publisher.push(spec_id, "policy-0", weights)
+    publisher.flush()
+    info = ray.get(server.get_weights_if_newer.remote(spec_id, "policy-0", 0))
+    version, cached = info["version"], info["weights"]
+
+    n_bytes, push_cost, pull_cost = 0, 0.0, 0.0
+    for _ in range(args.n_round):
+        last, weights = weights, drift(weights, args.drift)
+        n_bytes += len(pickle.dumps(encode_weights(weights, wire_format, last)))
+        start = time.perf_counter()
+        publisher.push(spec_id, "policy-0", weights)
+        publisher.flush()
+        pushed = time.perf_counter()
+        info = ray.get(
+            server.get_weights_if_newer.remote(
+                spec_id, "policy-0", version, wire_format=wire_format
+            )
+        )
+        base = cached if info["base_version"] > 0 else None
+        cached = decode_weights(info["weights"], base)
+        version = info["version"]
+        pull_cost += time.perf_counter() - pushed
+        push_cost += pushed - start
+    return (
+        n_bytes / args.n_round,
+        push_cost / args.n_round,
+        pull_cost / args.n_round,
+    )
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser("Weights transfer benchmark.")
+    parser.add_argument("--hidden", type=int, default=1024)
+    parser.add_argument("--layers", type=int, default=4)
+    parser.add_argument(
+        "--drift", type=float, default=1e-4, help="scale of weights changes per update"
+    )
+    parser.add_argument("--n-round", type=int, default=20)
+
+    args = parser.parse_args()
+
+    ray.init()
+    # keep recent versions as bases of delta pulls
+    server = ParameterServer.as_remote(num_cpus=0).remote(history_size=4)
+    strategy_spec = StrategySpec(
+        identifier="weight_transfer",
+        policy_ids=["policy-0"],
+        meta_data={
+            "policy_cls": rl.dqn.DQNPolicy,
+            "kwargs": {},
+            "experiment_tag": "weight_transfer",
+        },
+    )
+    ray.get(server.create_table.remote(strategy_spec))
+
+    full_bytes = sum(
+        v.numel() * 4 for v in gen_weights(args.hidden, args.layers)["critic"].values()
+    )
+    print(f"weights size: {full_bytes / 1024 ** 2:.1f} MB")
+    for wire_format in WIRE_FORMATS:
+        n_bytes, push_cost, pull_cost = bench(
+            server, strategy_spec.id, wire_format, args
+        )
+        print(
+            f"{wire_format:>8}: {n_bytes / 1024 ** 2:.2f} MB/update "
+            f"({n_bytes / full_bytes:.0%}), push {push_cost * 1e3:.1f} ms, "
+            f"pull {pull_cost * 1e3:.1f} ms, sync {(push_cost + pull_cost) * 1e3:.1f} ms"
+        )
+
+    ray.shutdown()
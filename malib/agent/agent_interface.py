@@ -36,18 +36,24 @@ import traceback
 import torch
 import ray
 
-from ray.util.queue import Queue
+from ray.util.queue import Queue, Empty
 from torch.utils import tensorboard
 
 from malib import settings
-from malib.backend.offline_dataset_server import OfflineDataset
-from malib.backend.parameter_server import ParameterServer
+from malib.backend.offline_dataset_server import OfflineDataset, resolve_batch_info
+from malib.utils.replay_buffer import iter_batch_info
+from malib.backend.parameter_server import (
+    ParameterServer,
+    WeightPublisher,
+    RemoteOptimizer,
+)
 from malib.utils.typing import AgentID
 from malib.utils.logging import Logger
 from malib.utils.tianshou_batch import Batch
 from malib.utils.monitor import write_to_tensorboard
 from malib.remote.interface import RemoteInterface
 from malib.rl.common.trainer import Trainer
+from malib.rl.common.policy import Policy
 from malib.common.strategy_spec import StrategySpec
 
 
@@ -115,6 +121,9 @@ class AgentInterface(RemoteInterface, ABC):
                 },
             },
         )
+        if trainer_config.get("data_parallel") is not None:
+            # replicas sharing the runtime id send gradients to the table, which updates weights
+            strategy_spec.meta_data["optim_config"] = trainer_config["data_parallel"]
 
         self._runtime_id = runtime_id
         self._device = device
@@ -134,6 +143,7 @@ class AgentInterface(RemoteInterface, ABC):
 
         self._offline_dataset: OfflineDataset = None
         self._parameter_server: ParameterServer = None
+        self._weight_publisher: WeightPublisher = None
         self._active_tups = deque()
         self.verbose = verbose
 
@@ -246,35 +256,35 @@ class AgentInterface(RemoteInterface, ABC):
     def push(self):
         """Push local weights to remote server"""
 
-        pending_tasks = []
-        for spec_pid in self._strategy_spec.policy_ids:
-            pid = f"{self._strategy_spec.id}/{spec_pid}"
-            task = self._parameter_server.set_weights.remote(
-                spec_id=self._strategy_spec.id,
-                spec_policy_id=spec_pid,
-                state_dict=self._policies[pid].state_dict(),
+        spec_id = self._strategy_spec.id
+        ray.get(
+            self._parameter_server.set_weights_many.remote(
+                [
+                    (
+                        spec_id,
+                        spec_pid,
+                        self._get_weights(self._policies[f"{spec_id}/{spec_pid}"]),
+                    )
+                    for spec_pid in self._strategy_spec.policy_ids
+                ]
             )
-            pending_tasks.append(task)
-        while len(pending_tasks) > 0:
-            dones, pending_tasks = ray.wait(pending_tasks)
+        )
 
     def pull(self):
         """Pull remote weights to update local version."""
 
-        pending_tasks = []
-
-        for spec_pid in self._strategy_spec.policy_ids:
-            pid = f"{self._strategy_spec.id}/{spec_pid}"
-            task = self._parameter_server.get_weights.remote(
-                spec_id=self._strategy_spec.id, spec_policy_id=spec_pid
+        infos = ray.get(
+            self._parameter_server.get_weights_many.remote(
+                [
+                    (self._strategy_spec.id, spec_pid)
+                    for spec_pid in self._strategy_spec.policy_ids
+                ]
             )
-            pending_tasks.append(task)
-
-        while len(pending_tasks) > 0:
-            dones, pending_tasks = ray.wait(pending_tasks)
-            for done in ray.get(dones):
-                pid = "{}/{}".format(done["spec_id"], done["spec_policy_id"])
-                self._policies[pid].load_state_dict(done["weights"])
+        )
+        weights = ray.get([info["weights"] for info in infos])
+        for info, state_dict in zip(infos, weights):
+            pid = "{}/{}".format(info["spec_id"], info["spec_policy_id"])
+            self._policies[pid].load_state_dict(state_dict)
 
     @abstractmethod
     def multiagent_post_process(
@@ -306,18 +316,122 @@ class AgentInterface(RemoteInterface, ABC):
             "active_tups": list(self._active_tups),
         }
 
-    def sync_remote_parameters(self):
-        """Push latest network parameters of active policies to remote parameter server."""
+    def sync_remote_parameters(self, wait: bool = False):
+        """Push latest network parameters of active policies to remote parameter server. Weights are sent \
+            in the background by a `WeightPublisher`, every `push_interval_steps` calls or \
+            `push_interval_seconds` seconds, as configured in the trainer config. Weights are packed into \
+            contiguous buffers if `flat_weights` is enabled in the trainer config. Skipped in data-parallel \
+            training, where the parameter server updates weights with gradients.
+
+        Args:
+            wait (bool, optional): Push regardless of the interval, and wait until the weights are sent. \
+                Defaults to False.
+        """
 
+        if self._trainer_config.get("data_parallel") is not None:
+            return
+        if self._weight_publisher is None:
+            self._weight_publisher = WeightPublisher(
+                self._parameter_server,
+                interval_steps=self._trainer_config.get("push_interval_steps", 1),
+                interval_seconds=self._trainer_config.get("push_interval_seconds", 0.0),
+            )
         top_active_tup = self._active_tups[0]
-        ray.get(
-            self._parameter_server.set_weights.remote(
-                spec_id=top_active_tup[0],
-                spec_policy_id=top_active_tup[1],
-                state_dict=self._trainer.policy.state_dict(device="cpu"),
+        # the publisher copies weights at pushes
+        state_dict = self._get_weights(self._trainer.policy, copy=False)
+        if wait:
+            self._weight_publisher.push(
+                top_active_tup[0], top_active_tup[1], state_dict
             )
+            self._weight_publisher.flush()
+        else:
+            self._weight_publisher.step(
+                top_active_tup[0], top_active_tup[1], state_dict
+            )
+
+    def _get_weights(self, policy: Policy, copy: bool = True) -> Dict[str, Any]:
+        if self._trainer_config.get("flat_weights", False):
+            return policy.flat_state_dict(copy=copy)
+        return policy.state_dict()
+
+    def _learner_version(self) -> int:
+        """Return the weights version of the active policy as of the latest push, or of the latest update in \
+            data-parallel training, 0 if no weights have been pushed.
+
+        Returns:
+            int: The learner version.
+        """
+
+        optimizer = getattr(self._trainer, "optimizer", None)
+        if isinstance(optimizer, RemoteOptimizer):
+            return optimizer.version
+        if self._weight_publisher is None or not self._active_tups:
+            return 0
+        spec_id, spec_policy_id = self._active_tups[0]
+        return self._weight_publisher.versions.get((spec_id, spec_policy_id), 0)
+
+    def _setup_data_parallel(self):
+        """Replace the trainer's optimizer with a `RemoteOptimizer` if `data_parallel` is configured in the \
+            trainer config, as the optimizer is created again when the trainer resets.
+
+        Raises:
+            NotImplementedError: The trainer has more than one optimizer.
+        """
+
+        if self._trainer_config.get("data_parallel") is None:
+            return
+        spec_id, spec_policy_id = self._active_tups[0]
+        optimizer = self._trainer.optimizer
+        if isinstance(optimizer, Dict):
+            raise NotImplementedError(
+                "data-parallel training supports trainers with a single optimizer"
+            )
+        if (
+            isinstance(optimizer, RemoteOptimizer)
+            and optimizer.policy is self._trainer.policy
+            and optimizer.spec_policy_id == spec_policy_id
+        ):
+            return
+        if isinstance(optimizer, RemoteOptimizer):
+            optimizer = optimizer.optimizer
+        self._trainer.optimizer = RemoteOptimizer(
+            optimizer,
+            self._parameter_server,
+            spec_id,
+            spec_policy_id,
+            self._trainer.policy,
         )
 
+    def _train_step(self, data_request_identifier: str, batch_info: Any):
+        """Train with a batch, then update priorities and synchronize parameters.
+
+        Args:
+            data_request_identifier (str): Name of the data table.
+            batch_info (Any): Batch info retrieved from the consumer pipe.
+        """
+
+        if isinstance(batch_info, Tuple) and len(batch_info[-1]) == 0:
+            return
+        batch = self.multiagent_post_process(batch_info)
+        self._setup_data_parallel()
+        step_info_list = self._trainer(batch)
+        for step_info in step_info_list:
+            td_error = step_info.pop("td_error", None)
+            if td_error is not None and isinstance(batch_info, Tuple):
+                # update priorities asynchronously
+                self._offline_dataset.update_priorities.remote(
+                    data_request_identifier, batch_info[-1], td_error
+                )
+            self._total_step += 1
+            write_to_tensorboard(
+                self._summary_writer,
+                info=step_info,
+                global_step=self._total_step,
+                prefix=f"Training/{self._runtime_id}",
+            )
+        self.sync_remote_parameters()
+        self._total_epoch += 1
+
     def train(
         self,
         data_request_identifier: str,
@@ -340,6 +454,18 @@ class AgentInterface(RemoteInterface, ABC):
         reader_info_dict: Dict[str, Tuple[str, Queue]] = {}
         assert len(self._active_tups) == 1, "the length of active tups can be only 1."
 
+        # a prefetch depth of 0 switches the consumer pipe to request mode, then
+        # the learner asks for `request_size` batches each time.
+        prefetch_depth = self._trainer_config.get("prefetch_depth", 2)
+        request_size = self._trainer_config.get("request_size", 1)
+        # batches are transferred through the object store, and the learner reads them without copying
+        zero_copy = self._trainer_config.get("zero_copy", True)
+        # each queue item is a block of `num_batches` batches, which are iterated locally
+        num_batches = self._trainer_config.get("num_batches", 1)
+        pending_requests = 0
+        # FIFO tables drop rows which lag behind the learner version too much
+        learner_version = self._learner_version()
+
         self.set_running(True)
 
         try:
@@ -349,37 +475,53 @@ class AgentInterface(RemoteInterface, ABC):
                         self._offline_dataset.start_consumer_pipe.remote(
                             name=data_request_identifier,
                             batch_size=self._trainer_config["batch_size"],
+                            prefetch_depth=prefetch_depth,
+                            zero_copy=zero_copy,
+                            num_batches=num_batches,
+                            learner_version=learner_version,
                         )
                     )
                 reader_info: Tuple[str, Queue] = reader_info_dict[
                     data_request_identifier
                 ]
 
+                if prefetch_depth == 0 and pending_requests == 0:
+                    self._offline_dataset.request_samples.remote(
+                        reader_info[0], request_size
+                    )
+                    pending_requests = request_size
+
                 # XXX(ming): what if queue has been killed by remote server?
-                batch_info = reader_info[-1].get()
-                if len(batch_info[-1]) == 0:
+                try:
+                    batch_info = reader_info[-1].get(timeout=1.0)
+                except Empty:
+                    # no data yet, check the running state then retry
                     continue
-                batch = self.multiagent_post_process(batch_info)
-                step_info_list = self._trainer(batch)
-                for step_info in step_info_list:
-                    self._total_step += 1
-                    write_to_tensorboard(
-                        self._summary_writer,
-                        info=step_info,
-                        global_step=self._total_step,
-                        prefix=f"Training/{self._runtime_id}",
+                batch_info = resolve_batch_info(batch_info)
+                pending_requests = max(0, pending_requests - 1)
+                if num_batches > 1:
+                    batch_infos = iter_batch_info(batch_info)
+                else:
+                    batch_infos = [batch_info]
+                for batch_info in batch_infos:
+                    self._train_step(data_request_identifier, batch_info)
+                version = self._learner_version()
+                if version > learner_version:
+                    learner_version = version
+                    self._offline_dataset.set_learner_version.remote(
+                        data_request_identifier, version
                     )
-                self.sync_remote_parameters()
-                self._total_epoch += 1
+            # the latest weights are sent before the active policy retires
+            self.sync_remote_parameters(wait=True)
             self._active_tups.popleft()
         except Exception as e:
             Logger.warning(
                 f"training pipe is terminated. caused by: {traceback.format_exc()}"
             )
-            # close the data pipeline
-            ray.get(
-                self._offline_dataset.end_consumer_pipe.remote(data_request_identifier)
-            )
+
+        # close the data pipeline, so that the sampling thread can exit
+        for queue_id, _ in reader_info_dict.values():
+            ray.get(self._offline_dataset.end_consumer_pipe.remote(queue_id))
 
         if self.verbose:
             Logger.info(
@@ -22,40 +22,249 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
-from typing import Dict, Any, Tuple, Union, List
-from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Tuple, Union, List, Sequence
+from concurrent.futures import ThreadPoolExecutor, Future
+from contextlib import nullcontext, contextmanager
 from readerwriterlock import rwlock
 
+import os
+import glob
+import queue
+import threading
 import traceback
 import time
 
 import numpy as np
 import ray
 
-from ray.util.queue import Queue
+from ray.actor import ActorHandle
+from ray.util.queue import Queue, Empty, Full, _QueueActor
 
 from malib.remote.interface import RemoteInterface
 from malib.utils.logging import Logger
 from malib.utils.tianshou_batch import Batch
-from malib.utils.replay_buffer import ReplayBuffer, MultiagentReplayBuffer
+from malib.utils.replay_buffer import (
+    ReplayBuffer,
+    PrioritizedReplayBuffer,
+    MultiagentReplayBuffer,
+    FIFOReplayBuffer,
+    split_batch_info,
+    iter_episode_chunks,
+)
+
+
+# registered table types, could be specified with `table_type` when starting a producer pipe
+TABLE_TYPES = {
+    "uniform": ReplayBuffer,
+    "prioritized": PrioritizedReplayBuffer,
+    "multiagent": MultiagentReplayBuffer,
+    "fifo": FIFOReplayBuffer,
+}
+
+
+# policies of bounded writer queues when they are full
+FULL_POLICIES = ("block", "drop_oldest", "downsample")
+
+
+class _FlowControlQueueActor(_QueueActor):
+    def __init__(self, maxsize: int, policy: str):
+        super().__init__(maxsize)
+        assert policy in FULL_POLICIES, policy
+        self.policy = policy
+        self.n_put = 0
+        self.n_dropped = 0
+
+    async def put_nowait_batch(self, items):
+        if self.maxsize <= 0:
+            pass
+        elif self.policy == "block":
+            for item in items:
+                await self.queue.put(item)
+                self.n_put += 1
+            return
+        elif self.policy == "drop_oldest":
+            n_drop = max(len(items) + self.queue.qsize() - self.maxsize, 0)
+            for _ in range(min(n_drop, self.queue.qsize())):
+                self.queue.get_nowait()
+            items = items[-self.maxsize :]
+            self.n_dropped += n_drop
+        elif self.policy == "downsample":
+            n_free = self.maxsize - self.queue.qsize()
+            if len(items) > n_free:
+                keep = np.sort(np.random.choice(len(items), n_free, replace=False))
+                self.n_dropped += len(items) - n_free
+                items = [items[i] for i in keep]
+        for item in items:
+            self.queue.put_nowait(item)
+        self.n_put += len(items)
+
+    async def put_nowait(self, item):
+        await self.put_nowait_batch([item])
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "depth": self.queue.qsize(),
+            "maxsize": self.maxsize,
+            "put": self.n_put,
+            "dropped": self.n_dropped,
+        }
+
+
+class FlowControlQueue(Queue):
+    def __init__(
+        self, maxsize: int = 0, policy: str = "block", actor_options: Dict = None
+    ) -> None:
+        """Construct a queue which applies a policy in the queue actor when it is full:
+
+        - `block`: producers wait until there is free space.
+        - `drop_oldest`: the oldest items are dropped to make space.
+        - `downsample`: a random subset of incoming items which fits the free space is kept.
+
+        Args:
+            maxsize (int, optional): The maximum of items, 0 for unbounded. Defaults to 0.
+            policy (str, optional): A policy in `FULL_POLICIES`. Defaults to "block".
+            actor_options (Dict, optional): Options of the queue actor. Defaults to None.
+        """
+
+        self.maxsize = maxsize
+        self.actor = (
+            ray.remote(_FlowControlQueueActor)
+            .options(**(actor_options or {}))
+            .remote(maxsize, policy)
+        )
+
+    def stats(self) -> Dict[str, int]:
+        """Return queue depth, capacity, and counts of put and dropped items."""
+
+        return ray.get(self.actor.stats.remote())
+
+
+class TableStats:
+    def __init__(self) -> None:
+        """Construct flow statistics of a data table. Counters are cumulative, and rates are computed over \
+            the window since the previous `summary` call."""
+
+        self.lock = threading.Lock()
+        self.inserted = 0
+        self.sampled = 0
+        self.lock_wait = 0.0
+        self._last = (time.time(), 0, 0, 0.0)
+
+    def record_insert(self, n: int, lock_wait: float):
+        with self.lock:
+            self.inserted += n
+            self.lock_wait += lock_wait
+
+    def record_sample(self, n: int):
+        with self.lock:
+            self.sampled += n
+
+    def summary(self) -> Dict[str, float]:
+        """Return cumulative inserted and sampled rows, insert and sample rates in rows per second, writer \
+            lock wait in seconds per second, and the samples-per-insert ratio since creation."""
+
+        with self.lock:
+            now = time.time()
+            last_time, inserted, sampled, lock_wait = self._last
+            elapsed = max(now - last_time, 1e-6)
+            self._last = (now, self.inserted, self.sampled, self.lock_wait)
+            return {
+                "inserted": self.inserted,
+                "sampled": self.sampled,
+                "insert_rate": (self.inserted - inserted) / elapsed,
+                "sample_rate": (self.sampled - sampled) / elapsed,
+                "writer_lock_wait": (self.lock_wait - lock_wait) / elapsed,
+                "samples_per_insert": self.sampled / max(self.inserted, 1),
+            }
+
+
+class RateLimiter:
+    def __init__(
+        self, stats: TableStats, samples_per_insert: float, error_buffer: float = 1e4
+    ) -> None:
+        """Construct a replay-ratio controller, which keeps the sampled rows close to `samples_per_insert` \
+            times of the inserted rows. Insertions wait if `inserted * samples_per_insert - sampled` exceeds \
+            `error_buffer`, which throttles producers through the (bounded) writer queue, and sampling waits \
+            if it is below `-error_buffer`.
+
+        Args:
+            stats (TableStats): Statistics of the data table.
+            samples_per_insert (float): Target ratio of sampled rows to inserted rows.
+            error_buffer (float, optional): Tolerance in sampled rows. Defaults to 1e4.
+        """
+
+        self.stats = stats
+        self.samples_per_insert = samples_per_insert
+        self.error_buffer = error_buffer
+
+    def _diff(self) -> float:
+        return self.stats.inserted * self.samples_per_insert - self.stats.sampled
+
+    def can_insert(self) -> bool:
+        return self._diff() <= self.error_buffer
+
+    def can_sample(self) -> bool:
+        return self._diff() >= -self.error_buffer
+
+
+def table_lock(
+    marker: rwlock.RWLockFair,
+    buffer: Union[MultiagentReplayBuffer, ReplayBuffer],
+    write: bool = False,
+):
+    """Return the lock to access a data table. Lock-free tables, which have a single writer, do not \
+        take the reader-writer lock.
+
+    Args:
+        marker (rwlock.RWLockFair): Reader-writer lock of the table.
+        buffer (Union[MultiagentReplayBuffer, ReplayBuffer]): Data table.
+        write (bool, optional): Return a write lock or a read lock. Defaults to False.
+
+    Returns:
+        A context manager.
+    """
+
+    if getattr(buffer, "lock_free", False):
+        return nullcontext()
+    return marker.gen_wlock() if write else marker.gen_rlock()
 
 
 def write_table(
     marker: rwlock.RWLockFair,
     buffer: Union[MultiagentReplayBuffer, ReplayBuffer],
     writer: Queue,
+    stop_event: threading.Event = None,
+    stats: TableStats = None,
+    rate_limiter: RateLimiter = None,
 ):
-    wlock = marker.gen_wlock()
-    while True:
+    wlock = table_lock(marker, buffer, write=True)
+    stop_event = stop_event or threading.Event()
+    stats = stats or TableStats()
+    while not stop_event.is_set():
         try:
-            batches: Union[Batch, List[Batch]] = writer.get()
-            with wlock:
-                if not isinstance(batches, List):
-                    batches = [batches]
-                for e in batches:
-                    buffer.add_batch(e)
+            try:
+                batches: Union[Batch, List[Batch]] = writer.get(timeout=1.0)
+            except Empty:
+                continue
+            if not isinstance(batches, List):
+                batches = [batches]
+            for e in batches:
+                # stop draining the writer queue, so that producers are throttled. Items in hand have left the \
+                # queue, so they are inserted anyway once the writer is stopped, e.g., paused by `_paused_writer`
+                while (
+                    rate_limiter is not None
+                    and not rate_limiter.can_insert()
+                    and not stop_event.wait(0.01)
+                ):
+                    pass
+                start = time.perf_counter()
+                with wlock:
+                    lock_wait = time.perf_counter() - start
+                    indices = buffer.add_batch(e)
+                stats.record_insert(len(indices), lock_wait)
         except Exception as e:
-            print(traceback.format_exc())
+            if not stop_event.is_set():
+                print(traceback.format_exc())
             break
 
 
@@ -64,45 +273,578 @@ def read_table(
     buffer: Union[MultiagentReplayBuffer, ReplayBuffer],
     batch_size: int,
     reader: Queue,
+    demand: threading.Semaphore = None,
+    stop_event: threading.Event = None,
+    idle_interval: float = 0.1,
+    zero_copy: bool = False,
+    stats: TableStats = None,
+    rate_limiter: RateLimiter = None,
+    num_batches: int = 1,
 ):
-    rlock = marker.gen_rlock()
-    while True:
+    """Sample batches from a data table and send them to the reader queue. The loop is demand-driven: \
+        a batch is sampled only when there is a free prefetch slot in the (bounded) reader queue, \
+        or a pending request if `demand` is given. It exits once the reader queue has been shut down.
+
+    Args:
+        marker (rwlock.RWLockFair): Reader-writer lock of the table.
+        buffer (Union[MultiagentReplayBuffer, ReplayBuffer]): Data table.
+        batch_size (int): Batch size.
+        reader (Queue): Reader queue. A bounded queue limits the number of prefetched batches.
+        demand (threading.Semaphore, optional): A semaphore counts the requested batches. If given, sampling is \
+            triggered by consumer requests only. Defaults to None.
+        stop_event (threading.Event, optional): An event to stop the loop. Defaults to None.
+        idle_interval (float, optional): Sleep interval when there is no demand or no enough data. Defaults to 0.1.
+        zero_copy (bool, optional): Put sampled batches into the object store and send only the references, \
+            see `resolve_batch_info`. Defaults to False.
+        stats (TableStats, optional): Statistics of the data table. Defaults to None.
+        rate_limiter (RateLimiter, optional): A replay-ratio controller, sampling waits until it is allowed. \
+            Defaults to None.
+        num_batches (int, optional): If greater than 1, each message is a block of `num_batches` batches \
+            sampled by `sample_many`. Defaults to 1.
+    """
+
+    rlock = table_lock(marker, buffer)
+    stop_event = stop_event or threading.Event()
+    stats = stats or TableStats()
+    last_probe = time.time()
+
+    def _idle():
+        # probe the reader queue periodically, which raises an error if the queue has been shut down
+        nonlocal last_probe
+        if stop_event.is_set():
+            raise StopIteration
+        if time.time() - last_probe > 1.0:
+            reader.qsize()
+            last_probe = time.time()
+
+    while not stop_event.is_set():
         try:
+            if demand is not None and not demand.acquire(timeout=idle_interval):
+                _idle()
+                continue
+            while len(buffer) < batch_size or (
+                rate_limiter is not None and not rate_limiter.can_sample()
+            ):
+                time.sleep(idle_interval)
+                _idle()
             with rlock:
-                if len(buffer) >= batch_size:
-                    ret = buffer.sample(batch_size)
-                    # batch, indices = buffer.sample(batch_size)
+                if num_batches > 1:
+                    ret = buffer.sample_many(num_batches, batch_size)
                 else:
-                    # batch, indices = [], np.array([], int)
-                    if isinstance(buffer, MultiagentReplayBuffer):
-                        ret = {}
-                    else:
-                        ret = ([], np.array([], int))
-                reader.put_nowait(ret)
+                    ret = buffer.sample(batch_size)
+            stats.record_sample(num_batches * batch_size)
+            if zero_copy:
+                # wrapped with a list, or the reference will be resolved by the queue actor
+                ret = [ray.put(ret)]
+            # wait for a free slot
+            while True:
+                try:
+                    reader.put(ret, timeout=1.0)
+                    break
+                except Full:
+                    _idle()
+        except StopIteration:
+            break
         except Exception as e:
-            print(traceback.format_exc())
+            if not stop_event.is_set():
+                print(traceback.format_exc())
             break
 
 
+def resolve_batch_info(item: Any) -> Any:
+    """Resolve an item retrieved from a reader queue. For zero-copy pipelines, the item is a reference to \
+        the batch info in the object store, and numpy arrays are returned as read-only views when the \
+        object store is on the same node.
+
+    Args:
+        item (Any): An item retrieved from the reader queue.
+
+    Returns:
+        Any: Batch info, a tuple of batch and indices, or a dict of them for multi-agent tables.
+    """
+
+    if isinstance(item, List) and len(item) == 1 and isinstance(item[0], ray.ObjectRef):
+        return ray.get(item[0])
+    return item
+
+
+def episode_files(paths: Union[str, Sequence[str]]) -> List[str]:
+    """Expand paths of episode files, see `iter_episode_chunks`. A path could be a glob pattern, a `.npz` \
+        file, a table snapshot, or a directory of them.
+
+    Args:
+        paths (Union[str, Sequence[str]]): A path or a list of paths.
+
+    Returns:
+        List[str]: A list of `.npz` files and snapshot directories.
+    """
+
+    def _is_snapshot(path: str) -> bool:
+        return os.path.isfile(os.path.join(path, "header.json"))
+
+    files = []
+    for pattern in [paths] if isinstance(paths, str) else paths:
+        for path in sorted(glob.glob(pattern)):
+            if _is_snapshot(path) or not os.path.isdir(path):
+                files.append(path)
+            else:
+                files.extend(
+                    os.path.join(path, f)
+                    for f in sorted(os.listdir(path))
+                    if f.endswith(".npz") or _is_snapshot(os.path.join(path, f))
+                )
+    return files
+
+
+class ShardedQueue:
+    def __init__(self, queues: List[Queue]) -> None:
+        """Construct a writer queue that routes items to the writer queues of dataset shards. Each item, \
+            i.e., an episode, is routed by the hash of a producer-local sequence number, so that shards \
+            receive similar amounts of data.
+
+        Args:
+            queues (List[Queue]): A list of writer queues, one for each shard.
+        """
+
+        self.queues = queues
+        self._seed = np.random.randint(2**31)
+        self._counter = 0
+
+    def _route(self) -> Queue:
+        self._counter += 1
+        return self.queues[hash((self._seed, self._counter)) % len(self.queues)]
+
+    def put(self, item: Any, block: bool = True, timeout: float = None):
+        self._route().put(item, block, timeout)
+
+    def put_nowait(self, item: Any):
+        self._route().put_nowait(item)
+
+    def put_nowait_batch(self, items: List[Any]):
+        routed = [[] for _ in self.queues]
+        for item in items:
+            self._counter += 1
+            routed[hash((self._seed, self._counter)) % len(self.queues)].append(item)
+        for queue, _items in zip(self.queues, routed):
+            if len(_items) > 0:
+                queue.put_nowait_batch(_items)
+
+    def put_nowait_batch_async(self, items: List[Any]) -> List[ray.ObjectRef]:
+        routed = [[] for _ in self.queues]
+        for item in items:
+            self._counter += 1
+            routed[hash((self._seed, self._counter)) % len(self.queues)].append(item)
+        return [
+            queue.actor.put_nowait_batch.remote(_items)
+            for queue, _items in zip(self.queues, routed)
+            if len(_items) > 0
+        ]
+
+    def qsize(self) -> int:
+        return sum(queue.qsize() for queue in self.queues)
+
+
+def put_nowait_batch_async(
+    writer: Union[Queue, ShardedQueue], items: List[Any]
+) -> List[ray.ObjectRef]:
+    """Put items into a writer queue without waiting for the queue actor.
+
+    Args:
+        writer (Union[Queue, ShardedQueue]): A writer queue.
+        items (List[Any]): A list of items.
+
+    Returns:
+        List[ray.ObjectRef]: Object references of the remote calls.
+    """
+
+    if isinstance(writer, ShardedQueue):
+        return writer.put_nowait_batch_async(items)
+    return [writer.actor.put_nowait_batch.remote(items)]
+
+
+def coalesce_episodes(episodes: List[Any]) -> List[Dict[str, Any]]:
+    """Concatenate episodes into columnar blocks, so that a block is inserted with a single copy per column. \
+        An episode could be a dict of columns, a list of agent dicts of columns, or a dict of agent dicts \
+        for joint tables. Episodes with the same columns are concatenated into one block.
+
+    Note:
+        Table rows carry episode ends with `done` after concatenation, which is true for the last step of \
+            episodes produced by `Episode.to_numpy`.
+
+    Args:
+        episodes (List[Any]): A list of episodes.
+
+    Returns:
+        List[Dict[str, Any]]: A list of blocks.
+    """
+
+    groups: Dict[Any, List[Dict[str, Any]]] = {}
+    for episode in episodes:
+        if isinstance(episode, Dict) and all(
+            isinstance(v, Dict) for v in episode.values()
+        ):
+            signature = (True,) + tuple(
+                (agent, tuple(sorted(v))) for agent, v in sorted(episode.items())
+            )
+            groups.setdefault(signature, []).append(episode)
+        else:
+            for batch in episode if isinstance(episode, List) else [episode]:
+                groups.setdefault((False,) + tuple(sorted(batch)), []).append(batch)
+
+    blocks = []
+    for signature, items in groups.items():
+        if signature[0]:
+            blocks.append(
+                {
+                    agent: {
+                        k: np.concatenate([e[agent][k] for e in items]) for k in keys
+                    }
+                    for agent, keys in signature[1:]
+                }
+            )
+        else:
+            blocks.append(
+                {k: np.concatenate([e[k] for e in items]) for k in signature[1:]}
+            )
+    return blocks
+
+
+class EpisodeAccumulator:
+    def __init__(
+        self,
+        writer: Union[Queue, ShardedQueue],
+        max_rows: int = 0,
+        max_delay: float = 0.0,
+    ) -> None:
+        """Construct a producer-side accumulator, which coalesces episodes into columnar blocks, see \
+            `coalesce_episodes`, and sends them without waiting for the queue actor. Blocks are flushed once \
+            the pending rows reach `max_rows` or the oldest pending episode has waited `max_delay` seconds. \
+            At most one flush is in flight, which gives backpressure to producers.
+
+        Args:
+            writer (Union[Queue, ShardedQueue]): A writer queue.
+            max_rows (int, optional): Flush threshold of pending rows. Defaults to 0, i.e., flush on each add.
+            max_delay (float, optional): Flush threshold of waiting seconds. Defaults to 0.0.
+        """
+
+        self.writer = writer
+        self.max_rows = max_rows
+        self.max_delay = max_delay
+        self.pending: List[Any] = []
+        self.pending_rows = 0
+        self.pending_since: float = None
+        self.inflight: List[ray.ObjectRef] = []
+
+    def add(self, episodes: List[Any]):
+        """Add a list of episodes, and flush if any threshold is reached.
+
+        Args:
+            episodes (List[Any]): A list of episodes.
+        """
+
+        for episode in episodes:
+            self.pending.append(episode)
+            self.pending_rows += _count_rows(episode)
+        if self.pending_since is None:
+            self.pending_since = time.time()
+        if (
+            self.pending_rows >= self.max_rows
+            or time.time() - self.pending_since >= self.max_delay
+        ):
+            self.flush()
+
+    def flush(self, wait: bool = False):
+        """Send pending episodes as blocks.
+
+        Args:
+            wait (bool, optional): Wait until blocks are in the writer queue. Defaults to False.
+        """
+
+        if len(self.pending) > 0:
+            blocks = coalesce_episodes(self.pending)
+            ray.get(self.inflight)
+            self.inflight = put_nowait_batch_async(self.writer, blocks)
+            self.pending, self.pending_rows, self.pending_since = [], 0, None
+        if wait:
+            ray.get(self.inflight)
+            self.inflight = []
+
+
+def _count_rows(episode: Any) -> int:
+    if isinstance(episode, List):
+        return sum(_count_rows(e) for e in episode)
+    any_v = next(iter(episode.values()))
+    return _count_rows(any_v) if isinstance(any_v, Dict) else len(any_v)
+
+
+class ShardedTable:
+    # shards lock their own tables
+    lock_free = True
+    # maximum age (in seconds) of cached shard infos, so that read loops do not call shards on every iteration
+    refresh_interval = 0.1
+
+    def __init__(self, name: str, shards: List[ActorHandle], shard_capacity: int):
+        """Construct a proxy of a data table which is partitioned over dataset shards. Batches are sampled \
+            from shards in proportion to shard sizes, or priority mass of prioritized tables, and indices are \
+            mapped to a global index space as `shard_index * shard_capacity + local_index`.
+
+        Args:
+            name (str): Table name.
+            shards (List[ActorHandle]): A list of dataset shard actors.
+            shard_capacity (int): Table capacity of each shard.
+        """
+
+        self.name = name
+        self.shards = shards
+        self.shard_capacity = shard_capacity
+        self.sizes = np.zeros(len(shards), dtype=np.int64)
+        # inserted and sampled rows of shards, for rate limitation
+        self.inserted = np.zeros(len(shards), dtype=np.int64)
+        self.sampled = np.zeros(len(shards), dtype=np.int64)
+        # priority mass, minimum priorities and beta of prioritized shards, None for other tables
+        self.priorities = None
+        self.min_priorities = None
+        self.beta = None
+        self.last_refresh = 0.0
+
+    def refresh(self, max_age: float = 0.0):
+        """Fetch table sizes, counters and priorities of shards, see `OfflineDataset.get_table_info`.
+
+        Args:
+            max_age (float, optional): Skip fetching if the cached infos are younger than it. Defaults to 0.0.
+        """
+
+        if time.time() - self.last_refresh < max_age:
+            return
+        infos = ray.get(
+            [shard.get_table_info.remote(self.name) for shard in self.shards]
+        )
+        self.sizes = np.asarray([info["size"] for info in infos], dtype=np.int64)
+        self.inserted = np.asarray([info["inserted"] for info in infos], dtype=np.int64)
+        self.sampled = np.asarray([info["sampled"] for info in infos], dtype=np.int64)
+        if "total_priority" in infos[0]:
+            self.priorities = np.asarray([info["total_priority"] for info in infos])
+            self.min_priorities = np.asarray([info["min_priority"] for info in infos])
+            self.beta = infos[0]["beta"]
+        self.last_refresh = time.time()
+
+    def __len__(self):
+        self.refresh(self.refresh_interval)
+        return int(self.sizes.sum())
+
+    def sample(self, batch_size: int) -> Any:
+        if batch_size <= 0:
+            raise ValueError(f"batch size should be positive, got {batch_size}")
+        self.refresh(self.refresh_interval)
+        if self.sizes.sum() == 0:
+            # cached sizes may be stale
+            self.refresh()
+        if self.sizes.sum() == 0:
+            raise ValueError(f"cannot sample from an empty table: {self.name}")
+        if self.priorities is not None and self.priorities.sum() > 0:
+            # a shard is picked by its priority mass, then a row by its priority within the shard, which \
+            # equals to prioritized sampling over the union of shards
+            probs = self.priorities / self.priorities.sum()
+        else:
+            probs = self.sizes / self.sizes.sum()
+        counts = np.random.multinomial(batch_size, probs)
+        # count samples before the next refresh, so that rate limitation sees them
+        self.sampled += counts
+        shard_indices = [i for i, c in enumerate(counts) if c > 0]
+        rets = ray.get(
+            [
+                self.shards[i].sample.remote(self.name, int(counts[i]))
+                for i in shard_indices
+            ]
+        )
+        assert len(rets) > 0, counts
+        if isinstance(rets[0], Dict):
+            return {
+                agent: _merge_shard_samples(
+                    [ret[agent] for ret in rets], shard_indices, self.shard_capacity
+                )
+                for agent in rets[0]
+            }
+        else:
+            if self.priorities is not None:
+                rets = self._rescale_weights(rets, shard_indices)
+            return _merge_shard_samples(rets, shard_indices, self.shard_capacity)
+
+    def _rescale_weights(
+        self, rets: List[Tuple[Batch, np.ndarray]], shard_indices: List[int]
+    ) -> List[Tuple[Batch, np.ndarray]]:
+        # shards normalize importance sampling weights by their own minimum priority, renormalize them by \
+        # the global one
+        global_min = self.min_priorities[self.sizes > 0].min()
+        for (batch, _), i in zip(rets, shard_indices):
+            factor = (self.min_priorities[i] / global_min) ** (-self.beta)
+            # arrays fetched from the object store are read-only
+            batch["weight"] = (batch.weight * factor).astype(np.float32)
+        return rets
+
+    def sample_many(self, k: int, batch_size: int) -> Any:
+        batch_info = self.sample(k * batch_size)
+        # merged samples are ordered by shards, shuffle them before splitting
+        perm = np.random.permutation(k * batch_size)
+        if isinstance(batch_info, Dict):
+            batch_info = {
+                agent: (batch[perm], indices[perm])
+                for agent, (batch, indices) in batch_info.items()
+            }
+        else:
+            batch, indices = batch_info
+            if len(indices) != k * batch_size:
+                # FIFO shards hand out fewer rows, split them into batches of at most `batch_size`
+                splits = range(0, len(indices), batch_size)
+                return (
+                    [batch[i : i + batch_size] for i in splits],
+                    [indices[i : i + batch_size] for i in splits],
+                )
+            batch_info = (batch[perm], indices[perm])
+        return split_batch_info(batch_info, k)
+
+    def update_priorities(self, indices: Sequence[int], td_errors: Sequence[float]):
+        indices = np.asarray(indices)
+        td_errors = np.asarray(td_errors)
+        # windows stay in the shards of their start steps
+        shard_indices = indices.reshape(len(indices), -1)[:, 0] // self.shard_capacity
+        tasks = []
+        for i in np.unique(shard_indices):
+            selected = shard_indices == i
+            tasks.append(
+                self.shards[i].update_priorities.remote(
+                    self.name,
+                    indices[selected] % self.shard_capacity,
+                    td_errors[selected],
+                )
+            )
+        ray.get(tasks)
+
+    def set_learner_version(self, version: int):
+        ray.get(
+            [
+                shard.set_learner_version.remote(self.name, version)
+                for shard in self.shards
+            ]
+        )
+
+
+class ShardedTableStats:
+    def __init__(self, table: ShardedTable) -> None:
+        """Construct a view of inserted and sampled rows of a sharded table, summed over shards as of the \
+            last refresh, so that a `RateLimiter` throttles consumers of the router.
+
+        Args:
+            table (ShardedTable): A sharded table.
+        """
+
+        self.table = table
+
+    @property
+    def inserted(self) -> int:
+        return int(self.table.inserted.sum())
+
+    @property
+    def sampled(self) -> int:
+        return int(self.table.sampled.sum())
+
+
+def _merge_shard_samples(
+    rets: List[Tuple[Batch, np.ndarray]], shard_indices: List[int], shard_capacity: int
+) -> Tuple[Batch, np.ndarray]:
+    batch = Batch.cat([ret[0] for ret in rets])
+    indices = np.concatenate(
+        [ret[1] + i * shard_capacity for ret, i in zip(rets, shard_indices)]
+    )
+    return batch, indices
+
+
 class OfflineDataset(RemoteInterface):
-    def __init__(self, table_capacity: int, max_consumer_size: int = 1024) -> None:
+    def __init__(
+        self,
+        table_capacity: int,
+        max_consumer_size: int = 1024,
+        num_shards: int = 1,
+        dataset_dir: str = None,
+        writer_queue_size: int = 0,
+        full_policy: str = "block",
+    ) -> None:
         """Construct an offline datataset. It maintans a dict of datatable, each for a training instance.
 
+        Note:
+            If `num_shards` is greater than 1, each data table is partitioned over `num_shards` shard actors. \
+                Producers write to shards directly, and this instance works as a router for consumers.
+
+            If `dataset_dir` is given, e.g., `settings.DATASET_DIR`, each data table is stored in memory-mapped \
+                files under `dataset_dir/<table name>`, and an existing table is reopened when its producer \
+                pipe starts, so a restarted dataset resumes with the stored data.
+
+            If `writer_queue_size` is positive, writer queues are bounded and `full_policy` applies when a \
+                queue is full, see `FlowControlQueue`.
+
         Args:
             table_capacity (int): Table capacity, it indicates the buffer size of each data table.
             max_consumer_size (int, optional): Defines the maximum of concurrency. Defaults to 1024.
+            num_shards (int, optional): The number of dataset shards. Defaults to 1.
+            dataset_dir (str, optional): The directory of disk-backed data tables, None for in-memory \
+                tables. Defaults to None.
+            writer_queue_size (int, optional): The maximum of items in a writer queue, 0 for unbounded. \
+                Defaults to 0.
+            full_policy (str, optional): The policy of full writer queues, could be `block`, `drop_oldest` or \
+                `downsample`. Defaults to "block".
         """
 
+        assert full_policy in FULL_POLICIES, full_policy
         self.tb_capacity = table_capacity
+        self.dataset_dir = dataset_dir
+        self.writer_queue_size = writer_queue_size
+        self.full_policy = full_policy
         self.reader_queues: Dict[str, Queue] = {}
         self.writer_queues: Dict[str, Queue] = {}
         self.buffers: Dict[str, ReplayBuffer] = {}
         self.markers: Dict[str, rwlock.RWLockFair] = {}
+        self.consumer_demands: Dict[str, threading.Semaphore] = {}
+        self.stop_events: Dict[str, threading.Event] = {}
+        self.table_stats: Dict[str, TableStats] = {}
+        self.rate_limiters: Dict[str, RateLimiter] = {}
+        self.consumer_tables: Dict[str, str] = {}
+        self.pipe_futures: Dict[str, Future] = {}
         self.thread_pool = ThreadPoolExecutor(max_workers=max_consumer_size)
 
+        self.shards: List[ActorHandle] = []
+        self.shard_capacity = -(-table_capacity // num_shards)
+        if num_shards > 1:
+            self.shards = [
+                OfflineDataset.as_remote(num_cpus=0)
+                .options(max_concurrency=100)
+                .remote(
+                    table_capacity=self.shard_capacity,
+                    max_consumer_size=max_consumer_size,
+                    dataset_dir=None
+                    if dataset_dir is None
+                    else os.path.join(dataset_dir, f"shard_{i}"),
+                    writer_queue_size=writer_queue_size,
+                    full_policy=full_policy,
+                )
+                for i in range(num_shards)
+            ]
+
     def start(self):
         Logger.info("Dataset server started")
 
+    def _stop_pipe(self, name: str):
+        """Stop the reading/writing thread of a pipeline and wait for its exit, so that the related \
+            queue can be killed safely.
+
+        Args:
+            name (str): The pipeline name.
+        """
+
+        if name in self.stop_events:
+            self.stop_events.pop(name).set()
+        if name in self.pipe_futures:
+            self.pipe_futures.pop(name).result()
+
     def start_producer_pipe(
         self,
         name: str,
@@ -110,6 +852,9 @@ class OfflineDataset(RemoteInterface):
         ignore_obs_next: bool = False,
         save_only_last_obs: bool = False,
         sample_avail: bool = False,
+        table_type: str = "uniform",
+        samples_per_insert: float = None,
+        error_buffer: float = 1e4,
         **kwargs,
     ) -> Tuple[str, Queue]:
         """Start a producer pipeline and create a datatable if not exisits.
@@ -120,34 +865,138 @@ class OfflineDataset(RemoteInterface):
             ignore_obs_next (bool, optional): Ignore the next observation or not. Defaults to False.
             save_only_last_obs (bool, optional): Either save only the last observation frame. Defaults to False.
             sample_avail (bool, optional): Sample action maks or not. Defaults to False.
+            table_type (str, optional): Table type, a key of `TABLE_TYPES`, could be `uniform`, `prioritized`, \
+                `multiagent` or `fifo`. `multiagent` tables store joint transitions of agents, and `fifo` tables \
+                hand out each transition exactly once for on-policy learning. Extra table arguments, e.g., \
+                `alpha` and `beta` for prioritized tables, are passed with kwargs. Defaults to "uniform".
+            samples_per_insert (float, optional): The target ratio of sampled rows to inserted rows, producers \
+                and consumers are throttled to keep it, see `RateLimiter`. None for no rate limitation. \
+                Defaults to None.
+            error_buffer (float, optional): The tolerance of the rate limitation. Defaults to 1e4.
 
         Returns:
             Tuple[str, Queue]: A tuple of table name and queue for insert samples.
         """
 
+        if self.shards:
+            return self._start_sharded_producer_pipe(
+                name,
+                stack_num=stack_num,
+                ignore_obs_next=ignore_obs_next,
+                save_only_last_obs=save_only_last_obs,
+                sample_avail=sample_avail,
+                table_type=table_type,
+                samples_per_insert=samples_per_insert,
+                error_buffer=error_buffer,
+                **kwargs,
+            )
+
         if name not in self.buffers:
-            buffer = ReplayBuffer(
-                size=self.tb_capacity,
+            self._create_table(
+                name,
                 stack_num=stack_num,
                 ignore_obs_next=ignore_obs_next,
                 save_only_last_obs=save_only_last_obs,
                 sample_avail=sample_avail,
+                table_type=table_type,
                 **kwargs,
             )
-            marker = rwlock.RWLockFair()
 
-            self.buffers[name] = buffer
-            self.markers[name] = marker
+        if samples_per_insert is not None:
+            self.rate_limiters[name] = RateLimiter(
+                self.table_stats[name], samples_per_insert, error_buffer
+            )
 
         if name not in self.writer_queues:
-            writer = Queue(actor_options={"num_cpus": 0})
-            self.writer_queues[name] = writer
-            self.thread_pool.submit(
-                write_table, self.markers[name], self.buffers[name], writer
+            self.writer_queues[name] = FlowControlQueue(
+                maxsize=self.writer_queue_size,
+                policy=self.full_policy,
+                actor_options={"num_cpus": 0},
             )
+            self._start_writer(name)
 
         return name, self.writer_queues[name]
 
+    def _create_table(self, name: str, table_type: str = "uniform", **kwargs):
+        """Create a data table, which is stored under `dataset_dir` if it is given.
+
+        Args:
+            name (str): Table name.
+            table_type (str, optional): A key of `TABLE_TYPES`. Defaults to "uniform".
+        """
+
+        if self.dataset_dir is not None:
+            kwargs.setdefault("path", os.path.join(self.dataset_dir, name))
+        self.buffers[name] = TABLE_TYPES[table_type](size=self.tb_capacity, **kwargs)
+        self.markers[name] = rwlock.RWLockFair()
+        self.table_stats[name] = TableStats()
+
+    def _start_writer(self, name: str):
+        """Start the writing thread of a producer pipeline.
+
+        Args:
+            name (str): Table name.
+        """
+
+        stop_event = threading.Event()
+        self.stop_events[name] = stop_event
+        self.pipe_futures[name] = self.thread_pool.submit(
+            write_table,
+            self.markers[name],
+            self.buffers[name],
+            self.writer_queues[name],
+            stop_event,
+            self.table_stats[name],
+            self.rate_limiters.get(name),
+        )
+
+    @contextmanager
+    def _paused_writer(self, name: str):
+        """Pause the writing thread of a table if it is running, items are kept in the writer queue.
+
+        Args:
+            name (str): Table name.
+        """
+
+        running = name in self.pipe_futures
+        if running:
+            self._stop_pipe(name)
+        try:
+            yield
+        finally:
+            if running:
+                self._start_writer(name)
+
+    def _start_sharded_producer_pipe(self, name: str, **kwargs) -> Tuple[str, Queue]:
+        """Start producer pipelines on all shards, and return a sharded writer queue.
+
+        Args:
+            name (str): The name of datatable.
+
+        Returns:
+            Tuple[str, Queue]: A tuple of table name and a `ShardedQueue`.
+        """
+
+        if name not in self.writer_queues:
+            pipes = ray.get(
+                [
+                    shard.start_producer_pipe.remote(name, **kwargs)
+                    for shard in self.shards
+                ]
+            )
+            self.writer_queues[name] = ShardedQueue([queue for _, queue in pipes])
+        if name not in self.buffers:
+            self.buffers[name] = ShardedTable(name, self.shards, self.shard_capacity)
+            self.markers[name] = rwlock.RWLockFair()
+        # shards throttle their producers, and the router throttles consumers
+        if kwargs.get("samples_per_insert") is not None:
+            self.rate_limiters[name] = RateLimiter(
+                ShardedTableStats(self.buffers[name]),
+                kwargs["samples_per_insert"],
+                kwargs.get("error_buffer", 1e4),
+            )
+        return name, self.writer_queues[name]
+
     def end_producer_pipe(self, name: str):
         """Kill a producer pipe with given name.
 
@@ -155,32 +1004,400 @@ class OfflineDataset(RemoteInterface):
             name (str): The name of related data table.
         """
 
+        if self.shards:
+            self.writer_queues.pop(name, None)
+            ray.get([shard.end_producer_pipe.remote(name) for shard in self.shards])
+            return
+
+        self._stop_pipe(name)
         if name in self.writer_queues:
             queue = self.writer_queues.pop(name)
             queue.shutdown()
+        if name in self.buffers:
+            self.buffers[name].flush()
+
+    def save_table(self, name: str, path: str, max_workers: int = None):
+        """Save a snapshot of a data table, see `ReplayBuffer.save`. Insertions are paused while saving. \
+            Shards save their partitions under `path/shard_<i>`.
+
+        Args:
+            name (str): Table name.
+            path (str): The snapshot directory.
+            max_workers (int, optional): The maximum of writing threads. Defaults to None.
+        """
+
+        if self.shards:
+            ray.get(
+                [
+                    shard.save_table.remote(
+                        name, os.path.join(path, f"shard_{i}"), max_workers
+                    )
+                    for i, shard in enumerate(self.shards)
+                ]
+            )
+            return
+
+        buffer = self.buffers[name]
+        with self._paused_writer(name), table_lock(self.markers[name], buffer):
+            buffer.save(path, max_workers)
+
+    def load_table(
+        self,
+        name: str,
+        path: str,
+        mmap: bool = False,
+        max_workers: int = None,
+        **kwargs,
+    ):
+        """Load a snapshot saved by `save_table` into a data table, the table is created with `kwargs` if it \
+            does not exist, e.g., `table_type` and `stack_num`, see `start_producer_pipe`.
+
+        Note:
+            If `mmap` is True, the table is created upon the snapshot files as a disk-backed table, without \
+                copying. Then the snapshot is modified by later insertions.
+
+        Args:
+            name (str): Table name.
+            path (str): The snapshot directory.
+            mmap (bool, optional): Open the snapshot as the table storage instead of copying. Defaults to False.
+            max_workers (int, optional): The maximum of loading threads. Defaults to None.
+        """
+
+        if self.shards:
+            ray.get(
+                [
+                    shard.load_table.remote(
+                        name,
+                        os.path.join(path, f"shard_{i}"),
+                        mmap,
+                        max_workers,
+                        **kwargs,
+                    )
+                    for i, shard in enumerate(self.shards)
+                ]
+            )
+            if name not in self.buffers:
+                self.buffers[name] = ShardedTable(
+                    name, self.shards, self.shard_capacity
+                )
+                self.markers[name] = rwlock.RWLockFair()
+            return
+
+        if mmap:
+            assert name not in self.buffers, f"table {name} exists already"
+            self._create_table(name, path=path, **kwargs)
+            return
+
+        if name not in self.buffers:
+            self._create_table(name, **kwargs)
+        buffer = self.buffers[name]
+        with self._paused_writer(name), table_lock(
+            self.markers[name], buffer, write=True
+        ):
+            buffer.load(path, max_workers)
+
+    def ingest(
+        self,
+        name: str,
+        paths: Union[str, Sequence[str]],
+        chunk_size: int = 65536,
+        num_readers: int = 4,
+        max_pending_chunks: int = 8,
+        **kwargs,
+    ) -> Dict[str, float]:
+        """Stream logged episodes from files into a data table, e.g., for offline pretraining. Files are read \
+            in chunks by parallel readers, see `iter_episode_chunks`, and chunks are inserted in bulk. The table \
+            is created with `kwargs` if it does not exist, and its producer pipeline is paused while ingesting.
 
-    def start_consumer_pipe(self, name: str, batch_size: int) -> Tuple[str, Queue]:
+        Note:
+            Memory is bounded by `num_readers` files being read, as a `.npz` file is loaded as a whole while \
+                snapshots are read chunk by chunk, and `max_pending_chunks` chunks waiting for insertion. Sharded \
+                datasets assign files to shards in turn.
+
+        Args:
+            name (str): Table name.
+            paths (Union[str, Sequence[str]]): Paths of episode files, see `episode_files`.
+            chunk_size (int, optional): The maximum of rows of each chunk. Defaults to 65536.
+            num_readers (int, optional): The number of reading threads. Defaults to 4.
+            max_pending_chunks (int, optional): The maximum of chunks waiting for insertion. Defaults to 8.
+
+        Returns:
+            Dict[str, float]: Ingestion report, including the number of files and rows, seconds and rows per second.
+        """
+
+        files = episode_files(paths)
+        if self.shards:
+            reports = ray.get(
+                [
+                    shard.ingest.remote(
+                        name,
+                        files[i :: len(self.shards)],
+                        chunk_size,
+                        num_readers,
+                        max_pending_chunks,
+                        **kwargs,
+                    )
+                    for i, shard in enumerate(self.shards)
+                ]
+            )
+            if name not in self.buffers:
+                self.buffers[name] = ShardedTable(
+                    name, self.shards, self.shard_capacity
+                )
+                self.markers[name] = rwlock.RWLockFair()
+            rows = sum(report["rows"] for report in reports)
+            seconds = max(report["seconds"] for report in reports)
+            return {
+                "files": len(files),
+                "rows": rows,
+                "seconds": seconds,
+                "rows_per_second": rows / max(seconds, 1e-6),
+            }
+
+        if name not in self.buffers:
+            self._create_table(name, **kwargs)
+        buffer = self.buffers[name]
+        stats = self.table_stats[name]
+        wlock = table_lock(self.markers[name], buffer, write=True)
+        chunks = queue.Queue(maxsize=max_pending_chunks)
+        stop_event = threading.Event()
+
+        def _put(item: Any):
+            while not stop_event.is_set():
+                try:
+                    chunks.put(item, timeout=0.1)
+                    return
+                except queue.Full:
+                    continue
+
+        def _read(path: str):
+            try:
+                for chunk in iter_episode_chunks(
+                    path, chunk_size, complete_next=not buffer.ignore_obs_next
+                ):
+                    _put(chunk)
+                    if stop_event.is_set():
+                        return
+            finally:
+                # marks the end of a file
+                _put(None)
+
+        start, rows = time.time(), 0
+        with ThreadPoolExecutor(max_workers=num_readers) as pool, self._paused_writer(
+            name
+        ):
+            futures = [pool.submit(_read, path) for path in files]
+            try:
+                finished = 0
+                while finished < len(files):
+                    chunk = chunks.get()
+                    if chunk is None:
+                        finished += 1
+                        continue
+                    if isinstance(buffer, MultiagentReplayBuffer) or not isinstance(
+                        next(iter(chunk.values())), Dict
+                    ):
+                        batches = [chunk]
+                    else:
+                        # agent chunks are inserted one by one, as `coalesce_episodes` does
+                        batches = list(chunk.values())
+                    for batch in batches:
+                        lock_start = time.perf_counter()
+                        with wlock:
+                            lock_wait = time.perf_counter() - lock_start
+                            indices = buffer.add_batch(batch)
+                        stats.record_insert(len(indices), lock_wait)
+                        rows += len(indices)
+            finally:
+                stop_event.set()
+            for future in futures:
+                future.result()
+        buffer.flush()
+
+        seconds = time.time() - start
+        report = {
+            "files": len(files),
+            "rows": rows,
+            "seconds": seconds,
+            "rows_per_second": rows / max(seconds, 1e-6),
+        }
+        Logger.info(
+            f"ingested {rows} rows from {len(files)} file(s) into table {name} "
+            f"in {seconds:.2f}s, {report['rows_per_second']:.0f} rows/s"
+        )
+        return report
+
+    def update_priorities(
+        self, name: str, indices: Sequence[int], td_errors: Sequence[float]
+    ):
+        """Update priorities of a prioritized data table.
+
+        Args:
+            name (str): Name of datatable.
+            indices (Sequence[int]): Indices of sampled transitions.
+            td_errors (Sequence[float]): TD errors related to the indices.
+        """
+
+        buffer = self.buffers[name]
+        if isinstance(buffer, ShardedTable):
+            buffer.update_priorities(indices, td_errors)
+            return
+
+        assert isinstance(buffer, PrioritizedReplayBuffer), type(buffer)
+        with self.markers[name].gen_wlock():
+            buffer.update_priorities(indices, td_errors)
+
+    def set_learner_version(self, name: str, version: int):
+        """Set the weights version of the learner which consumes a data table, so that FIFO tables drop rows \
+            which lag behind it by more than `max_staleness`, see `FIFOReplayBuffer`. Other tables ignore it.
+
+        Args:
+            name (str): Name of datatable.
+            version (int): The learner version.
+        """
+
+        buffer = self.buffers.get(name)
+        if isinstance(buffer, (ShardedTable, FIFOReplayBuffer)):
+            buffer.set_learner_version(version)
+
+    def get_table_size(self, name: str) -> int:
+        """Return the size of a data table, 0 if the table does not exist.
+
+        Args:
+            name (str): Name of datatable.
+
+        Returns:
+            int: Table size.
+        """
+
+        buffer = self.buffers.get(name)
+        if isinstance(buffer, ShardedTable):
+            buffer.refresh()
+        return 0 if buffer is None else len(buffer)
+
+    def get_table_info(self, name: str) -> Dict[str, Any]:
+        """Return the size, and inserted and sampled rows of a data table, zeros if the table does not exist. \
+            Prioritized tables report `total_priority`, `min_priority` and `beta` in addition. Routers of \
+            sharded tables call it on shards.
+
+        Args:
+            name (str): Name of datatable.
+
+        Returns:
+            Dict[str, Any]: A dict of `size`, `inserted` and `sampled`, and priorities of prioritized tables.
+        """
+
+        buffer = self.buffers.get(name)
+        stats = self.table_stats.get(name)
+        info = {
+            "size": 0 if buffer is None else len(buffer),
+            "inserted": 0 if stats is None else stats.inserted,
+            "sampled": 0 if stats is None else stats.sampled,
+        }
+        if isinstance(buffer, PrioritizedReplayBuffer):
+            info.update(
+                total_priority=buffer.total_priority(),
+                min_priority=buffer.min_priority(),
+                beta=buffer.beta,
+            )
+        return info
+
+    def sample(self, name: str, batch_size: int, learner_version: int = None) -> Any:
+        """Sample a batch from a data table directly.
+
+        Args:
+            name (str): Name of datatable.
+            batch_size (int): Batch size.
+            learner_version (int, optional): The weights version of the learner, see `set_learner_version`. \
+                Defaults to None.
+
+        Returns:
+            Any: Batch info, a tuple of batch and indices, or a dict of them for multi-agent tables.
+        """
+
+        if learner_version is not None:
+            self.set_learner_version(name, learner_version)
+        with table_lock(self.markers[name], self.buffers[name]):
+            ret = self.buffers[name].sample(batch_size)
+        if name in self.table_stats:
+            self.table_stats[name].record_sample(batch_size)
+        return ret
+
+    def start_consumer_pipe(
+        self,
+        name: str,
+        batch_size: int,
+        prefetch_depth: int = 2,
+        zero_copy: bool = False,
+        num_batches: int = 1,
+        learner_version: int = None,
+    ) -> Tuple[str, Queue]:
         """Start a consumer pipeline, if there is no such a table that named as `name`, the function will be stucked until the table has been created.
 
+        Note:
+            If `prefetch_depth` is 0, the pipeline works in request mode, i.e., batches are sampled only when the \
+                consumer calls `request_samples`. Otherwise, at most `prefetch_depth` batches are sampled ahead.
+
+            If `num_batches` is greater than 1, each queue item is a block of `num_batches` batches, and \
+                `prefetch_depth` and requests count blocks, see `ReplayBuffer.sample_many`.
+
         Args:
             name (str): Name of datatable.
             batch_size (int): Batch size.
+            prefetch_depth (int, optional): The maximum of prefetched batches. Defaults to 2.
+            zero_copy (bool, optional): Send object references of batches instead of the batches, consumers \
+                should call `resolve_batch_info` to retrieve data. Defaults to False.
+            num_batches (int, optional): The number of batches in each queue item. Defaults to 1.
+            learner_version (int, optional): The weights version of the learner, later versions are given by \
+                `set_learner_version`. Defaults to None.
 
         Returns:
             Tuple[str, Queue]: A tuple of table name and queue for retrieving samples.
         """
 
         queue_id = f"{name}_{time.time()}"
-        queue = Queue(actor_options={"num_cpus": 0})
+        queue = Queue(maxsize=prefetch_depth, actor_options={"num_cpus": 0})
         self.reader_queues[queue_id] = queue
+        self.consumer_tables[queue_id] = name
+        if prefetch_depth == 0:
+            demand = threading.Semaphore(0)
+            self.consumer_demands[queue_id] = demand
+        else:
+            demand = None
+        stop_event = threading.Event()
+        self.stop_events[queue_id] = stop_event
         # make sure that the buffer is ready
         while name not in self.buffers:
             time.sleep(1)
-        self.thread_pool.submit(
-            read_table, self.markers[name], self.buffers[name], batch_size, queue
+        if learner_version is not None:
+            self.set_learner_version(name, learner_version)
+        self.pipe_futures[queue_id] = self.thread_pool.submit(
+            read_table,
+            self.markers[name],
+            self.buffers[name],
+            batch_size,
+            queue,
+            demand,
+            stop_event,
+            zero_copy=zero_copy,
+            stats=self.table_stats.get(name),
+            rate_limiter=self.rate_limiters.get(name),
+            num_batches=num_batches,
         )
         return queue_id, queue
 
+    def request_samples(self, name: str, n: int = 1):
+        """Request `n` batches from a consumer pipeline which works in request mode.
+
+        Args:
+            name (str): The queue id returned by `start_consumer_pipe`.
+            n (int, optional): The number of requested batches. Defaults to 1.
+        """
+
+        demand = self.consumer_demands[name]
+        for _ in range(n):
+            demand.release()
+
     def end_consumer_pipe(self, name: str):
         """Kill a consumer pipeline with given table name.
 
@@ -188,6 +1405,48 @@ class OfflineDataset(RemoteInterface):
             name (str): Name of related datatable.
         """
 
+        self.consumer_demands.pop(name, None)
+        self.consumer_tables.pop(name, None)
+        self._stop_pipe(name)
         if name in self.reader_queues:
             queue = self.reader_queues.pop(name)
             queue.shutdown()
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """Report flow statistics of data tables, including insert and sample rates in rows per second, \
+            depths of writer and reader queues, dropped items of writer queues, writer lock wait in seconds \
+            per second, and the samples-per-insert ratio. Rates are computed since the previous call.
+
+        Returns:
+            Dict[str, Dict[str, float]]: A dict of statistics, mapping from table names to their statistics.
+        """
+
+        if self.shards:
+            ret = {}
+            for shard_stats in ray.get([shard.stats.remote() for shard in self.shards]):
+                for name, table_stats in shard_stats.items():
+                    merged = ret.setdefault(name, dict.fromkeys(table_stats, 0))
+                    for k, v in table_stats.items():
+                        merged[k] += v
+            for merged in ret.values():
+                merged["samples_per_insert"] = merged["sampled"] / max(
+                    merged["inserted"], 1
+                )
+                merged["reader_queue_depth"] = 0
+        else:
+            ret = {}
+            for name, table_stats in self.table_stats.items():
+                ret[name] = table_stats.summary()
+                writer = self.writer_queues.get(name)
+                queue_stats = (
+                    writer.stats()
+                    if isinstance(writer, FlowControlQueue)
+                    else {"depth": 0, "dropped": 0}
+                )
+                ret[name]["writer_queue_depth"] = queue_stats["depth"]
+                ret[name]["writer_queue_dropped"] = queue_stats["dropped"]
+                ret[name]["reader_queue_depth"] = 0
+        for queue_id, name in self.consumer_tables.items():
+            if name in ret and queue_id in self.reader_queues:
+                ret[name]["reader_queue_depth"] += self.reader_queues[queue_id].qsize()
+        return ret
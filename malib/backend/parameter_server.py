@@ -23,20 +23,30 @@
 # SOFTWARE.
 
 from argparse import Namespace
-from typing import Dict, Any, Sequence
-from threading import Lock
+from typing import Dict, Any, Sequence, Tuple, Optional, List
+from threading import Lock, Condition, Event, Thread
+from concurrent.futures import ThreadPoolExecutor, Future
+from collections import deque, OrderedDict
 
+import os
+import copy
+import time
+import pickle
+import traceback
 import itertools
+import ray
 import torch
 
 from malib.rl.common.policy import Policy
 from malib.common.strategy_spec import StrategySpec
 from malib.remote.interface import RemoteInterface
 from malib.utils.logging import Logger
+from malib.utils.codecs import encode_weights, decode_weights, WIRE_FORMATS
+from malib.utils.general import FlatStateDict, save_weights, load_weights
 
 
 class Table:
-    def __init__(self, policy_meta_data: Dict[str, Any]):
+    def __init__(self, policy_meta_data: Dict[str, Any], history_size: int = 0):
         policy_cls = policy_meta_data["policy_cls"]
         optim_config = policy_meta_data.get("optim_config")
         policy_init_kwargs = Namespace(**policy_meta_data["kwargs"])
@@ -49,27 +59,151 @@ class Table:
                 custom_config=policy_init_kwargs.custom_config,
                 **policy_init_kwargs.kwargs,
             )
-            parameters = [list(v) for v in self.policy.parameters().values()]
-            parameters = itertools.chain(*parameters)
+            self.parameters = _unique_parameters(self.policy)
             self.optimizer: torch.optim.Optimizer = getattr(
                 torch.optim, optim_config["type"]
-            )(parameters, lr=optim_config["lr"])
+            )(self.parameters, lr=optim_config["lr"])
+            # gradients of `num_replicas` calls are averaged for one update, and gradients computed on
+            # weights older than `max_staleness` updates are rejected, None for no bound
+            self.num_replicas = optim_config.get("num_replicas", 1)
+            self.max_staleness = optim_config.get("max_staleness", None)
+            self.barrier_timeout = optim_config.get("barrier_timeout", 60.0)
         else:
             self.optimizer: torch.optim.Optimizer = None
+        self._gradients = None
+        self._num_gradients = 0
+        # the number of weights updates
+        self.version = 0
+        # recent versions of weights, as bases of deltas
+        self.history = deque(maxlen=history_size)
+        # a checkpoint file, weights are loaded from it on first access
+        self._checkpoint = None
         self.lock = Lock()
+        self.cond = Condition(self.lock)
 
-    def set_weights(self, state_dict: Dict[str, Any]):
+    def set_weights(self, state_dict: Dict[str, Any]) -> int:
         """Update weights with given weights.
 
         Args:
             state_dict (Dict[str, Any]): A dict of weights
+
+        Returns:
+            int: The version of given weights.
+        """
+
+        with self.lock:
+            self._checkpoint = None
+            if self.optimizer is not None:
+                # later gradients are applied to the given weights
+                self.policy.load_state_dict(state_dict)
+            return self._commit(state_dict)
+
+    def restore(self, filename: str, version: int):
+        """Restore weights from a checkpoint file written by `save_weights`. The file is loaded on first \
+            access, so that restoring large populations is cheap.
+
+        Args:
+            filename (str): The checkpoint file.
+            version (int): The version of weights in the file.
+        """
+
+        with self.lock:
+            self._checkpoint = filename
+            self.state_dict = None
+            self.version = version
+            self.history.clear()
+
+    def _load_checkpoint(self):
+        # called with the lock held
+        if self._checkpoint is None:
+            return
+        state_dict, self.version = load_weights(self._checkpoint)
+        self._checkpoint = None
+        if self.optimizer is not None:
+            self.policy.load_state_dict(state_dict)
+        self.state_dict = state_dict
+        self.history.append((self.version, state_dict))
+
+    def _commit(self, state_dict: Dict[str, Any]) -> int:
+        self.state_dict = state_dict
+        self.version += 1
+        self.history.append((self.version, state_dict))
+        self.cond.notify_all()
+        return self.version
+
+    def apply_gradients(
+        self, gradients: Sequence[Optional[torch.Tensor]], version: int
+    ) -> Dict[str, Any]:
+        """Aggregate gradients from data-parallel replicas, then update weights with the table optimizer once \
+            `num_replicas` gradients are received. The update increases the version.
+
+        Note:
+            With `max_staleness=0` and more than one replica, callers wait until the aggregated update is \
+                applied (or `barrier_timeout` seconds), i.e., synchronous training like all-reduce. Otherwise, \
+                callers return immediately, i.e., bounded asynchronous training like Hogwild.
+
+        Args:
+            gradients (Sequence[Optional[torch.Tensor]]): Gradients ordered as `get_gradients` returns, \
+                None for parameters without gradients.
+            version (int): The version of weights which the gradients are computed on.
+
+        Raises:
+            RuntimeError: The table has no optimizer.
+            ValueError: The number of gradients does not match the parameters.
+
+        Returns:
+            Dict[str, Any]: A dict of `accepted`, False if gradients are too stale, `version`, the latest \
+                version, and `weights`, the updated weights if this call triggers an update, otherwise None.
         """
 
+        if self.optimizer is None:
+            raise RuntimeError(
+                "cannot apply gradients to a table without `optim_config`"
+            )
+        if len(gradients) != len(self.parameters):
+            raise ValueError(
+                f"expected {len(self.parameters)} gradients, got {len(gradients)}"
+            )
+
         with self.lock:
-            self.state_dict = state_dict
+            self._load_checkpoint()
+            if (
+                self.max_staleness is not None
+                and self.version - version > self.max_staleness
+            ):
+                return {"accepted": False, "version": self.version, "weights": None}
+            if self._gradients is None:
+                self._gradients = [
+                    None if g is None else g.detach().clone() for g in gradients
+                ]
+            else:
+                self._gradients = [
+                    g if acc is None else (acc if g is None else acc.add_(g))
+                    for acc, g in zip(self._gradients, gradients)
+                ]
+            self._num_gradients += 1
+
+            if self._num_gradients < self.num_replicas:
+                if self.max_staleness == 0:
+                    target = self.version + 1
+                    self.cond.wait_for(
+                        lambda: self.version >= target, timeout=self.barrier_timeout
+                    )
+                return {"accepted": True, "version": self.version, "weights": None}
 
-    def apply_gradients(self, *gradients):
-        raise NotImplementedError
+            for param, grad in zip(self.parameters, self._gradients):
+                param.grad = (
+                    None
+                    if grad is None
+                    else grad.div_(self._num_gradients).to(param.device)
+                )
+            self.optimizer.step()
+            self.optimizer.zero_grad(set_to_none=True)
+            self._gradients, self._num_gradients = None, 0
+            # snapshot, as the policy will be updated in place
+            state_dict = _copy_state_dict(self.policy.state_dict())
+            self._commit(state_dict)
+            return {"accepted": True, "version": self.version, "weights": state_dict}
 
     def get_weights(self) -> Dict[str, Any]:
         """Retrive model weights.
@@ -79,33 +213,279 @@ class Table:
         """
 
         with self.lock:
+            self._load_checkpoint()
             return self.state_dict
 
+    def get_weights_with_version(self) -> Tuple[Dict[str, Any], int]:
+        """Retrive model weights and their version atomically.
+
+        Returns:
+            Tuple[Dict[str, Any], int]: A tuple of weights dict and version.
+        """
+
+        with self.lock:
+            self._load_checkpoint()
+            return self.state_dict, self.version
+
+    def get_weights_at(self, version: int) -> Optional[Dict[str, Any]]:
+        """Retrive weights of the latest version, or a recent version kept in the history.
+
+        Args:
+            version (int): The version.
+
+        Returns:
+            Optional[Dict[str, Any]]: Weights dict, or None if the version is not kept.
+        """
+
+        with self.lock:
+            self._load_checkpoint()
+            if version == self.version and self.state_dict is not None:
+                return self.state_dict
+            for _version, state_dict in self.history:
+                if _version == version:
+                    return state_dict
+        return None
+
+    def get_weights_if_newer(
+        self, version: int
+    ) -> Optional[Tuple[Dict[str, Any], int]]:
+        """Retrive model weights and their version if they are newer than the given version.
+
+        Args:
+            version (int): The version of the caller.
+
+        Returns:
+            Optional[Tuple[Dict[str, Any], int]]: A tuple of weights dict and version, or None if the caller is current.
+        """
+
+        with self.lock:
+            if self.version <= version:
+                return None
+            self._load_checkpoint()
+            return self.state_dict, self.version
+
 
 class ParameterServer(RemoteInterface):
-    def __init__(self, **kwargs):
+    def __init__(
+        self,
+        history_size: int = None,
+        wire_format: str = "full",
+        checkpoint_dir: str = None,
+        checkpoint_interval: float = 60.0,
+        max_cached_refs: int = 256,
+        **kwargs,
+    ):
+        """Construct a parameter server.
+
+        Args:
+            history_size (int, optional): The number of recent weights kept by each table, as bases of \
+                deltas older than the latest version, e.g., delta pulls of inference servers. Each costs a \
+                full copy of weights per table. Defaults to None, i.e., 4 if `wire_format` is `delta`, \
+                otherwise 0.
+            wire_format (str, optional): Wire format of pushes to subscribers, see `WIRE_FORMATS`. `delta` \
+                is encoded against the previous version. Defaults to "full".
+            checkpoint_dir (str, optional): The directory of checkpoints. If given, tables are checkpointed \
+                by a background thread every `checkpoint_interval` seconds, see `checkpoint`. Defaults to None.
+            checkpoint_interval (float, optional): Seconds between background checkpoints, 0 for manual \
+                checkpoints only. Defaults to 60.0.
+            max_cached_refs (int, optional): The maximum of tables whose latest weights are kept in the \
+                object store for `get_weights_many`, least recently used ones are released. Defaults to 256.
+
+        Raises:
+            ValueError: Unknown wire format.
+        """
+
+        if wire_format not in WIRE_FORMATS:
+            raise ValueError(
+                f"unknown wire format: {wire_format}, expected one of {WIRE_FORMATS}"
+            )
+        if history_size is None:
+            history_size = 4 if wire_format == "delta" else 0
+        self.history_size = history_size
+        self.wire_format = wire_format
         self.tables: Dict[str, Table] = {}
+        # subscribed actors, mapping from table names to actor handles
+        self.subscribers: Dict[str, List[ray.actor.ActorHandle]] = {}
+        # object refs of the latest full weights, mapping from table names to (version, ref), in LRU order
+        self.weight_refs: Dict[str, Tuple[int, ray.ObjectRef]] = OrderedDict()
+        self.max_cached_refs = max_cached_refs
+        # the latest strategy specs of tables, mapping from spec ids
+        self.specs: Dict[str, StrategySpec] = {}
         self.lock = Lock()
 
+        self.checkpoint_dir = checkpoint_dir
+        # versions written to `checkpoint_dir`, mapping from table names, and contents of manifests
+        self._saved_versions: Dict[str, int] = {}
+        self._saved_specs: Dict[str, Tuple] = {}
+        self._checkpoint_lock = Lock()
+        self._stop_event = Event()
+        self._checkpoint_thread = None
+        if checkpoint_dir is not None and checkpoint_interval > 0:
+            self._checkpoint_thread = Thread(
+                target=self._checkpoint_loop, args=(checkpoint_interval,), daemon=True
+            )
+            self._checkpoint_thread.start()
+
     def start(self):
         """For debug"""
         Logger.info("Parameter server started")
 
-    def apply_gradients(self, table_name: str, gradients: Sequence[Any]):
-        """Apply gradients to a data table.
+    def shutdown(self):
+        """Stop background checkpoints, then write the last checkpoint if `checkpoint_dir` is given."""
+
+        self._stop_event.set()
+        if self._checkpoint_thread is not None:
+            self._checkpoint_thread.join()
+            self._checkpoint_thread = None
+        if self.checkpoint_dir is not None:
+            self.checkpoint()
+
+    def _checkpoint_loop(self, interval: float):
+        while not self._stop_event.wait(interval):
+            try:
+                self.checkpoint()
+            except Exception:
+                Logger.warning(f"checkpoint failed: {traceback.format_exc()}")
+
+    def checkpoint(self, path: str = None) -> Dict[str, int]:
+        """Write tables to a checkpoint directory, as `{path}/{spec_id}/{policy_id}.pt` files written by \
+            `save_weights`, and a `{path}/{spec_id}/spec.pkl` manifest of the strategy spec and versions. \
+            Checkpoints to `checkpoint_dir` are incremental, only tables whose versions changed since the last \
+            checkpoint are written. Weights are written out of table locks, so updates are never blocked.
 
         Args:
-            table_name (str): The specified table name.
-            gradients (Sequence[Any]): Given gradients to update parameters.
+            path (str, optional): The checkpoint directory. Defaults to None, i.e., `checkpoint_dir`.
 
         Raises:
-            NotImplementedError: Not implemented yet.
+            ValueError: No checkpoint directory is given.
+
+        Returns:
+            Dict[str, int]: Versions of written tables, mapping from table names.
+        """
+
+        path = path or self.checkpoint_dir
+        if path is None:
+            raise ValueError("no checkpoint directory is given")
+        incremental = path == self.checkpoint_dir
+
+        written = {}
+        with self._checkpoint_lock:
+            with self.lock:
+                specs = list(self.specs.values())
+                tables = dict(self.tables)
+            for spec in specs:
+                versions = {}
+                for policy_id in spec.policy_ids:
+                    table_name = f"{spec.id}/{policy_id}"
+                    table = tables.get(table_name)
+                    if table is None or table.version == 0:
+                        continue
+                    saved = self._saved_versions.get(table_name, 0)
+                    if incremental and table.version == saved:
+                        versions[policy_id] = saved
+                        continue
+                    state_dict, version = table.get_weights_with_version()
+                    save_weights(
+                        os.path.join(path, spec.id, f"{policy_id}.pt"),
+                        state_dict,
+                        version,
+                    )
+                    versions[policy_id] = written[table_name] = version
+                    if incremental:
+                        self._saved_versions[table_name] = version
+                if not incremental or self._saved_specs.get(spec.id) != (
+                    spec.policy_ids,
+                    tuple(versions.items()),
+                ):
+                    # the manifest is written after weights, so it never refers to missing files
+                    filename = os.path.join(path, spec.id, "spec.pkl")
+                    os.makedirs(os.path.dirname(filename), exist_ok=True)
+                    with open(filename + ".tmp", "wb") as f:
+                        pickle.dump({"spec": spec, "versions": versions}, f)
+                    os.replace(filename + ".tmp", filename)
+                    if incremental:
+                        self._saved_specs[spec.id] = (
+                            spec.policy_ids,
+                            tuple(versions.items()),
+                        )
+        return written
+
+    def restore(self, path: str) -> List[StrategySpec]:
+        """Restore tables from a checkpoint directory written by `checkpoint`. Tables are created if they do \
+            not exist, and weights are loaded on first access.
+
+        Args:
+            path (str): The checkpoint directory.
+
+        Returns:
+            List[StrategySpec]: Restored strategy specs, whose policies can be loaded with \
+                `StrategySpec.load_from_checkpoint`.
         """
 
-        raise NotImplementedError
+        # versions of restored tables could move backward, so cached refs are outdated
+        with self.lock:
+            self.weight_refs.clear()
+        specs = []
+        for spec_id in sorted(os.listdir(path)):
+            filename = os.path.join(path, spec_id, "spec.pkl")
+            if not os.path.exists(filename):
+                continue
+            with open(filename, "rb") as f:
+                manifest = pickle.load(f)
+            spec: StrategySpec = manifest["spec"]
+            spec.meta_data["checkpoint_dir"] = os.path.join(path, spec_id)
+            self.create_table(spec)
+            for policy_id, version in manifest["versions"].items():
+                table_name = f"{spec.id}/{policy_id}"
+                self.tables[table_name].restore(
+                    os.path.join(path, spec_id, f"{policy_id}.pt"), version
+                )
+                if path == self.checkpoint_dir:
+                    self._saved_versions[table_name] = version
+            if path == self.checkpoint_dir:
+                self._saved_specs[spec.id] = (
+                    spec.policy_ids,
+                    tuple(manifest["versions"].items()),
+                )
+            specs.append(spec)
+        return specs
+
+    def apply_gradients(
+        self,
+        spec_id: str,
+        spec_policy_id: str,
+        gradients: Sequence[Optional[torch.Tensor]],
+        version: int,
+    ) -> Dict[str, Any]:
+        """Apply gradients computed by a data-parallel replica to a parameter table, see \
+            `Table.apply_gradients`. Updated weights are pushed to subscribers.
+
+        Note:
+            In synchronous mode, callers wait for each other, so the actor concurrency should be larger than \
+                the number of replicas.
+
+        Args:
+            spec_id (str): Strategy spec id.
+            spec_policy_id (str): Related policy id.
+            gradients (Sequence[Optional[torch.Tensor]]): Gradients ordered as `get_gradients` returns.
+            version (int): The version of weights which the gradients are computed on.
+
+        Returns:
+            Dict[str, Any]: A dict of `accepted`, False if gradients are too stale, and `version`, the \
+                latest version.
+        """
+
+        table = self.tables[f"{spec_id}/{spec_policy_id}"]
+        ret = table.apply_gradients(gradients, version)
+        if ret["weights"] is not None:
+            self._broadcast(
+                table, spec_id, spec_policy_id, ret["weights"], ret["version"]
+            )
+        return {"accepted": ret["accepted"], "version": ret["version"]}
 
     def get_weights(self, spec_id: str, spec_policy_id: str) -> Dict[str, Any]:
-        """Request for weight retrive, return a dict includes keys: `spec_id`, `spec_policy_id` and `weights`.
+        """Request for weight retrive, return a dict includes keys: `spec_id`, `spec_policy_id`, `weights` \
+            and `version`, i.e., the number of weights updates.
 
         Args:
             spec_id (str): Strategy spec id.
@@ -116,26 +496,272 @@ class ParameterServer(RemoteInterface):
         """
 
         table_name = f"{spec_id}/{spec_policy_id}"
-        weights = self.tables[table_name].get_weights()
+        weights, version = self.tables[table_name].get_weights_with_version()
+        return {
+            "spec_id": spec_id,
+            "spec_policy_id": spec_policy_id,
+            "weights": weights,
+            "version": version,
+        }
+
+    def get_weights_many(
+        self, tables: Sequence[Tuple[str, str]]
+    ) -> List[Dict[str, Any]]:
+        """Retrive weights of many tables in one call, e.g., a population. Return a list of dicts like \
+            `get_weights`, except that `weights` is an object ref, so that callers fetch all weights with one \
+            `ray.get`. Weights are put into the object store once per version, and refs are shared by callers \
+            and subscriber pushes.
+
+        Args:
+            tables (Sequence[Tuple[str, str]]): A sequence of `(spec_id, spec_policy_id)`.
+
+        Returns:
+            List[Dict[str, Any]]: A list of dicts, in the order of given tables.
+        """
+
+        res = []
+        for spec_id, spec_policy_id in tables:
+            table_name = f"{spec_id}/{spec_policy_id}"
+            weights, version = self.tables[table_name].get_weights_with_version()
+            res.append(
+                {
+                    "spec_id": spec_id,
+                    "spec_policy_id": spec_policy_id,
+                    "weights": self._put_weights(table_name, weights, version),
+                    "version": version,
+                }
+            )
+        return res
+
+    def _put_weights(
+        self, table_name: str, state_dict: Dict[str, Any], version: int
+    ) -> ray.ObjectRef:
+        with self.lock:
+            cached = self.weight_refs.get(table_name)
+            if cached is not None and cached[0] == version:
+                self.weight_refs.move_to_end(table_name)
+                return cached[1]
+        ref = ray.put(state_dict)
+        with self.lock:
+            # the old ref is released once it is replaced or evicted
+            self.weight_refs[table_name] = (version, ref)
+            self.weight_refs.move_to_end(table_name)
+            while len(self.weight_refs) > self.max_cached_refs:
+                self.weight_refs.popitem(last=False)
+        return ref
+
+    def get_weights_if_newer(
+        self,
+        spec_id: str,
+        spec_policy_id: str,
+        version: int,
+        wire_format: str = "full",
+    ) -> Optional[Dict[str, Any]]:
+        """Conditional weight retrive, return None if the weights are not newer than `version`, otherwise \
+            a dict as `get_weights` returns, with extra keys `wire_format` and `base_version`.
+
+        Note:
+            Weights are encoded with `encode_weights`, and should be decoded with `decode_weights`. For \
+                `delta`, weights are encoded against the caller's version, i.e., `base_version`. If the \
+                version is not kept in the history, `base_version` will be 0, and weights is a full snapshot.
+
+        Args:
+            spec_id (str): Strategy spec id.
+            spec_policy_id (str): Related policy id.
+            version (int): The version of cached weights, 0 for no weights.
+            wire_format (str, optional): Wire format in `WIRE_FORMATS`. Defaults to "full".
+
+        Returns:
+            Optional[Dict[str, Any]]: A dict or None.
+        """
+
+        table_name = f"{spec_id}/{spec_policy_id}"
+        table = self.tables[table_name]
+        ret = table.get_weights_if_newer(version)
+        if ret is None:
+            return None
+        weights, base_version = self._encode(table, ret[0], version, wire_format)
         return {
             "spec_id": spec_id,
             "spec_policy_id": spec_policy_id,
             "weights": weights,
+            "version": ret[1],
+            "wire_format": wire_format,
+            "base_version": base_version,
+        }
+
+    def _encode(
+        self,
+        table: Table,
+        state_dict: Dict[str, Any],
+        base_version: int,
+        wire_format: str,
+    ) -> Tuple[Dict[str, Any], int]:
+        if wire_format == "full" or state_dict is None:
+            return state_dict, 0
+        base = None
+        if wire_format == "delta" and base_version > 0:
+            base = table.get_weights_at(base_version)
+        weights = encode_weights(state_dict, wire_format, base)
+        return weights, (0 if base is None else base_version)
+
+    def get_versions(self, table_names: Sequence[str] = None) -> Dict[str, int]:
+        """Return weights versions of parameter tables.
+
+        Args:
+            table_names (Sequence[str], optional): Table names formatted as `{spec_id}/{spec_policy_id}`, \
+                None for all tables. Defaults to None.
+
+        Returns:
+            Dict[str, int]: A dict of versions, mapping from table names to versions.
+        """
+
+        if table_names is None:
+            table_names = list(self.tables.keys())
+        return {
+            name: self.tables[name].version
+            for name in table_names
+            if name in self.tables
         }
 
     def set_weights(
-        self, spec_id: str, spec_policy_id: str, state_dict: Dict[str, Any]
-    ):
+        self,
+        spec_id: str,
+        spec_policy_id: str,
+        state_dict: Dict[str, Any],
+        base_version: int = 0,
+    ) -> int:
         """Set weights to a parameter table. The table name will be defined as `{spec_id}/{spec_policy_id}`
 
         Args:
             spec_id (str): StrategySpec id.
             spec_policy_id (str): Policy id in the specified strategy spec.
-            state_dict (Dict[str, Any]): A dict that specify the parameters.
+            state_dict (Dict[str, Any]): A dict that specify the parameters, could be encoded with \
+                `encode_weights`.
+            base_version (int, optional): The version which deltas are encoded against, 0 for no deltas. \
+                Defaults to 0.
+
+        Raises:
+            ValueError: The base version is not kept in the history, the caller should send full weights.
+
+        Returns:
+            int: The version of given weights.
+        """
+
+        table_name = f"{spec_id}/{spec_policy_id}"
+        table = self.tables[table_name]
+        base = None
+        if base_version > 0:
+            base = table.get_weights_at(base_version)
+            if base is None:
+                raise ValueError(
+                    f"weights version {base_version} of table {table_name} has been dropped"
+                )
+        state_dict = decode_weights(state_dict, base)
+        version = table.set_weights(state_dict)
+        self._broadcast(table, spec_id, spec_policy_id, state_dict, version)
+        return version
+
+    def set_weights_many(
+        self, updates: Sequence[Tuple[str, str, Dict[str, Any]]]
+    ) -> List[int]:
+        """Set weights of many tables in one call, see `set_weights`.
+
+        Args:
+            updates (Sequence[Tuple[str, str, Dict[str, Any]]]): A sequence of `(spec_id, spec_policy_id, \
+                state_dict)`, state dicts could also be object refs.
+
+        Returns:
+            List[int]: Versions of given weights, in the order of updates.
+        """
+
+        versions = []
+        for spec_id, spec_policy_id, state_dict in updates:
+            if isinstance(state_dict, ray.ObjectRef):
+                state_dict = ray.get(state_dict)
+            versions.append(self.set_weights(spec_id, spec_policy_id, state_dict))
+        return versions
+
+    def subscribe(
+        self,
+        spec_id: str,
+        spec_policy_id: str,
+        subscriber: ray.actor.ActorHandle,
+    ):
+        """Register an actor for weights updates of a parameter table. Once new weights are set, the \
+            subscriber's `on_weights_update(spec_id, spec_policy_id, version, refs, wire_format, base_version)` \
+            will be called, where `refs` is a list of one object reference to the weights encoded with the \
+            server's wire format, see `get_weights_if_newer` for `base_version`.
+
+        Args:
+            spec_id (str): Strategy spec id.
+            spec_policy_id (str): Related policy id.
+            subscriber (ray.actor.ActorHandle): Actor handle of the subscriber.
         """
 
         table_name = f"{spec_id}/{spec_policy_id}"
-        self.tables[table_name].set_weights(state_dict)
+        with self.lock:
+            subscribers = self.subscribers.setdefault(table_name, [])
+            if subscriber not in subscribers:
+                subscribers.append(subscriber)
+
+    def unsubscribe(
+        self,
+        spec_id: str,
+        spec_policy_id: str,
+        subscriber: ray.actor.ActorHandle,
+    ):
+        """Cancel the subscription of a parameter table.
+
+        Args:
+            spec_id (str): Strategy spec id.
+            spec_policy_id (str): Related policy id.
+            subscriber (ray.actor.ActorHandle): Actor handle of the subscriber.
+        """
+
+        table_name = f"{spec_id}/{spec_policy_id}"
+        with self.lock:
+            subscribers = self.subscribers.get(table_name, [])
+            if subscriber in subscribers:
+                subscribers.remove(subscriber)
+
+    def _broadcast(
+        self,
+        table: Table,
+        spec_id: str,
+        spec_policy_id: str,
+        state_dict: Dict[str, Any],
+        version: int,
+    ):
+        """Put weights into the object store once, then notify subscribers without waiting.
+
+        Args:
+            table (Table): The parameter table.
+            spec_id (str): Strategy spec id.
+            spec_policy_id (str): Related policy id.
+            state_dict (Dict[str, Any]): A dict of weights.
+            version (int): The version of weights.
+        """
+
+        with self.lock:
+            # release outdated weights in the object store
+            self.weight_refs.pop(f"{spec_id}/{spec_policy_id}", None)
+            subscribers = list(self.subscribers.get(f"{spec_id}/{spec_policy_id}", []))
+        if len(subscribers) == 0:
+            return
+        weights, base_version = self._encode(
+            table, state_dict, version - 1, self.wire_format
+        )
+        if self.wire_format == "full":
+            ref = self._put_weights(f"{spec_id}/{spec_policy_id}", weights, version)
+        else:
+            ref = ray.put(weights)
+        # wrap the reference in a list, or ray will resolve it before the call
+        refs = [ref]
+        for subscriber in subscribers:
+            subscriber.on_weights_update.remote(
+                spec_id, spec_policy_id, version, refs, self.wire_format, base_version
+            )
 
     def create_table(self, strategy_spec: StrategySpec) -> str:
         """Create parameter table with given strategy spec. This function will traverse existing policy \
@@ -149,10 +775,329 @@ class ParameterServer(RemoteInterface):
         """
 
         with self.lock:
+            self.specs[strategy_spec.id] = strategy_spec
             for policy_id in strategy_spec.policy_ids:
                 table_name = f"{strategy_spec.id}/{policy_id}"
                 if table_name in self.tables:
                     continue
                 meta_data = strategy_spec.get_meta_data().copy()
-                self.tables[table_name] = Table(meta_data)
+                self.tables[table_name] = Table(
+                    meta_data, history_size=self.history_size
+                )
         return table_name
+
+
+class WeightPublisher:
+    def __init__(
+        self,
+        parameter_server: ParameterServer,
+        interval_steps: int = 1,
+        interval_seconds: float = 0.0,
+        wire_format: str = "full",
+    ) -> None:
+        """Construct a publisher which pushes weights to a parameter server in the background, so that the \
+            learner does not wait for serialization and RPC.
+
+        Note:
+            Weights are snapshotted into one of two reusable CPU buffers, pinned if CUDA is available, then a \
+                background thread sends the other one. If a push is still in flight, newer snapshots overwrite \
+                the pending one, i.e., pushes are coalesced and only the latest weights are sent. A failed send \
+                is logged and dropped, and later pushes send newer weights.
+
+        Args:
+            parameter_server (ParameterServer): A parameter server actor.
+            interval_steps (int, optional): Push every `interval_steps` calls of `step`. Defaults to 1.
+            interval_seconds (float, optional): Also push if `interval_seconds` have passed since the last \
+                push, 0 for disabling. Defaults to 0.0.
+            wire_format (str, optional): Wire format in `WIRE_FORMATS`. `delta` is encoded against the \
+                last sent weights, and falls back to full weights if the server has dropped that version. \
+                Defaults to "full".
+        """
+
+        self.parameter_server = parameter_server
+        self.interval_steps = interval_steps
+        self.interval_seconds = interval_seconds
+        self.wire_format = wire_format
+        # the last sent weights and their versions, as bases of deltas
+        self._bases: Dict[Tuple[str, str], Tuple[int, Dict[str, Any]]] = {}
+        # versions of the latest sent weights, mapping from (spec_id, spec_policy_id)
+        self.versions: Dict[Tuple[str, str], int] = {}
+        self.lock = Lock()
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        # the buffer to be filled by the learner, and the buffer being sent
+        self._fill_buffer: Dict[str, Any] = None
+        self._send_buffer: Dict[str, Any] = None
+        self._pending: Tuple[str, str, Any] = None
+        self._sending: Future = None
+        self._steps = 0
+        self._last_push = time.time()
+        self.num_pushes = 0
+        self.num_sent = 0
+        self.num_failed = 0
+        # the error of the latest send, None if it succeeded
+        self.error: Exception = None
+
+    def step(self, spec_id: str, spec_policy_id: str, state_dict: Dict[str, Any]):
+        """Count a training step, and push the weights if the push interval is reached.
+
+        Args:
+            spec_id (str): Strategy spec id.
+            spec_policy_id (str): Policy id.
+            state_dict (Dict[str, Any]): Weights, e.g., `policy.state_dict()`, tensors could be on any device.
+        """
+
+        self._steps += 1
+        if self._steps >= self.interval_steps or (
+            self.interval_seconds > 0
+            and time.time() - self._last_push >= self.interval_seconds
+        ):
+            self.push(spec_id, spec_policy_id, state_dict)
+
+    def push(self, spec_id: str, spec_policy_id: str, state_dict: Dict[str, Any]):
+        """Snapshot the weights and send them in the background.
+
+        Args:
+            spec_id (str): Strategy spec id.
+            spec_policy_id (str): Policy id.
+            state_dict (Dict[str, Any]): Weights.
+        """
+
+        if self._pending is not None and self._pending[:2] != (spec_id, spec_policy_id):
+            # do not coalesce weights of different policies
+            self.flush()
+        self._steps = 0
+        self._last_push = time.time()
+        with self.lock:
+            self._fill_buffer = _copy_state_dict(state_dict, self._fill_buffer)
+            event = None
+            if torch.cuda.is_available():
+                # copies from devices are asynchronous, the sender waits for them
+                event = torch.cuda.Event()
+                event.record()
+            self._pending = (spec_id, spec_policy_id, event)
+            self.num_pushes += 1
+            if self._sending is None:
+                self._sending = self.executor.submit(self._send_loop)
+
+    def _send_loop(self):
+        while True:
+            with self.lock:
+                if self._pending is None:
+                    self._sending = None
+                    return
+                spec_id, spec_policy_id, event = self._pending
+                self._pending = None
+                self._fill_buffer, self._send_buffer = (
+                    self._send_buffer,
+                    self._fill_buffer,
+                )
+            # errors must not end the loop, or `_sending` is never reset and later pushes are lost
+            try:
+                if event is not None:
+                    event.synchronize()
+                self._send(spec_id, spec_policy_id)
+            except Exception as e:
+                Logger.warning(
+                    f"failed to push weights of {spec_id}/{spec_policy_id}: {e}"
+                )
+                self.error = e
+                self.num_failed += 1
+            else:
+                self.error = None
+                self.num_sent += 1
+
+    def _send(self, spec_id: str, spec_policy_id: str):
+        key = (spec_id, spec_policy_id)
+        base_version, base = self._bases.get(key, (0, None))
+        if self.wire_format == "full":
+            weights = self._send_buffer
+        else:
+            weights = encode_weights(self._send_buffer, self.wire_format, base)
+        try:
+            version = ray.get(
+                self.parameter_server.set_weights.remote(
+                    spec_id=spec_id,
+                    spec_policy_id=spec_policy_id,
+                    state_dict=weights,
+                    base_version=base_version,
+                )
+            )
+        except ValueError:
+            # the base version has been dropped by the server
+            version = ray.get(
+                self.parameter_server.set_weights.remote(
+                    spec_id=spec_id,
+                    spec_policy_id=spec_policy_id,
+                    state_dict=self._send_buffer,
+                )
+            )
+        self.versions[key] = version
+        if self.wire_format == "delta":
+            self._bases[key] = (version, _copy_state_dict(self._send_buffer, base))
+
+    def flush(self):
+        """Wait until the latest weights have been sent.
+
+        Raises:
+            Exception: The error of the latest send, if it failed.
+        """
+
+        while True:
+            with self.lock:
+                sending = self._sending
+            if sending is None:
+                break
+            sending.result()
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+
+class RemoteOptimizer:
+    def __init__(
+        self,
+        optimizer: torch.optim.Optimizer,
+        parameter_server: ParameterServer,
+        spec_id: str,
+        spec_policy_id: str,
+        policy: Policy,
+    ) -> None:
+        """Construct a stand-in of a trainer's optimizer for data-parallel replicas. Instead of updating local \
+            weights, `step` sends gradients to the parameter table, which aggregates gradients of replicas and \
+            updates weights with its own optimizer, then loads the latest weights. Other attributes are \
+            delegated to the wrapped optimizer.
+
+        Args:
+            optimizer (torch.optim.Optimizer): The trainer's optimizer, whose parameters are synchronized.
+            parameter_server (ParameterServer): A parameter server actor.
+            spec_id (str): Strategy spec id.
+            spec_policy_id (str): Policy id.
+            policy (Policy): The trained policy.
+        """
+
+        self.optimizer = optimizer
+        self.parameter_server = parameter_server
+        self.spec_id = spec_id
+        self.spec_policy_id = spec_policy_id
+        self.policy = policy
+        self.version = 0
+        self.num_steps = 0
+        self.num_rejected = 0
+        self.pull()
+
+    def __getattr__(self, name: str) -> Any:
+        if name == "optimizer":
+            raise AttributeError(name)
+        return getattr(self.optimizer, name)
+
+    def zero_grad(self, *args, **kwargs):
+        self.optimizer.zero_grad(*args, **kwargs)
+
+    def step(self, closure=None):
+        loss = None
+        if closure is not None:
+            with torch.enable_grad():
+                loss = closure()
+        owned = set(
+            id(param)
+            for group in self.optimizer.param_groups
+            for param in group["params"]
+        )
+        parameters = _unique_parameters(self.policy)
+        gradients = [
+            g if id(p) in owned else None
+            for p, g in zip(parameters, get_gradients(self.policy))
+        ]
+        ret = ray.get(
+            self.parameter_server.apply_gradients.remote(
+                self.spec_id, self.spec_policy_id, gradients, self.version
+            )
+        )
+        self.num_steps += 1
+        self.num_rejected += int(not ret["accepted"])
+        # parameters not optimized here, e.g., target networks, are maintained locally
+        self.pull(keep=[p for p in parameters if id(p) not in owned])
+        return loss
+
+    def pull(self, keep: Sequence[torch.nn.Parameter] = ()):
+        """Load the latest weights if they are newer than local ones.
+
+        Args:
+            keep (Sequence[torch.nn.Parameter], optional): Parameters which keep local values. Defaults to ().
+        """
+
+        info = ray.get(
+            self.parameter_server.get_weights_if_newer.remote(
+                self.spec_id, self.spec_policy_id, self.version
+            )
+        )
+        if info is not None and info["weights"] is not None:
+            kept = [(param, param.detach().clone()) for param in keep]
+            self.policy.load_state_dict(info["weights"])
+            with torch.no_grad():
+                for param, value in kept:
+                    param.copy_(value)
+            self.version = info["version"]
+
+
+def _unique_parameters(policy: Policy) -> List[torch.nn.Parameter]:
+    # networks could share parameters
+    parameters, seen = [], set()
+    for param in itertools.chain(*policy.parameters().values()):
+        if id(param) not in seen:
+            seen.add(id(param))
+            parameters.append(param)
+    return parameters
+
+
+def get_gradients(policy: Policy) -> List[Optional[torch.Tensor]]:
+    """Collect gradients of a policy for `ParameterServer.apply_gradients`.
+
+    Args:
+        policy (Policy): A policy after backward.
+
+    Returns:
+        List[Optional[torch.Tensor]]: CPU gradients of unique parameters, None for parameters without gradients.
+    """
+
+    return [
+        None if param.grad is None else param.grad.detach().cpu()
+        for param in _unique_parameters(policy)
+    ]
+
+
+def _copy_state_dict(state_dict: Any, buffer: Any = None) -> Any:
+    """Copy a (nested) state dict into a reusable CPU buffer with the same structure, tensors are copied \
+        in place if possible, and other values are deep-copied.
+
+    Args:
+        state_dict (Any): A state dict, or a value of it.
+        buffer (Any, optional): The buffer of the previous copy. Defaults to None.
+
+    Returns:
+        Any: The copy.
+    """
+
+    if isinstance(state_dict, FlatStateDict):
+        buffer = buffer.buffers if isinstance(buffer, FlatStateDict) else None
+        return state_dict._replace(
+            buffers=_copy_state_dict(state_dict.buffers, buffer),
+            extras=copy.deepcopy(state_dict.extras),
+        )
+    if isinstance(state_dict, Dict):
+        buffer = buffer if isinstance(buffer, Dict) else {}
+        return {k: _copy_state_dict(v, buffer.get(k)) for k, v in state_dict.items()}
+    if isinstance(state_dict, torch.Tensor):
+        if (
+            not isinstance(buffer, torch.Tensor)
+            or buffer.shape != state_dict.shape
+            or buffer.dtype != state_dict.dtype
+        ):
+            buffer = torch.empty(
+                state_dict.shape,
+                dtype=state_dict.dtype,
+                pin_memory=torch.cuda.is_available(),
+            )
+        buffer.copy_(state_dict.detach(), non_blocking=True)
+        return buffer
+    return copy.deepcopy(state_dict)
@@ -25,9 +25,11 @@
 from typing import Dict, Any, Tuple, Type
 from argparse import Namespace
 
+import os
 import numpy as np
 
 from malib.rl.common.policy import Policy
+from malib.utils.general import load_weights
 from malib.utils.typing import PolicyID
 
 
@@ -64,6 +66,17 @@ class StrategySpec:
         self.id = identifier
         self.policy_ids = tuple(policy_ids)
         self.meta_data = meta_data
+        # policies loaded from checkpoints
+        self._policies: Dict[PolicyID, Policy] = {}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop("_policies", None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._policies = {}
 
     def __str__(self):
         return f"<StrategySpec: {self.policy_ids}>"
@@ -116,6 +129,7 @@ class StrategySpec:
         - kwargs: a dict of parameters for policy construction
         - experiment_tag: a string for experiment identification
         - optim_config: optional, a dict for optimizer construction
+        - checkpoint_dir: optional, the directory of policy checkpoints, set by `ParameterServer.restore`
 
         Returns:
             Dict[str, Any]: A dict of meta data.
@@ -166,5 +180,26 @@ class StrategySpec:
         idx = np.random.choice(self.num_policy, p=prob_list)
         return self.policy_ids[idx]
 
-    def load_from_checkpoint(self, policy_id: PolicyID):
-        raise NotImplementedError
+    def load_from_checkpoint(self, policy_id: PolicyID) -> Policy:
+        """Load a policy from `checkpoint_dir` in meta data, see `ParameterServer.checkpoint`. Policies are \
+            loaded on first access, then cached.
+
+        Args:
+            policy_id (PolicyID): Policy id.
+
+        Raises:
+            ValueError: There is no `checkpoint_dir` in meta data.
+
+        Returns:
+            Policy: A policy instance.
+        """
+
+        if policy_id not in self._policies:
+            checkpoint_dir = self.meta_data.get("checkpoint_dir")
+            if checkpoint_dir is None:
+                raise ValueError(f"strategy spec {self.id} has no checkpoint directory")
+            weights, _ = load_weights(os.path.join(checkpoint_dir, f"{policy_id}.pt"))
+            policy = self.gen_policy()
+            policy.load_state_dict(weights)
+            self._policies[policy_id] = policy
+        return self._policies[policy_id]
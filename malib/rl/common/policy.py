@@ -32,6 +32,12 @@ import torch.nn as nn
 from gym import spaces
 
 from malib.utils.preprocessor import get_preprocessor
+from malib.utils.general import (
+    FlatStateDict,
+    pack_state_dict,
+    unpack_state_dict,
+    iter_packed_tensors,
+)
 from malib.common.distributions import make_proba_distribution, Distribution
 
 
@@ -82,6 +88,8 @@ class Policy(metaclass=ABCMeta):
         )
 
         self._registered_networks: Dict[str, nn.Module] = {}
+        # registered module tensors bound to contiguous buffers, see `flat_state_dict`
+        self._flat_binding = None
 
         if isinstance(action_space, spaces.Discrete):
             self.action_type = "discrete"
@@ -152,9 +160,85 @@ class Policy(metaclass=ABCMeta):
             state_dict (Dict[str, Any]): A dict of states.
         """
 
+        if isinstance(state_dict, FlatStateDict):
+            self._load_flat_state_dict(state_dict)
+            return
+
         for k, v in state_dict.items():
             self._state_handler_dict[k].load_state_dict(v)
 
+    def flat_state_dict(self, copy: bool = True) -> FlatStateDict:
+        """Return states packed into contiguous buffers, see `pack_state_dict`. At the first call, tensors of \
+            registered modules are re-pointed to views of preallocated buffers, so that the later calls, and \
+            loading a packed state dict with the same layout, cost one copy per dtype.
+
+        Args:
+            copy (bool, optional): Return CPU copies of buffers, or the live buffers, which will be changed \
+                by training. Defaults to True.
+
+        Returns:
+            FlatStateDict: A packed state dict.
+        """
+
+        layout, buffers = self._bind_flat_buffers()
+        if copy:
+            buffers = {k: v.detach().to("cpu", copy=True) for k, v in buffers.items()}
+        extras = {
+            (k,): v.state_dict()
+            for k, v in self._state_handler_dict.items()
+            if not isinstance(v, nn.Module)
+        }
+        return FlatStateDict(layout, buffers, extras)
+
+    def _bind_flat_buffers(self) -> Tuple[Tuple, Dict[str, torch.Tensor]]:
+        handlers = tuple((k, id(v)) for k, v in self._state_handler_dict.items())
+        binding = self._flat_binding
+        # rebind if modules are replaced or moved
+        if (
+            binding is not None
+            and binding["handlers"] == handlers
+            and all(t.data_ptr() == v.data_ptr() for t, v in binding["views"])
+        ):
+            return binding["layout"], binding["buffers"]
+
+        states = {
+            k: v.state_dict(keep_vars=True)
+            for k, v in self._state_handler_dict.items()
+            if isinstance(v, nn.Module)
+        }
+        flat = pack_state_dict(states)
+        views = []
+        for path, view in iter_packed_tensors(flat):
+            tensor = states[path[0]]
+            for k in path[1:]:
+                tensor = tensor[k]
+            tensor.data = view
+            views.append((tensor, view))
+        self._flat_binding = {
+            "handlers": handlers,
+            "layout": flat.layout,
+            "buffers": flat.buffers,
+            "views": views,
+            # non-tensor module states, e.g., extra states, are not packed
+            "packable": len(flat.extras) == 0,
+        }
+        return flat.layout, flat.buffers
+
+    def _load_flat_state_dict(self, flat: FlatStateDict):
+        layout, buffers = self._bind_flat_buffers()
+        if (
+            flat.layout != layout
+            or not self._flat_binding["packable"]
+            or any(len(path) > 1 for path in flat.extras)
+        ):
+            for k, v in unpack_state_dict(flat).items():
+                self._state_handler_dict[k].load_state_dict(v)
+            return
+        for dtype, buffer in buffers.items():
+            buffer.copy_(flat.buffers[dtype])
+        for (k,), v in flat.extras.items():
+            self._state_handler_dict[k].load_state_dict(v)
+
     def state_dict(self, device=None):
         """Return state dict in real time"""
 
@@ -109,8 +109,14 @@ class DQNTrainer(Trainer):
             state_action_values.shape,
         )
 
+        td_error = state_action_values - expected_state_values.detach()
+        weight = batch.get("weight", None)
         self.optimizer.zero_grad()
-        loss = F.mse_loss(state_action_values, expected_state_values.detach())
+        if weight is not None:
+            # sampled from a prioritized table, compensate with importance sampling weights
+            loss = (weight.float() * td_error.pow(2)).mean()
+        else:
+            loss = F.mse_loss(state_action_values, expected_state_values.detach())
         loss.backward()
         self.optimizer.step()
 
@@ -118,7 +124,7 @@ class DQNTrainer(Trainer):
             self.target_critic, self.policy.critic, tau=self._training_config["tau"]
         )
 
-        return {
+        info = {
             "loss": loss.detach().item(),
             "mean_target": expected_state_values.mean().cpu().item(),
             "mean_eval": state_action_values.mean().cpu().item(),
@@ -131,3 +137,7 @@ class DQNTrainer(Trainer):
             "max_reward": batch.rew.max().cpu().item(),
             "eps": self.policy.eps,
         }
+        if weight is not None:
+            # for priority updating, will not be logged
+            info["td_error"] = td_error.detach().cpu().numpy()
+        return info
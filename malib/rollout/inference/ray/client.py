@@ -46,6 +46,7 @@ from malib.remote.interface import RemoteInterface
 from malib.rollout.envs.vector_env import VectorEnv, SubprocVecEnv
 from malib.rollout.inference.ray.server import RayInferenceWorkerSet
 from malib.rollout.inference.utils import process_env_rets, process_policy_outputs
+from malib.backend.offline_dataset_server import EpisodeAccumulator
 
 
 class RayInferenceClient(RemoteInterface):
@@ -82,6 +83,8 @@ class RayInferenceClient(RemoteInterface):
         self.training_agent_mapping = training_agent_mapping or (lambda agent: agent)
         self.max_env_num = max_env_num
         self.custom_configs = custom_config
+        # episode accumulators of dataset writers, mapping from writer queue ids
+        self.accumulators: Dict[str, EpisodeAccumulator] = {}
 
         agent_group = defaultdict(lambda: [])
         runtime_agent_ids = []
@@ -119,6 +122,30 @@ class RayInferenceClient(RemoteInterface):
             _ = [e.shutdown(force=True) for e in self.send_queue.values()]
         self.env.close()
 
+    def get_accumulator(
+        self, writer_info: Tuple[str, Queue], **kwargs
+    ) -> EpisodeAccumulator:
+        """Return the episode accumulator of a dataset writer, create one if not exists.
+
+        Args:
+            writer_info (Tuple[str, Queue]): A tuple of writer queue id and writer queue.
+            kwargs: Flush thresholds, see `EpisodeAccumulator`.
+
+        Returns:
+            EpisodeAccumulator: An episode accumulator.
+        """
+
+        queue_id, writer = writer_info
+        if queue_id not in self.accumulators:
+            self.accumulators[queue_id] = EpisodeAccumulator(writer, **kwargs)
+        return self.accumulators[queue_id]
+
+    def flush_writers(self):
+        """Flush pending episodes of all dataset writers, and wait until they are sent."""
+
+        for accumulator in self.accumulators.values():
+            accumulator.flush(wait=True)
+
     def run(
         self,
         agent_interfaces: Dict[AgentID, RayInferenceWorkerSet],
@@ -285,17 +312,33 @@ def env_runner(
             cnt += 1
 
         if dwriter_info_dict is not None:
-            # episode_id: agent_id: dict_data
-            episodes = episodes.to_numpy()
+            # episode_id: agent_id: dict_data. Tables which ignore next observations rebuild them
+            # from compact episodes, so that each frame is sent and stored once
+            table_config = rollout_config.get("table_config", {})
+            episodes = episodes.to_numpy(
+                compact=table_config.get("ignore_obs_next", False)
+            )
+            if table_config.get("table_type") != "fifo":
+                # only FIFO tables measure staleness with versions of behavior policies
+                for episode in episodes:
+                    for agent_episode in episode.values():
+                        agent_episode.pop(Episode.POLICY_VERSION, None)
             for rid, writer_info in dwriter_info_dict.items():
                 # get agents from agent group
                 agents = client.agent_group[rid]
                 batches = []
                 # FIXME(ming): multi-agent is wrong!
                 for episode in episodes:
-                    agent_buffer = [episode[aid] for aid in agents]
+                    if table_config.get("table_type") == "multiagent":
+                        # joint tables take a dict of agent transitions
+                        agent_buffer = {aid: episode[aid] for aid in agents}
+                    else:
+                        agent_buffer = [episode[aid] for aid in agents]
                     batches.append(agent_buffer)
-                writer_info[-1].put_nowait_batch(batches)
+                # episodes are coalesced and sent while the next fragment runs
+                client.get_accumulator(
+                    writer_info, **rollout_config.get("writer_config", {})
+                ).add(batches)
         end = time.time()
         rollout_info = client.env.collect_info()
     except Exception as e:
@@ -22,15 +22,17 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
-from typing import Any, List, Dict
+from typing import Any, List, Dict, Tuple
 from functools import reduce
 from operator import mul
 from collections import namedtuple
 from concurrent.futures import ThreadPoolExecutor
 
 import os
+import threading
 
 import pickle as pkl
+import numpy as np
 import ray
 import gym
 
@@ -39,6 +41,7 @@ from malib.remote.interface import RemoteInterface
 from malib.utils.typing import AgentID, DataFrame
 from malib.utils.timing import Timing
 from malib.utils.episode import Episode
+from malib.utils.codecs import decode_weights
 from malib.common.strategy_spec import StrategySpec
 from malib.rl.common.policy import Policy
 from malib.backend.parameter_server import ParameterServer
@@ -75,9 +78,28 @@ class RayInferenceWorkerSet(RemoteInterface):
         self.governed_agents = governed_agents
         self.policies: Dict[str, Policy] = {}
         self.strategy_spec_dict: Dict[str, StrategySpec] = {}
+        # versions of locally cached weights, 0 for no weights
+        self.policy_versions: Dict[str, int] = {}
+        # the latest known weights, loaded between batches, and whether they are lossless
+        self.latest_weights: Dict[str, Tuple[int, Dict[str, Any], bool]] = {}
+        # pull deltas only if the parameter server pushes deltas
+        self.pull_format = "full"
+        self.subscribed_policies = set()
+        self.weights_lock = threading.Lock()
+        try:
+            self.actor_handle = ray.get_runtime_context().current_actor
+        except RuntimeError:
+            # not running as an actor, pull weights instead
+            self.actor_handle = None
 
     def shutdown(self):
         self.thread_pool.shutdown(wait=True)
+        for policy_id in self.subscribed_policies:
+            spec_id, spec_policy_id = policy_id.split("/", 1)
+            self.parameter_server.unsubscribe.remote(
+                spec_id, spec_policy_id, self.actor_handle
+            )
+        self.subscribed_policies = set()
         for _handler in self.clients.values():
             _handler.sender.shutdown(True)
             _handler.recver.shutdown(True)
@@ -107,6 +129,12 @@ class RayInferenceWorkerSet(RemoteInterface):
 
         assert len(dataframes) > 0
 
+        # swap in pushed weights before this batch
+        self._load_latest_weights()
+
+        # policies whose weights have been checked in this call
+        refreshed = set(self.subscribed_policies)
+
         for dataframe in dataframes:
             with timer.time_avg("others"):
                 agent_id = dataframe.identifier
@@ -132,14 +160,9 @@ class RayInferenceWorkerSet(RemoteInterface):
                 rets = {}
 
             with timer.time_avg("policy_update"):
-                info = ray.get(
-                    self.parameter_server.get_weights.remote(
-                        spec_id=spec.id,
-                        spec_policy_id=spec_policy_id,
-                    )
-                )
-                if info["weights"] is not None:
-                    self.policies[policy_id].load_state_dict(info["weights"])
+                if policy_id not in refreshed:
+                    self._refresh_weights(spec.id, spec_policy_id)
+                    refreshed.add(policy_id)
 
             with timer.time_avg("compute_action"):
                 (
@@ -169,18 +192,137 @@ class RayInferenceWorkerSet(RemoteInterface):
                         continue
                     else:
                         rets[k] = v.reshape(batch_size, -1)
+                # tag transitions with the weights version, for FIFO tables. Rollout clients drop the
+                # column before writing to other tables
+                rets[Episode.POLICY_VERSION] = np.full(
+                    batch_size, self.policy_versions.get(policy_id, 0), dtype=np.int32
+                )
             return_dataframes.append(
                 DataFrame(identifier=agent_id, data=rets, meta_data=dataframe.meta_data)
             )
         # print(f"timer information: {timer.todict()}")
         return return_dataframes
 
+    def on_weights_update(
+        self,
+        spec_id: str,
+        spec_policy_id: str,
+        version: int,
+        refs: List["ray.ObjectRef"],
+        wire_format: str = "full",
+        base_version: int = 0,
+    ):
+        """Callback for weights pushed by the parameter server. Weights are fetched and decoded here, \
+            then loaded at the beginning of the next `compute_action` call.
+
+        Args:
+            spec_id (str): Strategy spec id.
+            spec_policy_id (str): Related policy id.
+            version (int): The version of pushed weights.
+            refs (List[ray.ObjectRef]): A list of one object reference to the encoded weights.
+            wire_format (str, optional): Wire format of pushed weights. Defaults to "full".
+            base_version (int, optional): The version which deltas are encoded against, 0 for no deltas. \
+                Defaults to 0.
+        """
+
+        policy_id = f"{spec_id}/{spec_policy_id}"
+        if wire_format == "delta":
+            self.pull_format = "delta"
+        latest_version, latest, exact = self.latest_weights.get(
+            policy_id, (0, None, True)
+        )
+        if version <= latest_version:
+            return
+        if base_version > 0 and (base_version != latest_version or not exact):
+            # missed updates, the delta cannot be decoded
+            self._fetch_weights(spec_id, spec_policy_id)
+            return
+        weights = decode_weights(ray.get(refs[0]), latest)
+        self._stage_weights(
+            policy_id, version, weights, wire_format in ("full", "delta")
+        )
+
+    def _stage_weights(
+        self, policy_id: str, version: int, weights: Dict[str, Any], exact: bool
+    ):
+        with self.weights_lock:
+            if version > self.latest_weights.get(policy_id, (0, None, True))[0]:
+                self.latest_weights[policy_id] = (version, weights, exact)
+
+    def _fetch_weights(self, spec_id: str, spec_policy_id: str):
+        """Pull weights from the parameter server only if they are newer than the latest known ones. \
+            If the parameter server pushes deltas, weights are also pulled as deltas against lossless \
+            cached weights.
+
+        Args:
+            spec_id (str): Strategy spec id.
+            spec_policy_id (str): Related policy id.
+        """
+
+        policy_id = f"{spec_id}/{spec_policy_id}"
+        version, latest, exact = self.latest_weights.get(policy_id, (0, None, True))
+        info = ray.get(
+            self.parameter_server.get_weights_if_newer.remote(
+                spec_id=spec_id,
+                spec_policy_id=spec_policy_id,
+                version=version if exact else 0,
+                wire_format=self.pull_format if exact else "full",
+            )
+        )
+        if info is None or info["weights"] is None:
+            return
+        base = latest if info["base_version"] > 0 else None
+        weights = decode_weights(info["weights"], base)
+        self._stage_weights(policy_id, info["version"], weights, True)
+
+    def _load_latest_weights(self):
+        with self.weights_lock:
+            for policy_id, (version, weights, _) in self.latest_weights.items():
+                if version > self.policy_versions.get(policy_id, 0):
+                    self.policies[policy_id].load_state_dict(weights)
+                    self.policy_versions[policy_id] = version
+
+    def _subscribe(self, spec_id: str, spec_policy_id: str):
+        """Subscribe weights updates of a policy, then pull the weights which have been set before.
+
+        Args:
+            spec_id (str): Strategy spec id.
+            spec_policy_id (str): Related policy id.
+        """
+
+        policy_id = f"{spec_id}/{spec_policy_id}"
+        ray.get(
+            self.parameter_server.subscribe.remote(
+                spec_id, spec_policy_id, self.actor_handle
+            )
+        )
+        self.subscribed_policies.add(policy_id)
+        self._fetch_weights(spec_id, spec_policy_id)
+
+    def _refresh_weights(self, spec_id: str, spec_policy_id: str) -> int:
+        """Pull weights from the parameter server only if they are newer than the cached ones, then \
+            load them.
+
+        Args:
+            spec_id (str): Strategy spec id.
+            spec_policy_id (str): Related policy id.
+
+        Returns:
+            int: The version of cached weights.
+        """
+
+        self._fetch_weights(spec_id, spec_policy_id)
+        self._load_latest_weights()
+        return self.policy_versions.get(f"{spec_id}/{spec_policy_id}", 0)
+
     def _update_policies(self, strategy_spec: StrategySpec, agent_id: AgentID):
         for strategy_spec_pid in strategy_spec.policy_ids:
             policy_id = f"{strategy_spec.id}/{strategy_spec_pid}"
             if policy_id not in self.policies:
                 policy = strategy_spec.gen_policy(device="cpu")
                 self.policies[policy_id] = policy
+                if self.actor_handle is not None:
+                    self._subscribe(strategy_spec.id, strategy_spec_pid)
 
 
 def _get_initial_states(self, client_id, observation, policy: Policy, identifier):
@@ -44,6 +44,7 @@ from malib import settings
 from malib.utils.typing import AgentID
 from malib.utils.logging import Logger
 from malib.utils.stopping_conditions import get_stopper
+from malib.utils.codecs import infer_codecs
 from malib.utils.monitor import write_to_tensorboard
 from malib.common.strategy_spec import StrategySpec
 from malib.remote.interface import RemoteInterface
@@ -343,20 +344,20 @@ class RolloutWorker(RemoteInterface):
         num_env_per_thread = rollout_config["num_env_per_thread"]
         num_eval_threads = rollout_config["num_eval_threads"]
 
-        actor_pool = ActorPool(
-            [
-                self.inference_client_cls.remote(
-                    env_desc,
-                    ray.get_actor(settings.OFFLINE_DATASET_ACTOR),
-                    max_env_num=num_env_per_thread,
-                    use_subproc_env=rollout_config["use_subproc_env"],
-                    batch_mode=rollout_config["batch_mode"],
-                    postprocessor_types=rollout_config["postprocessor_types"],
-                    training_agent_mapping=agent_mapping_func,
-                )
-                for _ in range(num_threads + num_eval_threads)
-            ]
-        )
+        # inference clients are kept, so that their dataset writers could be flushed
+        self.inference_clients = [
+            self.inference_client_cls.remote(
+                env_desc,
+                ray.get_actor(settings.OFFLINE_DATASET_ACTOR),
+                max_env_num=num_env_per_thread,
+                use_subproc_env=rollout_config["use_subproc_env"],
+                batch_mode=rollout_config["batch_mode"],
+                postprocessor_types=rollout_config["postprocessor_types"],
+                training_agent_mapping=agent_mapping_func,
+            )
+            for _ in range(num_threads + num_eval_threads)
+        ]
+        actor_pool = ActorPool(self.inference_clients)
         return actor_pool
 
     def init_servers(self):
@@ -411,9 +412,13 @@ class RolloutWorker(RemoteInterface):
         queue_info_dict: Dict[str, Tuple[str, Queue]] = {
             rid: None for rid in self.runtime_agent_ids
         }
+        # table configuration, e.g., `table_type`, for the creation of data tables
+        table_config = self.rollout_config.get("table_config", {})
         for rid, identifier in data_entrypoints.items():
             queue_id, queue = ray.get(
-                self.dataset_server.start_producer_pipe.remote(name=identifier)
+                self.dataset_server.start_producer_pipe.remote(
+                    name=identifier, **self._table_config(rid, table_config)
+                )
             )
             queue_info_dict[rid] = (queue_id, queue)
 
@@ -472,9 +477,38 @@ class RolloutWorker(RemoteInterface):
                 break
             epoch += 1
 
+        # send episodes which are still pending in inference clients
+        ray.get(
+            [
+                client.flush_writers.remote()
+                for client in getattr(self, "inference_clients", [])
+            ]
+        )
         self.rollout_callback(self.coordinator, results)
         return results
 
+    def _table_config(self, rid: str, table_config: Dict[str, Any]) -> Dict[str, Any]:
+        """Resolve the table configuration of a runtime agent. If `codecs` is `auto`, column codecs are \
+            inferred from the spaces of the agent group, see `malib.utils.codecs.infer_codecs`.
+
+        Args:
+            rid (str): Runtime agent id.
+            table_config (Dict[str, Any]): Table configuration.
+
+        Returns:
+            Dict[str, Any]: Resolved table configuration.
+        """
+
+        table_config = table_config.copy()
+        if table_config.get("codecs") == "auto":
+            agent = self.agent_group[rid][0]
+            table_config["codecs"] = infer_codecs(
+                self.env_description["observation_spaces"][agent],
+                self.env_description["action_spaces"][agent],
+                float16_obs=table_config.pop("float16_obs", False),
+            )
+        return table_config
+
     def simulate(self, runtime_strategy_specs: Dict[str, StrategySpec]):
         """Handling simulation task."""
 
@@ -31,12 +31,21 @@ from malib.backend.offline_dataset_server import OfflineDataset
 from malib.backend.parameter_server import ParameterServer
 
 
-def start_servers(data_table_capacity: int = 100000):
+def start_servers(
+    data_table_capacity: int = 100000,
+    num_dataset_shards: int = 1,
+    persistent_dataset: bool = False,
+    persistent_params: bool = False,
+):
     try:
         offline_dataset_server = (
             OfflineDataset.as_remote(num_cpus=0)
             .options(name=settings.OFFLINE_DATASET_ACTOR, max_concurrency=100)
-            .remote(table_capacity=data_table_capacity)
+            .remote(
+                table_capacity=data_table_capacity,
+                num_shards=num_dataset_shards,
+                dataset_dir=settings.DATASET_DIR if persistent_dataset else None,
+            )
         )
         ray.get(offline_dataset_server.start.remote())
     except ValueError:
@@ -47,7 +56,7 @@ def start_servers(data_table_capacity: int = 100000):
         parameter_server = (
             ParameterServer.as_remote(num_cpus=1)
             .options(name=settings.PARAMETER_SERVER_ACTOR, max_concurrency=100)
-            .remote()
+            .remote(checkpoint_dir=settings.PARAM_DIR if persistent_params else None)
         )
         ray.get(parameter_server.start.remote())
     except ValueError:
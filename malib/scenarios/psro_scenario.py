@@ -190,18 +190,23 @@ def execution_plan(experiment_tag: str, scenario: PSROScenario):
         Logger.info("\tequilibrium: {}".format(pformat(equilibrium)))
 
         # run evaluation
+        # pull all populations with one call
         populations = defaultdict(dict)
-        for agent, strategy_spec in strategy_specs.items():
-            for spec_policy_id in strategy_spec.policy_ids:
-                policy = strategy_spec.gen_policy()
-                info = ray.get(
-                    scenario.parameter_server.get_weights.remote(
-                        spec_id=strategy_spec.id,
-                        spec_policy_id=spec_policy_id,
-                    )
-                )
-                policy.load_state_dict(info["weights"])
-                populations[agent][spec_policy_id] = policy
+        keys = [
+            (agent, strategy_spec.id, spec_policy_id)
+            for agent, strategy_spec in strategy_specs.items()
+            for spec_policy_id in strategy_spec.policy_ids
+        ]
+        infos = ray.get(
+            scenario.parameter_server.get_weights_many.remote(
+                [(spec_id, spec_policy_id) for _, spec_id, spec_policy_id in keys]
+            )
+        )
+        weights = ray.get([info["weights"] for info in infos])
+        for (agent, _, spec_policy_id), state_dict in zip(keys, weights):
+            policy = strategy_specs[agent].gen_policy()
+            policy.load_state_dict(state_dict)
+            populations[agent][spec_policy_id] = policy
 
         populations = dict(populations)
         nash_conv = measure_exploitability(
@@ -0,0 +1,338 @@
+# MIT License
+
+# Copyright (c) 2021 MARL @ SJTU
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from typing import Any, Dict, List, Tuple, Union
+from collections import namedtuple
+
+import zlib
+
+import numpy as np
+import torch
+
+from gym import spaces
+
+from malib.utils.episode import Episode
+from malib.utils.general import FlatStateDict
+
+
+class Codec:
+    name: str = None
+
+    def __init__(self, shape: Tuple[int, ...] = None, dtype: np.dtype = None) -> None:
+        """Construct a column codec, which encodes rows for storage and decodes gathered rows in a vectorized \
+            way. The row shape and dtype are recorded at the first encoding, or given for reopened tables.
+
+        Args:
+            shape (Tuple[int, ...], optional): Row shape of decoded data. Defaults to None.
+            dtype (np.dtype, optional): Data type of decoded data. Defaults to None.
+        """
+
+        self.shape = None if shape is None else tuple(shape)
+        self.dtype = None if dtype is None else np.dtype(dtype)
+
+    def encode(self, value: np.ndarray) -> np.ndarray:
+        """Encode a batch of rows.
+
+        Args:
+            value (np.ndarray): An array with shape `[n, ...]`.
+
+        Returns:
+            np.ndarray: Encoded rows, with `n` rows.
+        """
+
+        value = np.asarray(value)
+        if self.shape is None:
+            self.shape, self.dtype = value.shape[1:], value.dtype
+        return self._encode(value)
+
+    def decode(self, value: np.ndarray) -> np.ndarray:
+        """Decode gathered rows, with any leading dimensions.
+
+        Args:
+            value (np.ndarray): Encoded rows.
+
+        Returns:
+            np.ndarray: Decoded rows with the recorded row shape and dtype.
+        """
+
+        return self._decode(value)
+
+    def _encode(self, value: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+    def _decode(self, value: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+    def state_dict(self) -> Dict[str, Union[str, list]]:
+        return {"name": self.name, "shape": list(self.shape), "dtype": self.dtype.str}
+
+
+class CastCodec(Codec):
+    def __init__(self, storage_dtype: np.dtype, **kwargs) -> None:
+        """Construct a codec which stores data with a narrower dtype, e.g., `uint8` for one-hot or discrete \
+            values which is lossless, or `float16` for continuous observations which is lossy.
+
+        Args:
+            storage_dtype (np.dtype): Storage dtype.
+        """
+
+        super().__init__(**kwargs)
+        self.storage_dtype = np.dtype(storage_dtype)
+        self.name = self.storage_dtype.name
+
+    def _encode(self, value: np.ndarray) -> np.ndarray:
+        return value.astype(self.storage_dtype)
+
+    def _decode(self, value: np.ndarray) -> np.ndarray:
+        return value.astype(self.dtype)
+
+
+class BitPackCodec(Codec):
+    name = "bits"
+
+    def _encode(self, value: np.ndarray) -> np.ndarray:
+        return np.packbits(value.reshape(len(value), -1).astype(bool), axis=1)
+
+    def _decode(self, value: np.ndarray) -> np.ndarray:
+        size = int(np.prod(self.shape))
+        bits = np.unpackbits(value, axis=-1, count=size)
+        return bits.reshape(value.shape[:-1] + self.shape).astype(self.dtype)
+
+
+CODECS = {
+    "uint8": lambda **kwargs: CastCodec(np.uint8, **kwargs),
+    "float16": lambda **kwargs: CastCodec(np.float16, **kwargs),
+    "bits": BitPackCodec,
+}
+
+
+def make_codec(spec: Union[str, Codec, Dict], **kwargs) -> Codec:
+    """Create a codec from a codec name in `CODECS`, or a state dict.
+
+    Args:
+        spec (Union[str, Codec, Dict]): A codec, a codec name, or a state dict of codec.
+
+    Returns:
+        Codec: A codec instance.
+    """
+
+    if isinstance(spec, Codec):
+        return spec
+    if isinstance(spec, Dict):
+        return CODECS[spec["name"]](shape=spec["shape"], dtype=spec["dtype"])
+    return CODECS[spec](**kwargs)
+
+
+def _is_discrete(space: spaces.Space) -> bool:
+    if isinstance(space, (spaces.Discrete, spaces.MultiBinary)):
+        return True
+    if isinstance(space, spaces.Box):
+        # integer boxes, e.g., images, within the uint8 range
+        return (
+            np.issubdtype(space.dtype, np.integer)
+            and np.all(space.low >= 0)
+            and np.all(space.high <= 255)
+        )
+    if isinstance(space, spaces.Dict):
+        return all(_is_discrete(_space) for _space in space.spaces.values())
+    if isinstance(space, spaces.Tuple):
+        return all(_is_discrete(_space) for _space in space.spaces)
+    return False
+
+
+def infer_codecs(
+    observation_space: spaces.Space,
+    action_space: spaces.Space,
+    float16_obs: bool = False,
+) -> Dict[str, str]:
+    """Infer column codecs from the observation space and action space of an agent. Preprocessed discrete \
+        observations are one-hot or integer values, which are stored as `uint8`, action masks and dones are \
+        bit-packed, and continuous observations are stored as `float16` if `float16_obs` is enabled.
+
+    Args:
+        observation_space (spaces.Space): The original observation space.
+        action_space (spaces.Space): The action space.
+        float16_obs (bool, optional): Store continuous observations as `float16`, which is lossy. Defaults to False.
+
+    Returns:
+        Dict[str, str]: A dict of codec names, mapping from column names.
+    """
+
+    codecs = {
+        Episode.ACTION_MASK: "bits",
+        Episode.NEXT_ACTION_MASK: "bits",
+        Episode.DONE: "bits",
+    }
+    if _is_discrete(observation_space):
+        codecs[Episode.CUR_OBS] = codecs[Episode.NEXT_OBS] = "uint8"
+    elif float16_obs:
+        codecs[Episode.CUR_OBS] = codecs[Episode.NEXT_OBS] = "float16"
+    if isinstance(action_space, spaces.Discrete) and action_space.n <= 256:
+        codecs[Episode.ACTION] = "uint8"
+    return codecs
+
+
+# wire formats of weights transfer, see `encode_weights`
+WIRE_FORMATS = ("full", "float16", "bfloat16", "delta")
+
+EncodedTensor = namedtuple("EncodedTensor", "kind,data,dtype,shape")
+
+_INT_DTYPES = {1: torch.uint8, 2: torch.int16, 4: torch.int32, 8: torch.int64}
+
+# byte planes of deltas with fewer nonzeros than this ratio are sent sparsely
+SPARSE_PLANE_RATIO = 0.5
+
+
+def _xor_encode(
+    value: torch.Tensor, base: torch.Tensor
+) -> List[Union[bytes, Tuple[bytes, bytes, bool]]]:
+    itemsize = value.element_size()
+    int_dtype = _INT_DTYPES[itemsize]
+    xor = torch.bitwise_xor(
+        value.detach().cpu().contiguous().view(int_dtype),
+        base.detach().cpu().contiguous().view(int_dtype),
+    )
+    # split bytes into planes, the high bytes of drifted floats are mostly zeros
+    planes = xor.reshape(-1).numpy().view(np.uint8).reshape(-1, itemsize)
+    planes = np.ascontiguousarray(planes.T)
+    ret = []
+    for plane in planes:
+        nonzero = np.count_nonzero(plane)
+        if nonzero > SPARSE_PLANE_RATIO * len(plane):
+            ret.append(plane.tobytes())
+            continue
+        # sparse planes are sent as a bitmap of nonzeros and nonzero bytes
+        mask = plane != 0
+        bitmap = np.packbits(mask).tobytes()
+        compressed = bool(nonzero < 0.1 * len(plane))
+        if compressed:
+            bitmap = zlib.compress(bitmap, 1)
+        ret.append((bitmap, plane[mask].tobytes(), compressed))
+    return ret
+
+
+def _xor_decode(encoded: EncodedTensor, base: torch.Tensor) -> torch.Tensor:
+    itemsize = len(encoded.data)
+    base = base.detach().cpu().contiguous().reshape(-1)
+    numel = base.numel()
+    planes = np.zeros((itemsize, numel), dtype=np.uint8)
+    for plane, data in zip(planes, encoded.data):
+        if isinstance(data, bytes):
+            plane[:] = np.frombuffer(data, dtype=np.uint8)
+            continue
+        bitmap, nonzeros, compressed = data
+        if compressed:
+            bitmap = zlib.decompress(bitmap)
+        mask = np.unpackbits(np.frombuffer(bitmap, dtype=np.uint8), count=numel)
+        plane[mask.view(bool)] = np.frombuffer(nonzeros, dtype=np.uint8)
+    value = base.view(_INT_DTYPES[itemsize]).numpy().view(np.uint8)
+    value = value.reshape(numel, itemsize) ^ planes.T
+    value = torch.from_numpy(value.reshape(-1))
+    return value.view(encoded.dtype).reshape(encoded.shape)
+
+
+def encode_weights(weights: Any, wire_format: str = "full", base: Any = None) -> Any:
+    """Encode a (nested) state dict for transfer. `float16` and `bfloat16` cast floating tensors, which is \
+        lossy. `delta` XORs tensors with the ones in `base`, then sends sparse byte planes as bitmaps and \
+        nonzero bytes, which is lossless and small if weights drift slightly. Tensors without a matched base \
+        are kept as they are, so `delta` without `base` is a full snapshot.
+
+    Args:
+        weights (Any): A state dict, or a value of it.
+        wire_format (str, optional): Wire format in `WIRE_FORMATS`. Defaults to "full".
+        base (Any, optional): The state dict known by the receiver, for `delta`. Defaults to None.
+
+    Raises:
+        ValueError: Unknown wire format.
+
+    Returns:
+        Any: Encoded state dict, with `EncodedTensor` values.
+    """
+
+    if wire_format not in WIRE_FORMATS:
+        raise ValueError(
+            f"unknown wire format: {wire_format}, expected one of {WIRE_FORMATS}"
+        )
+    if isinstance(weights, FlatStateDict):
+        # buffers are encoded as tensors, deltas require the same layout
+        if not isinstance(base, FlatStateDict) or base.layout != weights.layout:
+            base = FlatStateDict(None, {}, None)
+        return weights._replace(
+            buffers=encode_weights(weights.buffers, wire_format, base.buffers)
+        )
+    if isinstance(weights, Dict):
+        base = base if isinstance(base, Dict) else {}
+        return weights.__class__(
+            (k, encode_weights(v, wire_format, base.get(k))) for k, v in weights.items()
+        )
+    if not isinstance(weights, torch.Tensor):
+        return weights
+    if wire_format in ("float16", "bfloat16"):
+        storage_dtype = getattr(torch, wire_format)
+        if weights.is_floating_point() and weights.dtype != storage_dtype:
+            return EncodedTensor(
+                "cast",
+                weights.detach().cpu().to(storage_dtype),
+                weights.dtype,
+                tuple(weights.shape),
+            )
+    elif (
+        wire_format == "delta"
+        and isinstance(base, torch.Tensor)
+        and base.dtype == weights.dtype
+        and base.shape == weights.shape
+    ):
+        return EncodedTensor(
+            "xor", _xor_encode(weights, base), weights.dtype, tuple(weights.shape)
+        )
+    return weights
+
+
+def decode_weights(weights: Any, base: Any = None) -> Any:
+    """Decode a state dict encoded by `encode_weights`.
+
+    Args:
+        weights (Any): Encoded state dict.
+        base (Any, optional): The state dict used for encoding deltas. Defaults to None.
+
+    Raises:
+        ValueError: Missing base tensors for deltas.
+
+    Returns:
+        Any: Decoded state dict.
+    """
+
+    if isinstance(weights, FlatStateDict):
+        base = base.buffers if isinstance(base, FlatStateDict) else None
+        return weights._replace(buffers=decode_weights(weights.buffers, base))
+    if isinstance(weights, Dict):
+        base = base if isinstance(base, Dict) else {}
+        return weights.__class__(
+            (k, decode_weights(v, base.get(k))) for k, v in weights.items()
+        )
+    if not isinstance(weights, EncodedTensor):
+        return weights
+    if weights.kind == "cast":
+        return weights.data.to(weights.dtype)
+    if not isinstance(base, torch.Tensor) or tuple(base.shape) != weights.shape:
+        raise ValueError("cannot decode weights delta without the base weights")
+    return _xor_decode(weights, base)
@@ -53,6 +53,7 @@ class Episode:
     CUR_STATE = "state"  # current global state
     NEXT_STATE = "state_next"  # next global state
     LAST_REWARD = "last_reward"
+    POLICY_VERSION = "policy_version"  # weights version of the behavior policy, for FIFO tables
 
     # post process
     ACC_REWARD = "accumulate_reward"
@@ -108,8 +109,17 @@ class Episode:
                 for agent, _v in agent_trans.items():
                     self.agent_entry[agent][k].append(_v)
 
-    def to_numpy(self) -> Dict[AgentID, Dict[str, np.ndarray]]:
-        """Convert episode to numpy array-like data."""
+    def to_numpy(self, compact: bool = False) -> Dict[AgentID, Dict[str, np.ndarray]]:
+        """Convert episode to numpy array-like data.
+
+        Args:
+            compact (bool, optional): Store each frame of observations, states and action masks once, without \
+                their `*_next` keys, which could be rebuilt by index shifting, e.g., with a table which \
+                ignores next observations. The frames after the last (done) step are dropped. Defaults to False.
+
+        Returns:
+            Dict[AgentID, Dict[str, np.ndarray]]: A dict of agent trajectories.
+        """
 
         res = {}
         for agent, agent_trajectory in self.agent_entry.items():
@@ -121,7 +131,8 @@ class Episode:
                 for k, v in agent_trajectory.items():
                     if k in [Episode.CUR_OBS, Episode.CUR_STATE, Episode.ACTION_MASK]:
                         # move to next obs
-                        tmp[f"{k}_next"] = np.stack(v[1:])
+                        if not compact:
+                            tmp[f"{k}_next"] = np.stack(v[1:])
                         tmp[k] = np.stack(v[:-1])
                     elif k in [Episode.PRE_DONE, Episode.PRE_REWARD]:
                         # ignore 'pre_'
@@ -162,12 +173,14 @@ class NewEpisodeDict(defaultdict):
         for env_id, _data in data.items():
             self[env_id].record(_data, agent_first, ignore_keys)
 
-    def to_numpy(self) -> Dict[EnvID, Dict[AgentID, Dict[str, np.ndarray]]]:
+    def to_numpy(
+        self, compact: bool = False
+    ) -> Dict[EnvID, Dict[AgentID, Dict[str, np.ndarray]]]:
         """Lossy data transformer, which converts a dict of episode to a dict of numpy array like. (some episode may be empty)"""
 
         res = {}
         for k, v in self.items():
-            tmp: Dict[AgentID, Dict[str, np.ndarray]] = v.to_numpy()
+            tmp: Dict[AgentID, Dict[str, np.ndarray]] = v.to_numpy(compact)
             if len(tmp) == 0:
                 continue
             res[k] = tmp
@@ -200,13 +213,13 @@ class NewEpisodeList:
                 new_episode.record(tmp, agent_first, ignore_keys)
                 self.episodes[i] = new_episode
 
-    def to_numpy(self) -> Dict[AgentID, Dict[str, np.ndarray]]:
+    def to_numpy(self, compact: bool = False) -> Dict[AgentID, Dict[str, np.ndarray]]:
         """Lossy data transformer, which converts a dict of episode to a dict of numpy array like. (some episode may be empty)"""
 
         res = []
 
         for v in self.episode_buffer:
-            tmp: Dict[AgentID, Dict[str, np.ndarray]] = v.to_numpy()
+            tmp: Dict[AgentID, Dict[str, np.ndarray]] = v.to_numpy(compact)
             if len(tmp) == 0:
                 continue
             res.append(tmp)
@@ -33,9 +33,10 @@ from typing import (
     Tuple,
     Any,
 )
-from collections import deque
+from collections import deque, namedtuple
 from collections.abc import Mapping, Sequence
 
+import os
 import copy
 
 import torch
@@ -555,3 +556,151 @@ def unflattened_lookup(
                 return kwargs["default"]
             raise e
     return base
+
+
+# a state dict packed into contiguous buffers, see `pack_state_dict`
+FlatStateDict = namedtuple("FlatStateDict", "layout,buffers,extras")
+
+
+def _iter_state_leaves(state_dict: Mapping, prefix: Tuple[str, ...] = ()):
+    for k, v in state_dict.items():
+        if isinstance(v, Mapping):
+            yield from _iter_state_leaves(v, prefix + (k,))
+        else:
+            yield prefix + (k,), v
+
+
+def pack_state_dict(state_dict: Dict[str, Any]) -> FlatStateDict:
+    """Pack tensors of a (nested) state dict into one contiguous buffer per device and dtype, so that \
+        serialization and copies cost in proportion to bytes rather than the number of tensors. A tensor \
+        reached by several paths, e.g., parameters shared by networks, is packed once, and its paths point \
+        at the same region.
+
+    Note:
+        Buffers on the device of the first tensor are keyed by dtype names, e.g., `float32`, others by \
+            `{dtype}@{device}`, so that layouts of single-device state dicts do not depend on the device.
+
+    Args:
+        state_dict (Dict[str, Any]): A state dict.
+
+    Returns:
+        FlatStateDict: A tuple of `layout`, a tuple of `(path, shape, buffer_key, offset)` for tensors, \
+            `buffers`, a dict of 1-d tensors mapping from buffer keys, and `extras`, a dict of non-tensor \
+            values mapping from paths.
+    """
+
+    layout, tensors, extras = [], [], {}
+    sizes: Dict[str, int] = {}
+    groups: Dict[str, Tuple[torch.dtype, torch.device]] = {}
+    # regions of packed tensors, mapping from tensor ids
+    regions: Dict[int, Tuple[str, int]] = {}
+    device = None
+    for path, value in _iter_state_leaves(state_dict):
+        if not isinstance(value, torch.Tensor):
+            extras[path] = value
+            continue
+        if id(value) in regions:
+            key, offset = regions[id(value)]
+            layout.append((path, tuple(value.shape), key, offset))
+            continue
+        device = value.device if device is None else device
+        key = str(value.dtype).split(".")[-1]
+        if value.device != device:
+            key = f"{key}@{value.device}"
+        offset = sizes.get(key, 0)
+        layout.append((path, tuple(value.shape), key, offset))
+        tensors.append((key, offset, value))
+        regions[id(value)] = (key, offset)
+        sizes[key] = offset + value.numel()
+        groups.setdefault(key, (value.dtype, value.device))
+    buffers = {
+        key: torch.empty(size, dtype=groups[key][0], device=groups[key][1])
+        for key, size in sizes.items()
+    }
+    for key, offset, value in tensors:
+        buffers[key][offset : offset + value.numel()].copy_(value.detach().reshape(-1))
+    return FlatStateDict(tuple(layout), buffers, extras)
+
+
+def iter_packed_tensors(flat: FlatStateDict):
+    """Iterate over tensors of a packed state dict, as views of the buffers.
+
+    Args:
+        flat (FlatStateDict): A packed state dict.
+
+    Yields:
+        Tuple[Tuple[str, ...], torch.Tensor]: Tensor paths and views.
+    """
+
+    for path, shape, key, offset in flat.layout:
+        numel = int(np.prod(shape))
+        yield path, flat.buffers[key][offset : offset + numel].view(shape)
+
+
+def unpack_state_dict(flat: FlatStateDict) -> Dict[str, Any]:
+    """Rebuild a nested state dict from a packed one, tensors are views of the buffers.
+
+    Args:
+        flat (FlatStateDict): A packed state dict.
+
+    Returns:
+        Dict[str, Any]: A nested state dict.
+    """
+
+    def _set(path, value):
+        item = res
+        for k in path[:-1]:
+            item = item.setdefault(k, {})
+        item[path[-1]] = value
+
+    res = {}
+    for path, value in iter_packed_tensors(flat):
+        _set(path, value)
+    for path, value in flat.extras.items():
+        _set(path, value)
+    return res
+
+
+def save_weights(filename: str, weights: Any, version: int = 0):
+    """Write weights to a checkpoint file atomically. Tensors are packed into one contiguous buffer per \
+        dtype, so the file holds a few large records instead of one record per tensor. The checkpoint holds \
+        only tensors and plain containers, so that it is loaded with `weights_only=True`, see `load_weights`.
+
+    Args:
+        filename (str): The checkpoint file.
+        weights (Any): A state dict, or a packed one. Non-tensor values should be primitive types.
+        version (int, optional): The version of weights. Defaults to 0.
+    """
+
+    packed = not isinstance(weights, FlatStateDict)
+    flat = pack_state_dict(weights) if packed else weights
+    checkpoint = {
+        "version": version,
+        "packed": packed,
+        "layout": flat.layout,
+        "buffers": flat.buffers,
+        "extras": flat.extras,
+    }
+    os.makedirs(os.path.dirname(filename) or ".", exist_ok=True)
+    torch.save(checkpoint, filename + ".tmp")
+    os.replace(filename + ".tmp", filename)
+
+
+def load_weights(filename: str) -> Tuple[Any, int]:
+    """Read weights written by `save_weights`, onto CPU. Files are unpickled with `weights_only=True`, \
+        so a checkpoint could not execute code.
+
+    Args:
+        filename (str): The checkpoint file.
+
+    Returns:
+        Tuple[Any, int]: A tuple of weights, in the form they were saved, and their version.
+    """
+
+    checkpoint = torch.load(filename, map_location="cpu", weights_only=True)
+    weights = FlatStateDict(
+        checkpoint["layout"], checkpoint["buffers"], checkpoint["extras"]
+    )
+    if checkpoint["packed"]:
+        weights = unpack_state_dict(weights)
+    return weights, checkpoint["version"]
@@ -23,11 +23,27 @@
 # SOFTWARE.
 
 from numbers import Number
-from typing import Any, Dict, List, Optional, Tuple, Union, no_type_check, Sequence
+from typing import (
+    Any,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Union,
+    no_type_check,
+    Sequence,
+)
 from copy import deepcopy
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 
-import h5py
+import os
+import json
+import struct
+import zipfile
+import threading
+import time
 import torch
 import pickle
 import numpy as np
@@ -38,6 +54,9 @@ from malib.utils.tianshou_batch import (
     _create_value,
     _parse_value,
 )
+from malib.utils.segment_tree import SumSegmentTree, MinSegmentTree
+from malib.utils.episode import Episode
+from malib.utils.codecs import Codec, make_codec
 
 
 @no_type_check
@@ -76,7 +95,348 @@ Hdf5ConvertibleValues = Union[  # type: ignore
 Hdf5ConvertibleType = Dict[str, Hdf5ConvertibleValues]  # type: ignore
 
 
+# keys of next-step columns which could be reconstructed from the next row, with their current-step keys
+NEXT_KEYS = {
+    Episode.NEXT_OBS: Episode.CUR_OBS,
+    Episode.NEXT_STATE: Episode.CUR_STATE,
+    Episode.NEXT_ACTION_MASK: Episode.ACTION_MASK,
+}
+
+
+def _split_leading(x: Union[Batch, np.ndarray], k: int) -> Union[Batch, np.ndarray]:
+    if isinstance(x, Batch):
+        return Batch({key: _split_leading(v, k) for key, v in x.items()})
+    return x.reshape(k, -1, *x.shape[1:])
+
+
+def split_batch_info(batch_info: Any, k: int) -> Any:
+    """Split batch info of `k * batch_size` samples into a block of `k` batches, i.e., arrays are reshaped \
+        to `[k, batch_size, ...]` without copying.
+
+    Args:
+        batch_info (Any): A tuple of batch and indices, or a dict of them for multi-agent tables.
+        k (int): The number of batches.
+
+    Returns:
+        Any: Batch info of the block.
+    """
+
+    if isinstance(batch_info, Dict):
+        return {agent: split_batch_info(v, k) for agent, v in batch_info.items()}
+    batch, indices = batch_info
+    return _split_leading(batch, k), _split_leading(np.asarray(indices), k)
+
+
+def iter_batch_info(block: Any):
+    """Iterate batch info of a block returned by `sample_many`.
+
+    Args:
+        block (Any): A tuple of batch and indices with shape `[k, batch_size, ...]`, or a dict of them.
+
+    Yields:
+        Any: Batch info of each batch in the block.
+    """
+
+    if isinstance(block, Dict):
+        agents = list(block.keys())
+        for i in range(len(block[agents[0]][1])):
+            yield {agent: (block[agent][0][i], block[agent][1][i]) for agent in agents}
+    else:
+        batch, indices = block
+        for i in range(len(indices)):
+            yield batch[i], indices[i]
+
+
+# readers of `.npy` headers by format versions, version 3.0 differs from 2.0 only in the header encoding
+_NPY_HEADER_READERS = {
+    (1, 0): np.lib.format.read_array_header_1_0,
+    (2, 0): np.lib.format.read_array_header_2_0,
+    (3, 0): np.lib.format.read_array_header_2_0,
+}
+
+
+def _npz_reader(path: str):
+    # array headers are read from the archive without loading arrays
+    headers, infos = {}, {}
+    with zipfile.ZipFile(path) as archive:
+        for info in archive.infolist():
+            key = info.filename[: -len(".npy")]
+            with archive.open(info) as f:
+                version = np.lib.format.read_magic(f)
+                shape, fortran_order, dtype = _NPY_HEADER_READERS[version](f)
+                headers[key] = (shape, fortran_order, dtype, f.tell())
+            infos[key] = info
+    columns = {}
+
+    def _column(key: str) -> np.ndarray:
+        if key in columns:
+            return columns[key]
+        shape, fortran_order, dtype, header_size = headers[key]
+        info = infos[key]
+        stored = info.compress_type == zipfile.ZIP_STORED
+        if stored and not dtype.hasobject and int(np.prod(shape)) > 0:
+            # uncompressed arrays are memory-mapped, data follows the local file header and the array header
+            with open(path, "rb") as f:
+                f.seek(info.header_offset + 26)
+                name_size, extra_size = struct.unpack("<HH", f.read(4))
+            offset = info.header_offset + 30 + name_size + extra_size + header_size
+            columns[key] = np.memmap(
+                path,
+                dtype=dtype,
+                mode="r",
+                offset=offset,
+                shape=shape,
+                order="F" if fortran_order else "C",
+            )
+        else:
+            # compressed and object arrays are loaded on first access
+            with np.load(path, allow_pickle=True) as f:
+                columns[key] = f[key]
+        return columns[key]
+
+    def _read(begin: int, end: int, keys: Sequence[str] = None):
+        ret = {}
+        for k, (shape, _, dtype, _) in headers.items():
+            if keys is not None and k not in keys:
+                continue
+            if begin >= end:
+                ret[k] = np.empty((0,) + tuple(shape[1:]), dtype=dtype)
+            else:
+                ret[k] = np.array(_column(k)[begin:end])
+        return ret
+
+    n = next(iter(headers.values()))[0][0]
+    return n, _read
+
+
+def _snapshot_reader(path: str):
+    with open(os.path.join(path, "header.json"), "r") as f:
+        header = json.load(f)
+    capacity, size = header["capacity"], header["size"]
+    segment_size = header["segment_size"]
+    codecs = {k: make_codec(codec) for k, codec in header.get("codecs", {}).items()}
+    # rows are read in insertion order, which starts at the cursor if the ring is full
+    start = header["flag"] if size == capacity else 0
+    segments = {}
+
+    def _segment(key: str, i: int) -> np.ndarray:
+        if (key, i) not in segments:
+            segments[(key, i)] = np.load(
+                os.path.join(path, f"{key}.{i}.npy"), mmap_mode="r"
+            )
+        return segments[(key, i)]
+
+    def _physical(key: str, begin: int, end: int) -> List[np.ndarray]:
+        parts = []
+        while begin < end:
+            i, offset = divmod(begin, segment_size)
+            n = min(end - begin, segment_size - offset)
+            parts.append(_segment(key, i)[offset : offset + n])
+            begin += n
+        return parts
+
+    def _read(begin: int, end: int, keys: Sequence[str] = None):
+        begin, end = begin + start, end + start
+        ranges = [(begin, min(end, capacity)), (0, max(end - capacity, 0))]
+        if begin >= capacity:
+            ranges = [(begin - capacity, end - capacity)]
+        # row flags are read only if required, with their file prefix
+        available = list(header["columns"]) + [f"_{k}" for k in header["meta"]]
+        ret = {}
+        for k in header["columns"] if keys is None else available:
+            if keys is not None and k not in keys:
+                continue
+            v = np.concatenate(sum([_physical(k, b, e) for b, e in ranges], []))
+            ret[k] = codecs[k].decode(v) if k in codecs else v
+        return ret
+
+    return size, _read
+
+
+def iter_episode_chunks(
+    path: str, chunk_size: int = 65536, complete_next: bool = False
+) -> Iterator[Dict[str, Any]]:
+    """Read logged transitions from an episode file in chunks, with the key layout of `Episode.to_numpy`. \
+        An episode file could be a `.npz` file of columns, whose keys are `<agent>/<key>` for multiple \
+        agents, or a table snapshot written by `ReplayBuffer.save`. Snapshots and uncompressed `.npz` \
+        columns are memory-mapped and read chunk by chunk, compressed columns are decompressed on first \
+        access. Chunks end at episode ends if possible, so that episodes are not split.
+
+    Args:
+        path (str): Path of a `.npz` file or a snapshot directory.
+        chunk_size (int, optional): The maximum of rows of each chunk, unless an episode is longer. \
+            Defaults to 65536.
+        complete_next (bool, optional): Rebuild missing next-step columns in `NEXT_KEYS` from the next rows, \
+            and the last step of an episode takes its current-step values. Defaults to False.
+
+    Yields:
+        Iterator[Dict[str, Any]]: A dict of columns, or a dict of agent columns for multiple agents.
+    """
+
+    if os.path.isdir(path):
+        n, read = _snapshot_reader(path)
+        with open(os.path.join(path, "header.json"), "r") as f:
+            agents = json.load(f).get("agents")
+        ends = read(0, n, keys=("_end",)).get("_end")
+    else:
+        n, read = _npz_reader(path)
+        agents = None
+        # an episode ends if any agent is done
+        done_keys = [k for k in read(0, 0) if k.rsplit("/", 1)[-1] == Episode.DONE]
+        dones = [v.reshape(n, -1) for v in read(0, n, keys=done_keys).values()]
+        ends = np.concatenate(dones, axis=1).any(axis=1) if dones else None
+    # the last row ends the last trajectory
+    ends = np.arange(n) == n - 1 if ends is None else ends | (np.arange(n) == n - 1)
+
+    begin = 0
+    while begin < n:
+        end = min(begin + chunk_size, n)
+        if end < n:
+            # cut at the last episode end, or extend to the first one
+            cuts = np.flatnonzero(ends[begin:end])
+            if len(cuts) > 0:
+                end = begin + int(cuts[-1]) + 1
+            else:
+                end = end + int(ends[end:].argmax()) + 1
+        # one more row to rebuild next-step columns
+        chunk = read(begin, min(end + 1, n) if complete_next else end)
+        if complete_next:
+            last = ends[begin:end]
+            rows = np.arange(end - begin)
+            for next_key, key in NEXT_KEYS.items():
+                for k in [k for k in chunk if k.rsplit("/", 1)[-1] == key]:
+                    k_next = k[: len(k) - len(key)] + next_key
+                    if k_next not in chunk:
+                        chunk[k_next] = chunk[k][np.where(last, rows, rows + 1)]
+            chunk = {k: v[: end - begin] for k, v in chunk.items()}
+
+        if agents is not None:
+            # joint snapshots have an agent axis after the batch axis
+            chunk = {
+                agent: {k: v[:, i] for k, v in chunk.items()}
+                for i, agent in enumerate(agents)
+            }
+        elif any("/" in k for k in chunk):
+            agent_chunk = defaultdict(dict)
+            for k, v in chunk.items():
+                agent, key = k.rsplit("/", 1)
+                agent_chunk[agent][key] = v
+            chunk = dict(agent_chunk)
+        yield chunk
+        begin = end
+
+
+class SegmentedColumn:
+    def __init__(
+        self,
+        path: str,
+        key: str,
+        capacity: int,
+        segment_size: int,
+        shape: Tuple[int, ...],
+        dtype: np.dtype,
+    ) -> None:
+        """Construct a file-backed table column. Rows are stored in fixed-size `.npy` segment files, which are \
+            created by the writer as the table grows and mapped into memory on first access, so reading a row \
+            only touches its pages through the OS page cache. Readers map segments read-only and never create \
+            files, rows of segments which have not been written are read as zeros.
+
+        Note:
+            Segments form a ring of `capacity // segment_size` files, i.e., once the table is full, new rows \
+            overwrite the oldest rows in place rather than appending new segment files. Disk usage is bounded \
+            by the capacity, while a reader of the directory may see rows being overwritten, use \
+            `ReplayBuffer.save` for consistent snapshots.
+
+        Args:
+            path (str): The directory of segment files.
+            key (str): Column name, used as the prefix of segment files.
+            capacity (int): The number of rows.
+            segment_size (int): The number of rows of each segment.
+            shape (Tuple[int, ...]): Row shape.
+            dtype (np.dtype): Data type.
+        """
+
+        self.path = path
+        self.key = key
+        self.capacity = capacity
+        self.segment_size = segment_size
+        self.shape = (capacity,) + tuple(shape)
+        self.dtype = np.dtype(dtype)
+        num_segments = -(-capacity // segment_size)
+        # writable maps of the writer, and read-only maps of readers
+        self.segments: List[np.memmap] = [None] * num_segments
+        self.readers: List[np.memmap] = [None] * num_segments
+        # segment files are created and opened under the lock, so that readers never map a partial file
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self.capacity
+
+    def _filename(self, i: int) -> str:
+        return os.path.join(self.path, f"{self.key}.{i}.npy")
+
+    def _segment(self, i: int) -> np.memmap:
+        segment = self.segments[i]
+        if segment is None:
+            with self._lock:
+                filename = self._filename(i)
+                if os.path.exists(filename):
+                    segment = np.load(filename, mmap_mode="r+")
+                else:
+                    rows = min(self.segment_size, self.capacity - i * self.segment_size)
+                    segment = np.lib.format.open_memmap(
+                        filename,
+                        mode="w+",
+                        dtype=self.dtype,
+                        shape=(rows,) + self.shape[1:],
+                    )
+                self.segments[i] = segment
+        return segment
+
+    def _reader(self, i: int) -> np.memmap:
+        segment = self.readers[i]
+        if segment is None:
+            with self._lock:
+                filename = self._filename(i)
+                if not os.path.exists(filename):
+                    return None
+                segment = self.readers[i] = np.load(filename, mmap_mode="r")
+        return segment
+
+    def __setitem__(self, index: slice, value: np.ndarray):
+        start, stop, _ = index.indices(self.capacity)
+        while start < stop:
+            i, offset = divmod(start, self.segment_size)
+            n = min(stop - start, self.segment_size - offset)
+            self._segment(i)[offset : offset + n] = value[:n]
+            value = value[n:]
+            start += n
+
+    def __getitem__(self, index: Union[slice, Sequence[int]]) -> np.ndarray:
+        if isinstance(index, slice):
+            index = np.arange(*index.indices(self.capacity))
+        index = np.asarray(index)
+        ret = np.empty(index.shape + self.shape[1:], dtype=self.dtype)
+        segment_ids = index // self.segment_size
+        for i in np.unique(segment_ids):
+            selected = segment_ids == i
+            segment = self._reader(i)
+            if segment is None:
+                ret[selected] = 0
+            else:
+                ret[selected] = segment[index[selected] - i * self.segment_size]
+        return ret
+
+    def flush(self):
+        for segment in self.segments:
+            if segment is not None:
+                segment.flush()
+
+
 class ReplayBuffer:
+    # whether readers could sample without locking, while a single writer is inserting
+    lock_free = True
+
     def __init__(
         self,
         size: int,
@@ -84,38 +444,739 @@ class ReplayBuffer:
         ignore_obs_next: bool = False,
         save_only_last_obs: bool = False,
         sample_avail: bool = False,
-        **kwargs
+        path: str = None,
+        segment_size: int = 65536,
+        codecs: Dict[str, Union[str, Codec]] = None,
+        header_interval: float = 1.0,
+        **kwargs,
     ) -> None:
+        """Construct a replay buffer, which is organized as a preallocated circular table. Insertion writes \
+            at most two contiguous slices, and sampling gathers only the selected rows.
+
+        Note:
+            If `path` is given, columns are stored in memory-mapped segment files under `path`, see \
+                `SegmentedColumn`, and a header with the cursor and size is written at most every \
+                `header_interval` seconds after insertions, and on `flush`. The table is reopened if there is \
+                a header, so the capacity could exceed the memory, and data survives restarts.
+
+        Note:
+            If `stack_num` is greater than 1, `sample` returns windows of `stack_num` consecutive steps with \
+                shape `[batch_size, stack_num, ...]`, and a boolean `mask` marks the steps of each window before \
+                its episode ends. Masked steps repeat the last valid step. Each insertion is treated as whole \
+                episodes, i.e., its last row ends an episode, so windows never cross insertions.
+
+        Note:
+            The table supports a single writer and multiple lock-free readers. The writer publishes a \
+                version `(seq, offset, length)` before and after writing rows, where `offset` counts the rows \
+                written before, and `seq` is odd while the rows in the window are being written. Readers gather \
+                rows without locking, then resample the rows which may have been overwritten, as a seqlock does.
+
+        Args:
+            size (int): Table capacity.
+            stack_num (int, optional): Indicates how many steps are stacked in a single data sample. Defaults to 1.
+            ignore_obs_next (bool, optional): Do not store next-step columns in `NEXT_KEYS`, they are reconstructed \
+                from the next rows when sampling. The last step of an episode takes its current-step values. \
+                Defaults to False.
+            save_only_last_obs (bool, optional): Save only the last frame of stacked observations, i.e., \
+                `obs[:, -1]`. Defaults to False.
+            sample_avail (bool, optional): Sample only windows which are fully inside episodes, from valid start \
+                indices precomputed at insertion. Defaults to False.
+            path (str, optional): The directory to store columns, None for in-memory columns. Defaults to None.
+            segment_size (int, optional): The number of rows of each segment file. Defaults to 65536.
+            codecs (Dict[str, Union[str, Codec]], optional): Storage codecs of columns, a codec or a codec name \
+                in `malib.utils.codecs.CODECS`, e.g., `uint8`, `float16` or `bits`. Columns are encoded at \
+                insertion and decoded at sampling. Defaults to None.
+            header_interval (float, optional): The minimum interval in seconds between header writes of \
+                file-backed tables, rows inserted after the last write are recovered only after a `flush`. \
+                Defaults to 1.0.
+        """
+
         self.capacity = size
+        self.codecs = {k: make_codec(v) for k, v in (codecs or {}).items()}
+        self.stack_num = stack_num
+        self.ignore_obs_next = ignore_obs_next
+        self.save_only_last_obs = save_only_last_obs
+        self.sample_avail = sample_avail
         self.data = {}
+        # per-row flags, `end` marks the last step of episodes, and `valid` marks valid window starts
+        self.meta = {}
+        # the insertion cursor, i.e., the index of the next row to write.
         self.flag = 0
         self.size = 0
+        self._version = (0, 0, 0)
+        self.path = path
+        self.segment_size = segment_size
+        self.header_interval = header_interval
+        # the time of the last header write, and whether insertions happened since
+        self._header_time = 0.0
+        self._header_dirty = False
+        if path is not None and os.path.exists(os.path.join(path, "header.json")):
+            self._restore()
 
     def __len__(self):
         return self.size
 
-    def add_batch(self, data: Dict[str, np.ndarray]):
+    def _allocate(self, key: str, value: np.ndarray) -> np.ndarray:
+        """Allocate a column for the given key, with the trailing shape and dtype of the given value.
+
+        Args:
+            key (str): Column name.
+            value (np.ndarray): A batch of data which determines the column layout.
+
+        Returns:
+            np.ndarray: A zero-filled column with `capacity` rows.
+        """
+
+        if self.path is None or value.dtype.hasobject:
+            return np.zeros((self.capacity,) + value.shape[1:], dtype=value.dtype)
+        os.makedirs(self.path, exist_ok=True)
+        return SegmentedColumn(
+            self.path,
+            key,
+            self.capacity,
+            self.segment_size,
+            value.shape[1:],
+            value.dtype,
+        )
+
+    def _restore(self) -> Dict[str, Any]:
+        """Reopen file-backed columns with the header under `path`.
+
+        Returns:
+            Dict[str, Any]: The header.
+        """
+
+        with open(os.path.join(self.path, "header.json"), "r") as f:
+            header = json.load(f)
+        if header["capacity"] != self.capacity:
+            raise ValueError(
+                f"table at {self.path} has capacity {header['capacity']}, expected {self.capacity}"
+            )
+        self.segment_size = header["segment_size"]
+        # files of row flags are prefixed with an underscore, see `add_batch`
+        self.data, self.meta = (
+            {
+                k: SegmentedColumn(
+                    self.path,
+                    prefix + k,
+                    self.capacity,
+                    self.segment_size,
+                    column["shape"],
+                    column["dtype"],
+                )
+                for k, column in header[section].items()
+            }
+            for section, prefix in (("columns", ""), ("meta", "_"))
+        )
+        self.codecs.update(
+            {k: make_codec(codec) for k, codec in header.get("codecs", {}).items()}
+        )
+        for k in header.get("objects", []):
+            # object columns are pickled in snapshots only, see `save`
+            self.data[k] = self._load_objects(self.path, k, header["size"])
+        self.flag = header["flag"]
+        self.size = header["size"]
+        self._version = (0, self.flag, 0)
+        return header
+
+    def _header(self, snapshot: bool = False) -> Dict[str, Any]:
+        """Return the header of file-backed columns, which is persisted after insertions, see `_commit_header`.
+
+        Args:
+            snapshot (bool, optional): Describe in-memory columns too, for snapshots. Defaults to False.
+
+        Returns:
+            Dict[str, Any]: The header.
+        """
+
+        def _in_files(v) -> bool:
+            return isinstance(v, SegmentedColumn) or (
+                snapshot and not v.dtype.hasobject
+            )
+
+        header = {
+            "capacity": self.capacity,
+            "segment_size": self.segment_size,
+            "flag": self.flag,
+            "size": self.size,
+            **{
+                section: {
+                    k: {"shape": list(v.shape[1:]), "dtype": v.dtype.str}
+                    for k, v in columns.items()
+                    if _in_files(v)
+                }
+                for section, columns in (("columns", self.data), ("meta", self.meta))
+            },
+            "codecs": {
+                k: codec.state_dict()
+                for k, codec in self.codecs.items()
+                if codec.shape is not None
+            },
+        }
+        if snapshot:
+            header["objects"] = [k for k, v in self.data.items() if not _in_files(v)]
+        return header
+
+    def _commit_header(self):
+        """Write the header of file-backed columns atomically."""
+
+        header = self._header()
+        filename = os.path.join(self.path, "header.json")
+        with open(filename + ".tmp", "w") as f:
+            json.dump(header, f)
+        os.replace(filename + ".tmp", filename)
+        self._header_time = time.time()
+        self._header_dirty = False
+
+    def _touch_header(self):
+        """Write the header after an insertion, unless it has been written within `header_interval` seconds."""
+
+        self._header_dirty = True
+        if time.time() - self._header_time >= self.header_interval:
+            self._commit_header()
+
+    def flush(self):
+        """Flush file-backed columns and the pending header to the disk."""
+
+        for column in list(self.data.values()) + list(self.meta.values()):
+            if isinstance(column, SegmentedColumn):
+                column.flush()
+        if self.path is not None and self._header_dirty:
+            self._commit_header()
+
+    def _load_objects(self, path: str, key: str, size: int) -> np.ndarray:
+        column = np.empty(self.capacity, dtype=object)
+        with open(os.path.join(path, f"{key}.pkl"), "rb") as f:
+            column[:size] = pickle.load(f)
+        return column
+
+    def save(self, path: str, max_workers: int = None):
+        """Write a snapshot of the table to `path`, in the layout of disk-backed tables, i.e., `.npy` segment \
+            files of `segment_size` rows for each column and a header. Only segments holding the stored rows \
+            are written, and columns are written in parallel. Object columns are pickled.
+
+        Args:
+            path (str): The snapshot directory.
+            max_workers (int, optional): The maximum of writing threads. Defaults to None.
+        """
+
+        os.makedirs(path, exist_ok=True)
+        size, segment_size = self.size, self.segment_size
+
+        def _write(key: str, column: np.ndarray):
+            if column.dtype.hasobject:
+                with open(os.path.join(path, f"{key}.pkl"), "wb") as f:
+                    pickle.dump(column[:size], f)
+                return
+            for i, begin in enumerate(range(0, size, segment_size)):
+                rows = min(segment_size, self.capacity - begin)
+                segment = np.lib.format.open_memmap(
+                    os.path.join(path, f"{key}.{i}.npy"),
+                    mode="w+",
+                    dtype=column.dtype,
+                    shape=(rows,) + tuple(column.shape[1:]),
+                )
+                n = min(segment_size, size - begin)
+                segment[:n] = column[begin : begin + n]
+                segment.flush()
+                del segment
+
+        columns = list(self.data.items()) + [(f"_{k}", v) for k, v in self.meta.items()]
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            list(pool.map(lambda kv: _write(*kv), columns))
+
+        filename = os.path.join(path, "header.json")
+        with open(filename + ".tmp", "w") as f:
+            json.dump(self._header(snapshot=True), f)
+        os.replace(filename + ".tmp", filename)
+
+    def load(self, path: str, max_workers: int = None) -> Dict[str, Any]:
+        """Replace the contents of the table with a snapshot written by `save`. Segment files are \
+            memory-mapped and copied into the columns segment by segment, columns are loaded in parallel.
+
+        Note:
+            Readers which sample during loading resample their rows, but the caller should make sure that \
+                no writer is inserting.
+
+        Args:
+            path (str): The snapshot directory.
+            max_workers (int, optional): The maximum of loading threads. Defaults to None.
+
+        Raises:
+            ValueError: The capacity of the snapshot differs from the table capacity.
+
+        Returns:
+            Dict[str, Any]: The header of the snapshot.
+        """
+
+        with open(os.path.join(path, "header.json"), "r") as f:
+            header = json.load(f)
+        if header["capacity"] != self.capacity:
+            raise ValueError(
+                f"snapshot at {path} has capacity {header['capacity']}, expected {self.capacity}"
+            )
+        size, segment_size = header["size"], header["segment_size"]
+
+        def _read(key: str, layout: Dict[str, Any]) -> np.ndarray:
+            column = self._allocate(
+                key, np.empty([0] + layout["shape"], dtype=layout["dtype"])
+            )
+            for i, begin in enumerate(range(0, size, segment_size)):
+                segment = np.load(os.path.join(path, f"{key}.{i}.npy"), mmap_mode="r")
+                n = min(segment_size, size - begin)
+                column[begin : begin + n] = segment[:n]
+            return column
+
+        tasks = [(k, layout) for k, layout in header["columns"].items()] + [
+            (f"_{k}", layout) for k, layout in header["meta"].items()
+        ]
+        # all rows are treated as overwritten by readers, see `_overwritten`
+        seq, offset, length = self._version
+        self._version = (seq + 1, offset + length, self.capacity)
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            columns = dict(
+                zip([k for k, _ in tasks], pool.map(lambda t: _read(*t), tasks))
+            )
+        data = {k: columns[k] for k in header["columns"]}
+        for k in header.get("objects", []):
+            data[k] = self._load_objects(path, k, size)
+        self.data = data
+        self.meta = {k: columns[f"_{k}"] for k in header["meta"]}
+        self.codecs = {
+            k: make_codec(codec) for k, codec in header.get("codecs", {}).items()
+        }
+        self.flag = header["flag"]
+        self.size = size
+        # the next insertion continues from the loaded cursor
+        total = offset + length
+        self._version = (
+            seq + 2,
+            total + (self.flag - total) % self.capacity,
+            self.capacity,
+        )
+        if self.path is not None:
+            self._commit_header()
+        return header
+
+    def _insert_slices(self, n: int) -> List[Tuple[slice, slice]]:
+        """Compute the destination and source slices for inserting `n` rows at the current cursor.
+
+        Args:
+            n (int): The number of rows to insert, should not be greater than the capacity.
+
+        Returns:
+            List[Tuple[slice, slice]]: A list of (table slice, batch slice), at most two elements when the \
+                insertion wraps around.
+        """
+
+        head = min(n, self.capacity - self.flag)
+        slices = [(slice(self.flag, self.flag + head), slice(0, head))]
+        if head < n:
+            slices.append((slice(0, n - head), slice(head, n)))
+        return slices
+
+    def add_batch(self, data: Dict[str, np.ndarray]) -> np.ndarray:
+        """Insert a batch of transitions at the cursor. Rows beyond the capacity overwrite the oldest ones.
+
+        Args:
+            data (Dict[str, np.ndarray]): A dict of columns, all columns should have the same length.
+
+        Returns:
+            np.ndarray: Table indices of the inserted rows.
+        """
+
         any_v = list(data.values())[0]
-        shift = min(0, self.capacity - any_v.shape[0] - self.flag)
+        n = any_v.shape[0]
+        for k, v in data.items():
+            assert v.shape[0] == n, (any_v.shape, v.shape, k)
+
+        data = self._transform(data)
 
+        if n > self.capacity:
+            # only the last `capacity` rows survive an oversized insertion, and the
+            # cursor moves as if all rows had been written one by one
+            data = {k: v[n - self.capacity :] for k, v in data.items()}
+            self.flag = (self.flag + n - self.capacity) % self.capacity
+            seq, offset, length = self._version
+            self._version = (seq, offset + length + n - self.capacity, 0)
+            n = self.capacity
+
+        seq, offset, length = self._version
+        self._version = (seq + 1, offset + length, n)
+
+        slices = self._insert_slices(n)
+        flags = self._row_flags(data, n)
+        data = {
+            k: self.codecs[k].encode(v) if k in self.codecs else v
+            for k, v in data.items()
+        }
         for k, v in data.items():
             if k not in self.data:
-                self.data[k] = np.zeros((self.capacity,) + v.shape[1:], dtype=v.dtype)
-            assert v.shape[0] == any_v.shape[0], (any_v.shape, v.shape, k)
-            self.data[k] = np.roll(self.data[k], shift=shift, axis=0)
-            self.data[k][self.flag + shift : self.flag + shift + v.shape[0]] = v
+                # replace the dict instead of inserting a key, as readers may be iterating it
+                self.data = {**self.data, k: self._allocate(k, v)}
+            column = self.data[k]
+            for dst, src in slices:
+                column[dst] = v[src]
+        for k, v in flags.items():
+            if k not in self.meta:
+                self.meta[k] = self._allocate(f"_{k}", v)
+            for dst, src in slices:
+                self.meta[k][dst] = v[src]
+
+        indices = (self.flag + np.arange(n)) % self.capacity
+        # cursor and size are committed after the rows have been written
+        self.flag = (self.flag + n) % self.capacity
+        self.size = min(self.size + n, self.capacity)
+        self._version = (seq + 2,) + self._version[1:]
+        if self.path is not None:
+            self._touch_header()
+        return indices
+
+    def _transform(self, data: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        """Drop ignored next-step columns, and keep only the last frame of observations if required.
+
+        Args:
+            data (Dict[str, np.ndarray]): A dict of columns.
+
+        Returns:
+            Dict[str, np.ndarray]: A dict of columns to store.
+        """
+
+        if self.ignore_obs_next:
+            data = {
+                k: v
+                for k, v in data.items()
+                if not (k in NEXT_KEYS and NEXT_KEYS[k] in data)
+            }
+        if self.save_only_last_obs:
+            data = {
+                k: v[:, -1] if k in (Episode.CUR_OBS, Episode.NEXT_OBS) else v
+                for k, v in data.items()
+            }
+        return data
+
+    def _row_flags(self, data: Dict[str, np.ndarray], n: int) -> Dict[str, np.ndarray]:
+        """Compute per-row flags of a batch of whole episodes.
+
+        Args:
+            data (Dict[str, np.ndarray]): A dict of columns.
+            n (int): The number of rows.
 
-        self.flag = (self.flag + shift + any_v.shape[0]) % self.capacity
-        self.size = min(self.size + any_v.shape[0], self.capacity)
+        Returns:
+            Dict[str, np.ndarray]: A dict of flags, `end` for episode ends, and `valid` for valid window \
+                starts if `sample_avail` is enabled.
+        """
+
+        end = np.zeros(n, dtype=bool)
+        if Episode.DONE in data:
+            end |= np.asarray(data[Episode.DONE]).reshape(n, -1).any(axis=1)
+        end[-1] = True
+        flags = {"end": end}
+
+        if self.sample_avail and self.stack_num > 1:
+            # a window is valid if its first `stack_num - 1` steps do not end an episode
+            n_ends = np.concatenate([[0], np.cumsum(end)])
+            starts = np.arange(max(n - self.stack_num + 1, 0))
+            valid = np.zeros(n, dtype=bool)
+            valid[starts] = n_ends[starts + self.stack_num - 1] == n_ends[starts]
+            flags["valid"] = valid
+        return flags
+
+    @property
+    def version(self) -> int:
+        """The number of committed insertions."""
+
+        return self._version[0] // 2
+
+    def _overwritten(
+        self,
+        begin: Tuple[int, int, int],
+        end: Tuple[int, int, int],
+        indices: np.ndarray,
+    ) -> np.ndarray:
+        """Determine which rows may have been overwritten while they were being read.
+
+        Args:
+            begin (Tuple[int, int, int]): Version before reading.
+            end (Tuple[int, int, int]): Version after reading.
+            indices (np.ndarray): Indices of the read rows.
+
+        Returns:
+            np.ndarray: A boolean mask of rows to read again.
+        """
+
+        if begin[0] == end[0] and begin[0] % 2 == 0:
+            return np.zeros(np.shape(indices), dtype=bool)
+        # insertions are sequential, so the rows written since `begin` are contiguous in the ring
+        start = begin[1] if begin[0] % 2 else begin[1] + begin[2]
+        length = end[1] + end[2] - start
+        if length >= self.capacity:
+            return np.ones(np.shape(indices), dtype=bool)
+        return (indices - start) % self.capacity < length
+
+    def sample_indices(self, batch_size: int) -> Sequence[int]:
+        indices = np.random.randint(0, self.size, size=batch_size)
+        if self.sample_avail and self.stack_num > 1:
+            # rejection sampling with precomputed valid starts
+            for _ in range(16):
+                invalid = ~self.meta["valid"][indices]
+                if not invalid.any():
+                    break
+                indices[invalid] = np.random.randint(
+                    0, self.size, size=int(invalid.sum())
+                )
+            else:
+                # valid starts are rare, draw the rest from them directly, or mask their windows if there are none
+                invalid = ~self.meta["valid"][indices]
+                valid_starts = np.flatnonzero(self.meta["valid"][: self.size])
+                if invalid.any() and len(valid_starts) > 0:
+                    indices[invalid] = np.random.choice(
+                        valid_starts, size=int(invalid.sum())
+                    )
+        return indices
+
+    def _window(self, starts: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Map start indices to windows of `stack_num` steps which stop at episode ends.
+
+        Args:
+            starts (np.ndarray): Start indices with shape `[batch_size]`.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: A tuple of row indices and masks, with shape `[batch_size, stack_num]`.
+        """
+
+        steps = np.arange(self.stack_num)
+        ends = self.meta["end"][(starts[:, None] + steps) % self.capacity]
+        last = np.where(ends.any(axis=1), ends.argmax(axis=1), self.stack_num - 1)
+        indices = (starts[:, None] + np.minimum(steps, last[:, None])) % self.capacity
+        return indices, steps <= last[:, None]
+
+    def _gather(self, indices: np.ndarray) -> Dict[str, np.ndarray]:
+        """Gather and decode rows, and reconstruct ignored next-step columns from the next rows.
+
+        Args:
+            indices (np.ndarray): Row indices.
+
+        Returns:
+            Dict[str, np.ndarray]: A dict of columns.
+        """
+
+        def _read(k: str, indices: np.ndarray) -> np.ndarray:
+            v = self.data[k][indices]
+            return self.codecs[k].decode(v) if k in self.codecs else v
+
+        samples = {k: _read(k, indices) for k in self.data}
+        if self.ignore_obs_next:
+            ends = self.meta["end"][indices]
+            next_indices = np.where(ends, indices, (indices + 1) % self.capacity)
+            for next_key, key in NEXT_KEYS.items():
+                if key in self.data and next_key not in self.data:
+                    samples[next_key] = _read(key, next_indices)
+        return samples
+
+    def sample(self, batch_size: int) -> Tuple[Batch, np.ndarray]:
+        """Sample a batch of transitions, or windows if `stack_num` is greater than 1.
+
+        Args:
+            batch_size (int): Batch size.
+
+        Returns:
+            Tuple[Batch, np.ndarray]: A tuple of batch and row indices. For windows, the batch includes \
+                `mask`, and both the batch and indices have the shape `[batch_size, stack_num, ...]`.
+        """
+
+        def _sample(n: int):
+            indices, mask = np.asarray(self.sample_indices(n)), None
+            if self.stack_num > 1:
+                indices, mask = self._window(indices)
+            return indices, mask, self._gather(indices)
+
+        def _stale(begin, indices):
+            stale = self._overwritten(begin, self._version, indices)
+            return stale.reshape(len(indices), -1).any(axis=1)
+
+        begin = self._version
+        indices, mask, samples = _sample(batch_size)
+        # fast path, no insertion was in progress or committed while reading
+        end = self._version
+        stale = None if end == begin and end[0] % 2 == 0 else _stale(begin, indices)
+        while stale is not None and stale.any():
+            begin = self._version
+            resampled, resampled_mask, resamples = _sample(int(stale.sum()))
+            for k in samples:
+                samples[k][stale] = resamples[k]
+            indices[stale] = resampled
+            if mask is not None:
+                mask[stale] = resampled_mask
+            stale[stale] = _stale(begin, resampled)
+
+        batch = Batch(samples)
+        if mask is not None:
+            batch["mask"] = mask
+        return batch, indices
+
+    def sample_many(self, k: int, batch_size: int) -> Any:
+        """Sample `k` batches at once with a single gather, so that the costs of locking and transferring \
+            are shared by `k` training steps. Use `iter_batch_info` to iterate the batches.
+
+        Args:
+            k (int): The number of batches.
+            batch_size (int): Batch size.
+
+        Returns:
+            Any: Batch info as `sample` returns, with arrays of shape `[k, batch_size, ...]`.
+        """
+
+        return split_batch_info(self.sample(k * batch_size), k)
+
+
+class PrioritizedReplayBuffer(ReplayBuffer):
+    # segment trees are updated by both the writer and priority updates
+    lock_free = False
+
+    def __init__(
+        self,
+        size: int,
+        alpha: float = 0.6,
+        beta: float = 0.4,
+        stack_num: int = 1,
+        ignore_obs_next: bool = False,
+        save_only_last_obs: bool = False,
+        sample_avail: bool = False,
+        **kwargs,
+    ) -> None:
+        """Construct a prioritized replay buffer. Priorities are maintained with a sum tree and a min tree, \
+            so that both sampling and priority updating cost O(log size) per item. Sampled batches include \
+            importance sampling weights with key `weight`. With `sample_avail`, invalid window starts are kept \
+            with zero priorities, so they are never sampled.
+
+        Args:
+            size (int): Table capacity.
+            alpha (float, optional): Priority exponent, 0 for uniform sampling. Defaults to 0.6.
+            beta (float, optional): Importance sampling exponent, 1 for full compensation. Defaults to 0.4.
+        """
+
+        super().__init__(
+            size, stack_num, ignore_obs_next, save_only_last_obs, sample_avail, **kwargs
+        )
+        assert alpha > 0.0 and beta >= 0.0, (alpha, beta)
+        self.alpha = alpha
+        self.beta = beta
+        self._eps = np.finfo(np.float32).eps.item()
+        self._reset_priorities()
+
+    def _reset_priorities(self):
+        self._max_prio = 1.0
+        self._sum_tree = SumSegmentTree(self.capacity)
+        self._min_tree = MinSegmentTree(self.capacity)
+        if self.size > 0:
+            # priorities are not persisted, rows of a reopened table start with the maximum priority
+            self._set_priorities(np.arange(self.size), self._max_prio**self.alpha)
+
+    def _set_priorities(self, indices: np.ndarray, weight: Union[float, np.ndarray]):
+        """Write (exponentiated) priorities into the trees. Invalid window starts get zero priorities in the \
+            sum tree, and are left out of the min tree.
+
+        Args:
+            indices (np.ndarray): Row indices.
+            weight (Union[float, np.ndarray]): Exponentiated priorities.
+        """
+
+        weight = np.broadcast_to(
+            np.asarray(weight, dtype=np.float64), np.shape(indices)
+        )
+        if self.sample_avail and self.stack_num > 1:
+            valid = self.meta["valid"][indices]
+            self._sum_tree[indices] = np.where(valid, weight, 0.0)
+            self._min_tree[indices] = np.where(valid, weight, np.inf)
+        else:
+            self._sum_tree[indices] = weight
+            self._min_tree[indices] = weight
+
+    def set_beta(self, beta: float):
+        self.beta = beta
+
+    def total_priority(self) -> float:
+        """Return the sum of (exponentiated) priorities, i.e., the sampling mass of this buffer."""
+
+        return float(self._sum_tree.reduce())
+
+    def min_priority(self) -> float:
+        """Return the minimum (exponentiated) priority, which normalizes importance sampling weights."""
+
+        return float(self._min_tree.reduce())
+
+    def load(self, path: str, max_workers: int = None) -> Dict[str, Any]:
+        header = super().load(path, max_workers)
+        self._reset_priorities()
+        return header
+
+    def add_batch(self, data: Dict[str, np.ndarray]) -> np.ndarray:
+        indices = super().add_batch(data)
+        # new transitions are assigned with the maximum priority
+        self._set_priorities(indices, self._max_prio**self.alpha)
+        return indices
 
     def sample_indices(self, batch_size: int) -> Sequence[int]:
-        indices = np.random.choice(self.size, batch_size)
+        total = self._sum_tree.reduce()
+        if total <= 0.0:
+            # no valid window starts, windows are masked as uniform tables do
+            return super().sample_indices(batch_size)
+        scalar = np.random.rand(batch_size) * total
+        indices = np.minimum(self._sum_tree.get_prefix_sum_idx(scalar), self.size - 1)
+        if self.sample_avail and self.stack_num > 1:
+            # zero-priority starts are hit only by rounding at the boundaries
+            invalid = ~self.meta["valid"][indices]
+            if invalid.any():
+                valid_starts = np.flatnonzero(self.meta["valid"][: self.size])
+                indices[invalid] = np.random.choice(
+                    valid_starts, size=int(invalid.sum())
+                )
         return indices
 
+    def get_weight(self, indices: Sequence[int]) -> np.ndarray:
+        """Compute importance sampling weights, normalized by the maximum weight.
+
+        Args:
+            indices (Sequence[int]): Sampled indices.
+
+        Returns:
+            np.ndarray: An array of weights.
+        """
+
+        min_prio = self._min_tree.reduce()
+        if not np.isfinite(min_prio):
+            # nothing could be sampled by priority, see `sample_indices`
+            return np.ones(np.shape(indices))
+        return (self._sum_tree[indices] / min_prio) ** (-self.beta)
+
     def sample(self, batch_size: int) -> Tuple[Batch, List[int]]:
-        indices = self.sample_indices(batch_size)
-        samples = {k: v[indices] for k, v in self.data.items()}
-        return Batch(samples), indices
+        batch, indices = super().sample(batch_size)
+        # windows are weighted by their start steps
+        starts = indices if indices.ndim == 1 else indices[:, 0]
+        batch["weight"] = self.get_weight(starts).astype(np.float32)
+        return batch, indices
+
+    def update_priorities(self, indices: Sequence[int], td_errors: np.ndarray):
+        """Update priorities with the absolute value of given TD errors. Windows sampled with `stack_num` \
+            greater than 1 are prioritized by their start steps, so for indices of shape `[batch_size, stack_num]`, \
+            TD errors could be given per window with shape `[batch_size]`, or per step with shape \
+            `[batch_size, stack_num]`, which are reduced by the maximum over steps. Masked steps repeat the \
+            last valid step, so they do not change the maximum.
+
+        Args:
+            indices (Sequence[int]): Indices of sampled transitions, or windows.
+            td_errors (np.ndarray): TD errors, should have the same length as indices.
+        """
+
+        indices = np.asarray(indices)
+        priorities = np.abs(np.asarray(td_errors, dtype=np.float64))
+        if indices.ndim == 2:
+            priorities = priorities.reshape(len(indices), -1).max(axis=1)
+            indices = indices[:, 0]
+        priorities = priorities.reshape(-1) + self._eps
+        self._set_priorities(indices, priorities**self.alpha)
+        self._max_prio = max(self._max_prio, priorities.max())
 
 
 class MultiagentReplayBuffer(ReplayBuffer):
@@ -126,39 +1187,242 @@ class MultiagentReplayBuffer(ReplayBuffer):
         ignore_obs_next: bool = False,
         save_only_last_obs: bool = False,
         sample_avail: bool = False,
-        **kwargs
+        **kwargs,
     ) -> None:
+        """Construct a joint multi-agent table. Agents share one cursor, and each column is laid out as \
+            `[capacity, n_agents, ...]`, so a sample draws indices once and gathers aligned joint transitions \
+            of all agents. Agents are ordered by their ids.
+
+        Args:
+            size (int): Table capacity.
+            stack_num (int, optional): Indicates how many steps are stacked in a single data sample. Defaults to 1.
+            ignore_obs_next (bool, optional): Ignore the next observation or not. Defaults to False.
+            save_only_last_obs (bool, optional): Either save only the last observation frame. Defaults to False.
+            sample_avail (bool, optional): Sample only windows which are fully inside episodes. Defaults to False.
+        """
+
+        # agent order of the agent axis, restored with the header for disk-backed tables
+        self.agents: List[str] = []
         super().__init__(
             size, stack_num, ignore_obs_next, save_only_last_obs, sample_avail, **kwargs
         )
 
-        self.data = defaultdict(
-            lambda: ReplayBuffer(
-                size=size,
-                stack_num=stack_num,
-                ignore_obs_next=ignore_obs_next,
-                save_only_last_obs=save_only_last_obs,
-                sample_avail=sample_avail,
-                **kwargs
+    def _restore(self) -> Dict[str, Any]:
+        header = super()._restore()
+        self.agents = header["agents"]
+        return header
+
+    def _header(self, snapshot: bool = False) -> Dict[str, Any]:
+        return {**super()._header(snapshot), "agents": self.agents}
+
+    def load(self, path: str, max_workers: int = None) -> Dict[str, Any]:
+        header = super().load(path, max_workers)
+        self.agents = header["agents"]
+        return header
+
+    def _transform(self, data: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        # agent data have been transformed before stacking
+        return data
+
+    def add_batch(self, data: Dict[str, Dict[str, np.ndarray]]) -> np.ndarray:
+        """Insert a batch of joint transitions. Each agent should provide the same columns and length.
+
+        Args:
+            data (Dict[str, Dict[str, np.ndarray]]): A dict of agent columns, mapping from agent ids.
+
+        Returns:
+            np.ndarray: Table indices of the inserted rows.
+        """
+
+        if not self.agents:
+            self.agents = sorted(data.keys())
+        assert sorted(data.keys()) == self.agents, (list(data.keys()), self.agents)
+
+        agent_data = [
+            super(MultiagentReplayBuffer, self)._transform(data[agent])
+            for agent in self.agents
+        ]
+        joint = {
+            k: np.stack([_data[k] for _data in agent_data], axis=1)
+            for k in agent_data[0]
+        }
+        return super().add_batch(joint)
+
+    def sample_joint(self, batch_size: int) -> Tuple[Batch, np.ndarray]:
+        """Sample a batch of joint transitions, whose columns have an agent axis after the batch (and window) axis.
+
+        Args:
+            batch_size (int): Batch size.
+
+        Returns:
+            Tuple[Batch, np.ndarray]: A tuple of joint batch and indices.
+        """
+
+        return super().sample(batch_size)
+
+    def sample(self, batch_size: int) -> Dict[str, Tuple[Batch, np.ndarray]]:
+        batch, indices = self.sample_joint(batch_size)
+        # agent batches are views of the joint batch, `mask` and `weight` have no agent axis
+        axis = (slice(None),) * indices.ndim
+        return {
+            agent: (
+                Batch(
+                    {
+                        k: v if k in ("mask", "weight") else v[axis + (i,)]
+                        for k, v in batch.items()
+                    }
+                ),
+                indices,
             )
-        )
+            for i, agent in enumerate(self.agents)
+        }
+
 
-    def add_batch(self, data: Dict[str, Dict[str, np.ndarray]]):
-        for agent, _data in data.items():
-            self.data[agent].add_batch(_data)
+class FIFOReplayBuffer(ReplayBuffer):
+    # consumption moves the read cursor, so readers are exclusive with the writer
+    lock_free = False
 
-        size_candidates = set()
-        for e in self.data.values():
-            size_candidates.add(e.size)
-        assert len(size_candidates) == 1, (
-            size_candidates,
-            {k: v.size for k, v in self.data.items()},
+    def __init__(
+        self,
+        size: int,
+        stack_num: int = 1,
+        ignore_obs_next: bool = False,
+        save_only_last_obs: bool = False,
+        sample_avail: bool = False,
+        episodic: bool = False,
+        max_staleness: int = None,
+        **kwargs,
+    ) -> None:
+        """Construct a FIFO table for on-policy learning. `sample` consumes the oldest unconsumed rows in \
+            insertion order, so that each row is handed out exactly once, and `len` counts unconsumed rows. \
+            Unconsumed rows which are overwritten are dropped.
+
+        Note:
+            Rows could be tagged with the weights version of their behavior policy in the column \
+                `Episode.POLICY_VERSION`, as inference servers do. If `max_staleness` is given, rows whose \
+                versions are more than `max_staleness` behind the current version are dropped at \
+                consumption. The current version is the learner version given by `set_learner_version`, or \
+                the newest inserted version if it is newer.
+
+        Args:
+            size (int): Table capacity.
+            episodic (bool, optional): Consume whole episodes, i.e., as many whole episodes as `batch_size` \
+                rows hold, or the first episode if it is longer. Defaults to False.
+            max_staleness (int, optional): The maximum of version lag, None for keeping all rows. \
+                Defaults to None.
+        """
+
+        assert stack_num == 1, "FIFO tables do not support windows"
+        super().__init__(
+            size, stack_num, ignore_obs_next, save_only_last_obs, sample_avail, **kwargs
         )
-        self.size = list(self.data.values())[0].size
+        self.episodic = episodic
+        self.max_staleness = max_staleness
+        self.newest_version = -1
+        self.learner_version = -1
+        self.dropped = 0
+        self._consume_lock = threading.Lock()
+        self._reset_cursors()
 
-    def sample(self, batch_size: int) -> Dict[str, Tuple[Batch, List[int]]]:
-        agent_batch_tups = {
-            agent: data.sample(batch_size) for agent, data in self.data.items()
-        }
+    def _reset_cursors(self):
+        # cursors count rows, a row at cursor `i` is stored at `i % capacity`. Stored rows of a
+        # reopened table are unconsumed
+        self.tail = (
+            self.size if self.size < self.capacity else self.flag + self.capacity
+        )
+        self.head = self.tail - self.size
+
+    def __len__(self):
+        return self.tail - self.head
+
+    def add_batch(self, data: Dict[str, np.ndarray]) -> np.ndarray:
+        n = list(data.values())[0].shape[0]
+        versions = data.get(Episode.POLICY_VERSION)
+        if versions is not None and len(versions) > 0:
+            self.newest_version = max(self.newest_version, int(np.max(versions)))
+        indices = super().add_batch(data)
+        with self._consume_lock:
+            self.tail += n
+            if self.tail - self.head > self.capacity:
+                self.dropped += self.tail - self.capacity - self.head
+                self.head = self.tail - self.capacity
+        return indices
+
+    def set_learner_version(self, version: int):
+        """Set the weights version of the learner, which the staleness of rows is measured against. Versions \
+            never decrease, older ones are ignored.
+
+        Args:
+            version (int): The learner version, e.g., the version returned by the parameter server.
+        """
+
+        self.learner_version = max(self.learner_version, int(version))
+
+    def _consume(self, batch_size: int) -> np.ndarray:
+        """Move the read cursor and return indices of consumed rows, stale rows are excluded.
+
+        Args:
+            batch_size (int): The maximum of rows, except for episodes longer than it in episodic mode.
+
+        Returns:
+            np.ndarray: Indices of consumed rows.
+        """
+
+        n = min(batch_size, len(self))
+        if self.episodic and n > 0:
+            # the last row of each insertion ends an episode, so there is at least one end
+            positions = (self.head + np.arange(len(self))) % self.capacity
+            ends = np.flatnonzero(self.meta["end"][positions])
+            within = ends[ends < batch_size]
+            n = int(within[-1] if len(within) else ends[0]) + 1
+        indices = (self.head + np.arange(n)) % self.capacity
+        self.head += n
+        if self.max_staleness is not None and Episode.POLICY_VERSION in self.data:
+            versions = self.data[Episode.POLICY_VERSION][indices].reshape(n, -1)[:, 0]
+            current = max(self.newest_version, self.learner_version)
+            fresh = versions >= current - self.max_staleness
+            self.dropped += int(n - fresh.sum())
+            indices = indices[fresh]
+        return indices
+
+    def sample(self, batch_size: int) -> Tuple[Batch, np.ndarray]:
+        """Consume at most `batch_size` rows in insertion order, the batch could be smaller if there are not \
+            enough unconsumed rows or stale rows are dropped.
+
+        Args:
+            batch_size (int): Batch size.
+
+        Returns:
+            Tuple[Batch, np.ndarray]: A tuple of batch and indices.
+        """
+
+        with self._consume_lock:
+            indices = self._consume(batch_size)
+        return Batch(self._gather(indices)), indices
+
+    def sample_many(self, k: int, batch_size: int) -> Any:
+        """Consume at most `k` batches at once, see `sample`. As batches are of variable sizes, the block is \
+            a tuple of a list of batches and a list of indices, which `iter_batch_info` iterates as well. \
+            Consumption stops once there are no unconsumed rows, so the block could hold fewer batches.
+
+        Args:
+            k (int): The maximum of batches.
+            batch_size (int): Batch size.
+
+        Returns:
+            Any: A tuple of a list of batches and a list of indices.
+        """
+
+        consumed = []
+        with self._consume_lock:
+            for _ in range(k):
+                if len(self) == 0:
+                    break
+                consumed.append(self._consume(batch_size))
+        return [Batch(self._gather(indices)) for indices in consumed], consumed
 
-        return agent_batch_tups
+    def load(self, path: str, max_workers: int = None) -> Dict[str, Any]:
+        header = super().load(path, max_workers)
+        with self._consume_lock:
+            self._reset_cursors()
+        return header
@@ -0,0 +1,134 @@
+# MIT License
+
+# Copyright (c) 2021 MARL @ SJTU
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from typing import Callable, Union
+
+import numpy as np
+
+
+class SegmentTree:
+    def __init__(
+        self,
+        size: int,
+        operation: Callable[[np.ndarray, np.ndarray], np.ndarray],
+        neutral_value: float,
+    ) -> None:
+        """Construct an array-based segment tree, which supports vectorized leaf updates and O(1) full-range reduction.
+
+        Args:
+            size (int): The number of leaves.
+            operation (Callable[[np.ndarray, np.ndarray], np.ndarray]): An element-wise and associative reduce \
+                operation, e.g., `np.add`.
+            neutral_value (float): The neutral element of the operation, e.g., 0 for `np.add`.
+        """
+
+        bound = 1
+        while bound < size:
+            bound *= 2
+        self._size = size
+        self._bound = bound
+        self._operation = operation
+        self._neutral_value = neutral_value
+        self._value = np.full(2 * bound, neutral_value, dtype=np.float64)
+
+    def __len__(self):
+        return self._size
+
+    def __getitem__(self, index: Union[int, np.ndarray]) -> Union[float, np.ndarray]:
+        return self._value[np.asarray(index) + self._bound]
+
+    def __setitem__(
+        self, index: Union[int, np.ndarray], value: Union[float, np.ndarray]
+    ):
+        """Update leaves and their ancestors, costs O(n log size) for n updated leaves.
+
+        Args:
+            index (Union[int, np.ndarray]): Leaf index or an array of leaf indices.
+            value (Union[float, np.ndarray]): New values.
+        """
+
+        index = np.asarray(index, dtype=np.int64).reshape(-1) + self._bound
+        self._value[index] = value
+        while index[0] > 1:
+            # duplicated parents are harmless, they receive the same value
+            index = index // 2
+            self._value[index] = self._operation(
+                self._value[2 * index], self._value[2 * index + 1]
+            )
+
+    def reduce(self, start: int = 0, end: int = None) -> float:
+        """Return the reduction of leaves in range [start, end).
+
+        Args:
+            start (int, optional): Start index. Defaults to 0.
+            end (int, optional): End index (exclusive). Defaults to None, i.e., the size of tree.
+
+        Returns:
+            float: Reduce result.
+        """
+
+        if start == 0 and (end is None or end >= self._size):
+            return self._value[1]
+        end = self._size if end is None else end
+        result = self._neutral_value
+        start, end = start + self._bound, end + self._bound
+        while start < end:
+            if start & 1:
+                result = self._operation(result, self._value[start])
+                start += 1
+            if end & 1:
+                end -= 1
+                result = self._operation(result, self._value[end])
+            start //= 2
+            end //= 2
+        return result
+
+
+class SumSegmentTree(SegmentTree):
+    def __init__(self, size: int) -> None:
+        super().__init__(size, np.add, 0.0)
+
+    def get_prefix_sum_idx(self, value: np.ndarray) -> np.ndarray:
+        """Find the smallest indices `i` that sum(tree[:i + 1]) > value, vectorized over the given values.
+
+        Args:
+            value (np.ndarray): An array of prefix sums, each should be in [0, tree.reduce()).
+
+        Returns:
+            np.ndarray: An array of leaf indices.
+        """
+
+        value = np.array(value, dtype=np.float64).reshape(-1)
+        index = np.ones(value.shape[0], dtype=np.int64)
+        while index[0] < self._bound:
+            index *= 2
+            left = self._value[index]
+            direct = left <= value
+            value -= left * direct
+            index += direct
+        # float error may lead to the leaves out of range
+        return np.minimum(index - self._bound, self._size - 1)
+
+
+class MinSegmentTree(SegmentTree):
+    def __init__(self, size: int) -> None:
+        super().__init__(size, np.minimum, float("inf"))
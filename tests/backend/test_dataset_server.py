@@ -39,6 +39,10 @@ from malib.backend.offline_dataset_server import (
     OfflineDataset,
     write_table,
     read_table,
+    resolve_batch_info,
+    coalesce_episodes,
+    EpisodeAccumulator,
+    FlowControlQueue,
 )
 
 
@@ -143,3 +147,460 @@ def test_offline_dataset():
     server.end_producer_pipe(name=pname)
 
     ray.shutdown()
+
+
+@pytest.mark.parametrize(
+    "prefetch_depth,zero_copy", [(0, False), (0, True), (2, False)]
+)
+def test_consumer_pipe_demand(prefetch_depth: int, zero_copy: bool):
+    if not ray.is_initialized():
+        ray.init()
+
+    server = OfflineDataset(table_capacity=1000)
+    server.start()
+
+    pname, pqueue = server.start_producer_pipe(name="test_consumer_pipe_demand")
+    pqueue.put_nowait_batch(
+        [{Episode.CUR_OBS: np.random.random((100, 3)), Episode.REWARD: np.zeros(100)}]
+    )
+    cname, cqueue = server.start_consumer_pipe(
+        name="test_consumer_pipe_demand",
+        batch_size=16,
+        prefetch_depth=prefetch_depth,
+        zero_copy=zero_copy,
+    )
+
+    if prefetch_depth == 0:
+        # request mode: nothing will be sampled without requests
+        time.sleep(1)
+        assert cqueue.qsize() == 0
+        server.request_samples(cname, 3)
+        for _ in range(3):
+            item = cqueue.get(timeout=30)
+            # zero-copy pipes send object references only
+            assert isinstance(item, list) == zero_copy
+            batch, indices = resolve_batch_info(item)
+            assert len(indices) == 16
+        time.sleep(1)
+        assert cqueue.qsize() == 0
+    else:
+        # prefetch mode: the number of buffered batches is bounded
+        deadline = time.time() + 30
+        while cqueue.qsize() < prefetch_depth and time.time() < deadline:
+            time.sleep(0.5)
+        time.sleep(1)
+        assert cqueue.qsize() == prefetch_depth
+
+    server.end_consumer_pipe(name=cname)
+    server.end_producer_pipe(name=pname)
+
+    ray.shutdown()
+
+
+def test_sharded_offline_dataset():
+    if not ray.is_initialized():
+        ray.init()
+
+    num_shards = 2
+    server = OfflineDataset(table_capacity=1000, num_shards=num_shards)
+    server.start()
+
+    pname, pqueue = server.start_producer_pipe(name="test_sharded_offline_dataset")
+    # sampling from empty shards fails as an empty table does
+    with pytest.raises(ValueError):
+        server.sample(pname, 8)
+    pqueue.put_nowait_batch(
+        [
+            {Episode.CUR_OBS: np.random.random((50, 3)), Episode.REWARD: np.zeros(50)}
+            for _ in range(8)
+        ]
+    )
+    deadline = time.time() + 30
+    while server.get_table_size(pname) < 400 and time.time() < deadline:
+        time.sleep(0.5)
+    assert server.get_table_size(pname) == 400
+
+    cname, cqueue = server.start_consumer_pipe(
+        name="test_sharded_offline_dataset", batch_size=64, prefetch_depth=0
+    )
+    server.request_samples(cname, 1)
+    batch, indices = resolve_batch_info(cqueue.get(timeout=30))
+    assert len(batch) == len(indices) == 64
+    # global indices are partitioned by shard capacity
+    assert np.all(indices < num_shards * server.shard_capacity)
+    server.end_consumer_pipe(name=cname)
+
+    # each item is a block of batches
+    cname, cqueue = server.start_consumer_pipe(
+        name="test_sharded_offline_dataset", batch_size=16, num_batches=4
+    )
+    batch, indices = resolve_batch_info(cqueue.get(timeout=30))
+    assert batch[Episode.CUR_OBS].shape == (4, 16, 3) and indices.shape == (4, 16)
+    server.end_consumer_pipe(name=cname)
+    server.end_producer_pipe(name=pname)
+
+    ray.shutdown()
+
+
+def test_persistent_offline_dataset(tmp_path):
+    if not ray.is_initialized():
+        ray.init()
+
+    name = "test_persistent_offline_dataset"
+    server = OfflineDataset(table_capacity=1000, dataset_dir=str(tmp_path))
+    pname, pqueue = server.start_producer_pipe(name=name)
+    pqueue.put_nowait_batch(
+        [{Episode.CUR_OBS: np.random.random((50, 3)), Episode.REWARD: np.zeros(50)}]
+    )
+    deadline = time.time() + 30
+    while server.get_table_size(pname) < 50 and time.time() < deadline:
+        time.sleep(0.5)
+    server.end_producer_pipe(name=pname)
+    expected = server.buffers[name].data[Episode.CUR_OBS][:50]
+
+    # a restarted dataset reopens the table
+    restarted = OfflineDataset(table_capacity=1000, dataset_dir=str(tmp_path))
+    pname, _ = restarted.start_producer_pipe(name=name)
+    assert restarted.get_table_size(pname) == 50
+    assert np.all(restarted.buffers[name].data[Episode.CUR_OBS][:50] == expected)
+    restarted.end_producer_pipe(name=pname)
+
+    ray.shutdown()
+
+
+def test_save_and_load_table(tmp_path):
+    if not ray.is_initialized():
+        ray.init()
+
+    name = "test_save_and_load_table"
+    server = OfflineDataset(table_capacity=1000)
+    pname, pqueue = server.start_producer_pipe(name=name)
+    pqueue.put_nowait_batch(
+        [{Episode.CUR_OBS: np.random.random((50, 3)), Episode.REWARD: np.zeros(50)}]
+    )
+    deadline = time.time() + 30
+    while server.get_table_size(pname) < 50 and time.time() < deadline:
+        time.sleep(0.5)
+    server.save_table(name, str(tmp_path / "snapshot"))
+    expected = server.buffers[name].data[Episode.CUR_OBS][:50]
+
+    # the writer keeps running after saving
+    pqueue.put_nowait_batch(
+        [{Episode.CUR_OBS: np.random.random((10, 3)), Episode.REWARD: np.zeros(10)}]
+    )
+    while server.get_table_size(pname) < 60 and time.time() < deadline:
+        time.sleep(0.5)
+    assert server.get_table_size(pname) == 60
+    server.end_producer_pipe(name=pname)
+
+    warm = OfflineDataset(table_capacity=1000)
+    for table_name, mmap in (("copied", False), ("mapped", True)):
+        warm.load_table(table_name, str(tmp_path / "snapshot"), mmap=mmap)
+        assert warm.get_table_size(table_name) == 50
+        assert np.all(warm.buffers[table_name].data[Episode.CUR_OBS][:50] == expected)
+
+    ray.shutdown()
+
+
+def test_ingest(tmp_path):
+    if not ray.is_initialized():
+        ray.init()
+
+    for i in range(3):
+        np.savez(
+            tmp_path / f"log_{i}.npz",
+            **{
+                Episode.CUR_OBS: np.full((100, 3), i, dtype=np.float32),
+                Episode.REWARD: np.full(100, i, dtype=np.float32),
+                Episode.DONE: np.arange(100) % 10 == 9,
+            },
+        )
+    server = OfflineDataset(table_capacity=1000)
+    report = server.ingest(
+        "test_ingest", str(tmp_path), chunk_size=32, num_readers=2, max_pending_chunks=2
+    )
+    assert report["files"] == 3 and report["rows"] == 300
+    assert server.get_table_size("test_ingest") == 300
+    buffer = server.buffers["test_ingest"]
+    assert np.all(np.bincount(buffer.data[Episode.REWARD][:300].astype(int)) == 100)
+    # next observations are completed within episodes
+    assert np.all(
+        buffer.data[Episode.NEXT_OBS][:300] == buffer.data[Episode.CUR_OBS][:300]
+    )
+    assert server.stats()["test_ingest"]["inserted"] == 300
+
+    ray.shutdown()
+
+
+def gen_episode(n: int):
+    return {
+        Episode.CUR_OBS: np.random.random((n, 3)),
+        Episode.DONE: np.arange(n) == n - 1,
+    }
+
+
+def test_coalesce_episodes():
+    # agent lists are flattened, and joint episodes are grouped by their layouts
+    blocks = coalesce_episodes(
+        [
+            [gen_episode(3), gen_episode(4)],
+            [gen_episode(5)],
+            {"a": gen_episode(2), "b": gen_episode(2)},
+            {"a": gen_episode(3), "b": gen_episode(3)},
+        ]
+    )
+    assert len(blocks) == 2
+    assert len(blocks[0][Episode.CUR_OBS]) == 12
+    assert np.sum(blocks[0][Episode.DONE]) == 3
+    assert (
+        len(blocks[1]["a"][Episode.CUR_OBS]) == len(blocks[1]["b"][Episode.DONE]) == 5
+    )
+
+
+def test_episode_accumulator():
+    if not ray.is_initialized():
+        ray.init()
+
+    writer = Queue(actor_options={"num_cpus": 0})
+    accumulator = EpisodeAccumulator(writer, max_rows=20, max_delay=60)
+    accumulator.add([gen_episode(8)])
+    accumulator.add([gen_episode(8)])
+    assert writer.qsize() == 0
+    # reach the row threshold
+    accumulator.add([gen_episode(8)])
+    accumulator.add([gen_episode(5)])
+    accumulator.flush(wait=True)
+    assert writer.qsize() == 2
+    assert len(writer.get()[Episode.CUR_OBS]) == 24
+    assert len(writer.get()[Episode.CUR_OBS]) == 5
+
+    writer.shutdown()
+    ray.shutdown()
+
+
+@pytest.mark.parametrize("policy", ["block", "drop_oldest", "downsample"])
+def test_flow_control_queue(policy: str):
+    if not ray.is_initialized():
+        ray.init()
+
+    queue = FlowControlQueue(maxsize=4, policy=policy, actor_options={"num_cpus": 0})
+    if policy == "block":
+        queue.put_nowait_batch(list(range(4)))
+        ref = queue.actor.put_nowait_batch.remote([4, 5])
+        ready, _ = ray.wait([ref], timeout=0.5)
+        assert len(ready) == 0
+        assert [queue.get(), queue.get()] == [0, 1]
+        ray.get(ref)
+        items = [queue.get() for _ in range(4)]
+        assert items == [2, 3, 4, 5]
+    else:
+        queue.put_nowait_batch(list(range(6)))
+        items = [queue.get() for _ in range(4)]
+        if policy == "drop_oldest":
+            assert items == [2, 3, 4, 5]
+        else:
+            assert items == sorted(items) and set(items) < set(range(6))
+    stats = queue.stats()
+    assert stats["depth"] == 0
+    assert stats["dropped"] == (0 if policy == "block" else 2)
+
+    queue.shutdown()
+    ray.shutdown()
+
+
+def test_dataset_stats_and_rate_limiter():
+    if not ray.is_initialized():
+        ray.init()
+
+    server = OfflineDataset(table_capacity=1000, writer_queue_size=8)
+    name, writer = server.start_producer_pipe(
+        name="test_rate_limiter", samples_per_insert=1.0, error_buffer=16
+    )
+
+    def wait_for_inserted(n):
+        for _ in range(30):
+            if server.get_table_size(name) >= n:
+                break
+            time.sleep(0.1)
+        return server.get_table_size(name)
+
+    writer.put_nowait_batch([gen_episode(10) for _ in range(3)])
+    # the third episode is held back until enough samples are taken
+    assert wait_for_inserted(30) == 20
+    server.sample(name, 8)
+    server.sample(name, 8)
+    assert wait_for_inserted(30) == 30
+
+    stats = server.stats()[name]
+    assert stats["inserted"] == 30 and stats["sampled"] == 16
+    assert stats["writer_queue_depth"] == 0 and stats["writer_queue_dropped"] == 0
+    assert stats["samples_per_insert"] == pytest.approx(16 / 30)
+    assert stats["insert_rate"] > 0 and stats["sample_rate"] > 0
+
+    server.end_producer_pipe(name)
+    ray.shutdown()
+
+
+def test_pause_rate_limited_writer(tmp_path):
+    if not ray.is_initialized():
+        ray.init()
+
+    server = OfflineDataset(table_capacity=1000)
+    name, writer = server.start_producer_pipe(
+        name="test_pause_rate_limited_writer", samples_per_insert=1.0, error_buffer=16
+    )
+    # a single item of three episodes, the third one is held back by the rate limiter
+    writer.put_nowait_batch([[gen_episode(10) for _ in range(3)]])
+    deadline = time.time() + 30
+    while server.get_table_size(name) < 20 and time.time() < deadline:
+        time.sleep(0.1)
+    time.sleep(0.5)
+    assert server.get_table_size(name) == 20
+
+    # pausing the writer inserts the episode in hand instead of dropping it
+    server.save_table(name, str(tmp_path / "snapshot"))
+    assert server.get_table_size(name) == 30
+    server.end_producer_pipe(name)
+
+    ray.shutdown()
+
+
+@pytest.mark.parametrize("num_shards", [1, 2])
+def test_fifo_consumer_blocks(num_shards: int):
+    if not ray.is_initialized():
+        ray.init()
+
+    server = OfflineDataset(table_capacity=1000, num_shards=num_shards)
+    name, writer = server.start_producer_pipe(
+        name="test_fifo_consumer_blocks", table_type="fifo"
+    )
+    writer.put_nowait_batch([gen_episode(10) for _ in range(4)])
+    deadline = time.time() + 30
+    while server.get_table_size(name) < 40 and time.time() < deadline:
+        time.sleep(0.1)
+
+    # blocks of batches of at most the batch size, consuming each row once
+    cname, cqueue = server.start_consumer_pipe(
+        name=name, batch_size=16, prefetch_depth=0, num_batches=4
+    )
+    server.request_samples(cname, 1)
+    batches, indices = cqueue.get(timeout=30)
+    consumed = np.concatenate(indices)
+    assert all(0 < len(i) <= 16 for i in indices)
+    assert len(np.unique(consumed)) == len(consumed)
+    assert len(consumed) + server.get_table_size(name) == 40
+    server.end_consumer_pipe(cname)
+    server.end_producer_pipe(name)
+
+    ray.shutdown()
+
+
+@pytest.mark.parametrize("num_shards", [1, 2])
+def test_fifo_learner_version(num_shards: int):
+    if not ray.is_initialized():
+        ray.init()
+
+    server = OfflineDataset(table_capacity=1000, num_shards=num_shards)
+    name, writer = server.start_producer_pipe(
+        name="test_fifo_learner_version", table_type="fifo", max_staleness=1
+    )
+    episodes = [gen_episode(10) for _ in range(4)]
+    for version, episode in enumerate(episodes):
+        episode[Episode.POLICY_VERSION] = np.full(10, version)
+    writer.put_nowait_batch(episodes)
+    deadline = time.time() + 30
+    while server.get_table_size(name) < 40 and time.time() < deadline:
+        time.sleep(0.1)
+
+    # rows more than one version behind the learner are dropped, on every shard
+    server.set_learner_version(name, 4)
+    versions = []
+    while server.get_table_size(name) > 0:
+        batch, _ = server.sample(name, 40)
+        versions.append(batch[Episode.POLICY_VERSION].reshape(-1))
+    versions = np.concatenate(versions)
+    assert len(versions) == 10 and np.all(versions == 3)
+    server.end_producer_pipe(name)
+
+    ray.shutdown()
+
+
+def test_sharded_rate_limiter():
+    if not ray.is_initialized():
+        ray.init()
+
+    server = OfflineDataset(table_capacity=1000, num_shards=2)
+    name, writer = server.start_producer_pipe(
+        name="test_sharded_rate_limiter", samples_per_insert=0.5, error_buffer=8
+    )
+    writer.put_nowait_batch([gen_episode(4) for _ in range(4)])
+    deadline = time.time() + 30
+    while server.get_table_size(name) < 16 and time.time() < deadline:
+        time.sleep(0.1)
+    assert server.get_table_size(name) == 16
+
+    # consumers of the router stop once 16 * 0.5 + 8 rows are sampled
+    cname, cqueue = server.start_consumer_pipe(
+        name=name, batch_size=8, prefetch_depth=8
+    )
+    deadline = time.time() + 30
+    while cqueue.qsize() < 3 and time.time() < deadline:
+        time.sleep(0.1)
+    time.sleep(1.0)
+    assert cqueue.qsize() == 3
+
+    # and resume with insertions
+    writer.put_nowait_batch([gen_episode(8) for _ in range(2)])
+    deadline = time.time() + 30
+    while cqueue.qsize() < 4 and time.time() < deadline:
+        time.sleep(0.1)
+    assert cqueue.qsize() >= 4
+    server.end_consumer_pipe(cname)
+    server.end_producer_pipe(name)
+
+    ray.shutdown()
+
+
+def test_sharded_prioritized_table():
+    if not ray.is_initialized():
+        ray.init()
+
+    server = OfflineDataset(table_capacity=1000, num_shards=2)
+    name, writer = server.start_producer_pipe(
+        name="test_sharded_prioritized_table", table_type="prioritized"
+    )
+    writer.put_nowait_batch([gen_episode(50) for _ in range(4)])
+    deadline = time.time() + 30
+    while server.get_table_size(name) < 200 and time.time() < deadline:
+        time.sleep(0.1)
+    assert server.get_table_size(name) == 200
+
+    # rows of the first shard get higher priorities
+    size = ray.get(server.shards[0].get_table_info.remote(name))["size"]
+    assert size > 0
+    server.update_priorities(name, np.arange(size), np.full(size, 8.0))
+    table = server.buffers[name]
+    table.refresh()
+    infos = ray.get([shard.get_table_info.remote(name) for shard in server.shards])
+    masses = np.asarray([info["total_priority"] for info in infos])
+
+    # shards are picked by priority mass rather than row count
+    batch, indices = server.sample(name, 4000)
+    from_first = indices < server.shard_capacity
+    assert abs(from_first.mean() - masses[0] / masses.sum()) < 0.05
+
+    # and weights are normalized by the global minimum priority
+    expected = (infos[0]["min_priority"] / infos[1]["min_priority"]) ** (
+        -infos[0]["beta"]
+    )
+    assert np.allclose(batch.weight[from_first], expected, rtol=1e-4)
+    assert np.allclose(batch.weight[~from_first], 1.0)
+
+    # shard infos are cached between reads
+    table.refresh_interval = 10.0
+    last_refresh = table.last_refresh
+    len(table)
+    assert table.last_refresh == last_refresh
+    server.end_producer_pipe(name)
+
+    ray.shutdown()
@@ -22,15 +22,28 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import os
+import time
+import threading
+
 import pytest
 import gym
 import numpy as np
 import torch
+import ray
 
 from gym import spaces
 
 from malib import rl
-from malib.backend.parameter_server import Table, ParameterServer
+from malib.backend.parameter_server import (
+    Table,
+    ParameterServer,
+    WeightPublisher,
+    RemoteOptimizer,
+    get_gradients,
+)
+from malib.utils.codecs import encode_weights, decode_weights
+from malib.utils.general import FlatStateDict, pack_state_dict, unpack_state_dict
 from malib.rl.common.policy import Policy
 from malib.common.strategy_spec import StrategySpec
 
@@ -79,7 +92,26 @@ def test_parameter_table(optim_config, policy_cls, rl_default_config):
             for _k, _v in v.items():
                 assert torch.all(_v == table_weights[k][_k]), (k, _k)
 
-    # TODO(ming): test gradient apply here, if the method has been implemented
+    # apply gradients computed on the set weights
+    if optim_config is None:
+        with pytest.raises(RuntimeError):
+            table.apply_gradients([], table.version)
+    else:
+        loss = sum(
+            param.sum()
+            for params in policy_copy.parameters().values()
+            for param in params
+        )
+        loss.backward()
+        ret = table.apply_gradients(get_gradients(policy_copy), table.version)
+        assert ret["accepted"] and ret["version"] == table.version == 2
+        changed = [
+            not torch.equal(_v, ret["weights"][k][_k])
+            for k, v in policy_copy.state_dict().items()
+            if isinstance(v, dict)
+            for _k, _v in v.items()
+        ]
+        assert any(changed)
 
 
 @pytest.mark.parametrize("optim_config", [None, {"type": "Adam", "lr": 1e-4}])
@@ -136,5 +168,561 @@ def test_parameter_server(optim_config, policy_cls, rl_default_config):
         state_dict=policy_copy.state_dict(),
     )
 
-    # retrive weights
-    server.get_weights(spec_id=strategy_spec.id, spec_policy_id="policy-1")
+    # retrive weights, the version counts weights updates
+    info = server.get_weights(spec_id=strategy_spec.id, spec_policy_id="policy-1")
+    assert info["version"] == 1
+
+    # conditional retrive, None for current callers
+    assert (
+        server.get_weights_if_newer(
+            spec_id=strategy_spec.id, spec_policy_id="policy-1", version=1
+        )
+        is None
+    )
+    info = server.get_weights_if_newer(
+        spec_id=strategy_spec.id, spec_policy_id="policy-1", version=0
+    )
+    assert info["version"] == 1 and info["weights"] is not None
+    versions = server.get_versions()
+    assert versions[f"{strategy_spec.id}/policy-1"] == 1
+    assert versions[f"{strategy_spec.id}/policy-0"] == 0
+    assert server.get_versions([f"{strategy_spec.id}/policy-2"]) == {
+        f"{strategy_spec.id}/policy-2": 0
+    }
+
+
+def test_weight_publisher():
+    if not ray.is_initialized():
+        ray.init()
+
+    server = ParameterServer.as_remote(num_cpus=0).remote()
+    observation_space = spaces.Box(low=-np.inf, high=np.inf, shape=(3,))
+    action_space = spaces.Discrete(2)
+    strategy_spec = StrategySpec(
+        identifier="test_weight_publisher",
+        policy_ids=["policy-0"],
+        meta_data={
+            "policy_cls": rl.dqn.DQNPolicy,
+            "kwargs": {
+                "observation_space": observation_space,
+                "action_space": action_space,
+                "model_config": rl.dqn.DEFAULT_CONFIG["model_config"],
+                "custom_config": rl.dqn.DEFAULT_CONFIG["custom_config"],
+                "kwargs": {},
+            },
+            "experiment_tag": "test_weight_publisher",
+        },
+    )
+    ray.get(server.create_table.remote(strategy_spec))
+
+    publisher = WeightPublisher(server, interval_steps=3)
+    weight = torch.zeros(64, 64)
+    for i in range(8):
+        weight.fill_(i)
+        publisher.step(strategy_spec.id, "policy-0", {"net": {"weight": weight}})
+    publisher.flush()
+    # pushes happen at every third step, and in-flight pushes are coalesced
+    assert publisher.num_pushes == 2 and 1 <= publisher.num_sent <= 2
+    info = ray.get(server.get_weights.remote(strategy_spec.id, "policy-0"))
+    assert torch.all(info["weights"]["net"]["weight"] == 5)
+    assert info["version"] == publisher.num_sent
+    assert publisher.versions[(strategy_spec.id, "policy-0")] == info["version"]
+
+    # the snapshot does not follow later in-place updates
+    publisher.push(strategy_spec.id, "policy-0", {"net": {"weight": weight}})
+    weight.fill_(-1)
+    publisher.flush()
+    info = ray.get(server.get_weights.remote(strategy_spec.id, "policy-0"))
+    assert torch.all(info["weights"]["net"]["weight"] == 7)
+
+    # packed state dicts are copied into reusable buffers as well
+    publisher.push(
+        strategy_spec.id, "policy-0", pack_state_dict({"net": {"w": weight}})
+    )
+    publisher.flush()
+    info = ray.get(server.get_weights.remote(strategy_spec.id, "policy-0"))
+    assert isinstance(info["weights"], FlatStateDict)
+    assert torch.all(unpack_state_dict(info["weights"])["net"]["w"] == -1)
+
+    ray.shutdown()
+
+
+@ray.remote(num_cpus=0)
+class _FlakyServer:
+    def __init__(self):
+        self.calls = 0
+        self.weights = None
+
+    def set_weights(self, spec_id, spec_policy_id, state_dict, base_version=0):
+        self.calls += 1
+        if self.calls == 1:
+            raise RuntimeError("transient failure")
+        self.weights = state_dict
+        return self.calls
+
+    def get_weights(self):
+        return self.weights
+
+
+def test_weight_publisher_failure():
+    if not ray.is_initialized():
+        ray.init()
+
+    server = _FlakyServer.remote()
+    publisher = WeightPublisher(server)
+    weight = torch.zeros(4)
+    publisher.push("spec", "policy-0", {"w": weight})
+    # the latest send failed
+    with pytest.raises(RuntimeError):
+        publisher.flush()
+    assert publisher.num_failed == 1 and publisher.num_sent == 0
+
+    # later pushes are still sent
+    for i in range(1, 6):
+        weight.fill_(i)
+        publisher.push("spec", "policy-0", {"w": weight})
+        publisher.flush()
+    assert publisher.num_sent == 5
+    assert torch.all(ray.get(server.get_weights.remote())["w"] == 5)
+
+    ray.shutdown()
+
+
+@ray.remote(num_cpus=0)
+class _Subscriber:
+    def __init__(self):
+        self.updates = []
+
+    def on_weights_update(self, spec_id, spec_policy_id, version, refs, *args):
+        self.updates.append((spec_policy_id, version, ray.get(refs[0])))
+
+    def get_updates(self):
+        return self.updates
+
+
+def _wait_updates(subscriber, n, timeout=10.0):
+    # pushes are sent by the server, they are not ordered with calls from the driver
+    deadline = time.time() + timeout
+    updates = ray.get(subscriber.get_updates.remote())
+    while len(updates) < n and time.time() < deadline:
+        time.sleep(0.05)
+        updates = ray.get(subscriber.get_updates.remote())
+    return updates
+
+
+def test_weight_subscription():
+    if not ray.is_initialized():
+        ray.init()
+
+    server = ParameterServer.as_remote(num_cpus=0).remote()
+    strategy_spec = StrategySpec(
+        identifier="test_weight_subscription",
+        policy_ids=["policy-0", "policy-1"],
+        meta_data={
+            "policy_cls": rl.dqn.DQNPolicy,
+            "kwargs": {
+                "observation_space": spaces.Box(low=-np.inf, high=np.inf, shape=(3,)),
+                "action_space": spaces.Discrete(2),
+                "model_config": rl.dqn.DEFAULT_CONFIG["model_config"],
+                "custom_config": rl.dqn.DEFAULT_CONFIG["custom_config"],
+                "kwargs": {},
+            },
+            "experiment_tag": "test_weight_subscription",
+        },
+    )
+    ray.get(server.create_table.remote(strategy_spec))
+
+    subscribers = [_Subscriber.remote() for _ in range(2)]
+    for subscriber in subscribers:
+        ray.get(server.subscribe.remote(strategy_spec.id, "policy-0", subscriber))
+        # repeated subscription is ignored
+        ray.get(server.subscribe.remote(strategy_spec.id, "policy-0", subscriber))
+
+    for i in range(3):
+        ray.get(server.set_weights.remote(strategy_spec.id, "policy-0", {"w": i}))
+    # tables without subscribers push nothing
+    ray.get(server.set_weights.remote(strategy_spec.id, "policy-1", {"w": -1}))
+
+    for subscriber in subscribers:
+        updates = _wait_updates(subscriber, 3)
+        assert [u[1] for u in updates] == [1, 2, 3]
+        assert updates[-1] == ("policy-0", 3, {"w": 2})
+
+    ray.get(server.unsubscribe.remote(strategy_spec.id, "policy-0", subscribers[0]))
+    ray.get(server.set_weights.remote(strategy_spec.id, "policy-0", {"w": 3}))
+    assert len(_wait_updates(subscribers[1], 4)) == 4
+    assert len(ray.get(subscribers[0].get_updates.remote())) == 3
+
+    ray.shutdown()
+
+
+def test_history_size():
+    strategy_spec = StrategySpec(
+        identifier="test_history_size",
+        policy_ids=["policy-0"],
+        meta_data={
+            "policy_cls": rl.dqn.DQNPolicy,
+            "kwargs": {
+                "observation_space": spaces.Box(low=-np.inf, high=np.inf, shape=(3,)),
+                "action_space": spaces.Discrete(2),
+                "model_config": rl.dqn.DEFAULT_CONFIG["model_config"],
+                "custom_config": rl.dqn.DEFAULT_CONFIG["custom_config"],
+                "kwargs": {},
+            },
+            "experiment_tag": "test_history_size",
+        },
+    )
+    # no extra copies unless deltas are pushed
+    assert ParameterServer().history_size == 0
+    assert ParameterServer(wire_format="delta").history_size == 4
+
+    server = ParameterServer()
+    server.create_table(strategy_spec)
+    weights = [{"w": torch.randn(8, 8)} for _ in range(3)]
+    server.set_weights(strategy_spec.id, "policy-0", weights[0])
+    # deltas against the latest version need no history
+    version = server.set_weights(
+        strategy_spec.id,
+        "policy-0",
+        encode_weights(weights[1], "delta", weights[0]),
+        base_version=1,
+    )
+    info = server.get_weights(strategy_spec.id, "policy-0")
+    assert version == 2 and torch.equal(info["weights"]["w"], weights[1]["w"])
+    with pytest.raises(ValueError):
+        server.set_weights(
+            strategy_spec.id,
+            "policy-0",
+            encode_weights(weights[2], "delta", weights[0]),
+            base_version=1,
+        )
+
+
+def test_weights_wire_format():
+    if not ray.is_initialized():
+        ray.init()
+
+    server = ParameterServer.as_remote(num_cpus=0).remote(history_size=2)
+    strategy_spec = StrategySpec(
+        identifier="test_weights_wire_format",
+        policy_ids=["policy-0"],
+        meta_data={
+            "policy_cls": rl.dqn.DQNPolicy,
+            "kwargs": {
+                "observation_space": spaces.Box(low=-np.inf, high=np.inf, shape=(3,)),
+                "action_space": spaces.Discrete(2),
+                "model_config": rl.dqn.DEFAULT_CONFIG["model_config"],
+                "custom_config": rl.dqn.DEFAULT_CONFIG["custom_config"],
+                "kwargs": {},
+            },
+            "experiment_tag": "test_weights_wire_format",
+        },
+    )
+    ray.get(server.create_table.remote(strategy_spec))
+    spec_id = strategy_spec.id
+
+    weights = [{"w": torch.randn(32, 32)}]
+    for _ in range(3):
+        weights.append({"w": weights[-1]["w"] + 1e-4 * torch.randn(32, 32)})
+    ray.get(server.set_weights.remote(spec_id, "policy-0", weights[0]))
+
+    # deltas are encoded against the caller's version
+    ray.get(server.set_weights.remote(spec_id, "policy-0", weights[1]))
+    info = ray.get(
+        server.get_weights_if_newer.remote(spec_id, "policy-0", 1, wire_format="delta")
+    )
+    assert info["version"] == 2 and info["base_version"] == 1
+    decoded = decode_weights(info["weights"], weights[0])
+    assert torch.equal(decoded["w"], weights[1]["w"])
+
+    # set weights with deltas
+    version = ray.get(
+        server.set_weights.remote(
+            spec_id,
+            "policy-0",
+            encode_weights(weights[2], "delta", weights[1]),
+            base_version=2,
+        )
+    )
+    assert version == 3
+    info = ray.get(server.get_weights.remote(spec_id, "policy-0"))
+    assert torch.equal(info["weights"]["w"], weights[2]["w"])
+
+    # version 1 has been dropped, full snapshots instead
+    info = ray.get(
+        server.get_weights_if_newer.remote(spec_id, "policy-0", 1, wire_format="delta")
+    )
+    assert info["base_version"] == 0
+    assert torch.equal(decode_weights(info["weights"])["w"], weights[2]["w"])
+    with pytest.raises(ValueError):
+        ray.get(
+            server.set_weights.remote(
+                spec_id,
+                "policy-0",
+                encode_weights(weights[3], "delta", weights[0]),
+                base_version=1,
+            )
+        )
+
+    # publishers fall back to full weights once the base is dropped
+    publisher = WeightPublisher(server, wire_format="delta")
+    for i in range(4):
+        publisher.push(spec_id, "policy-0", weights[i])
+        publisher.flush()
+        if i == 1:
+            for _ in range(2):
+                ray.get(server.set_weights.remote(spec_id, "policy-0", weights[0]))
+    info = ray.get(server.get_weights.remote(spec_id, "policy-0"))
+    assert torch.equal(info["weights"]["w"], weights[3]["w"])
+    assert info["version"] == 9
+
+    ray.shutdown()
+
+
+def _gradient_table(**optim_config):
+    return Table(
+        policy_meta_data={
+            "policy_cls": rl.pg.PGPolicy,
+            "optim_config": {"type": "SGD", "lr": 1.0, **optim_config},
+            "kwargs": {
+                "observation_space": spaces.Box(low=-np.inf, high=np.inf, shape=(3,)),
+                "action_space": spaces.Discrete(2),
+                "model_config": rl.pg.DEFAULT_CONFIG["model_config"],
+                "custom_config": rl.pg.DEFAULT_CONFIG["custom_config"],
+                "kwargs": {},
+            },
+        }
+    )
+
+
+def test_gradient_aggregation():
+    # bounded asynchronous updates
+    table = _gradient_table(max_staleness=1)
+    table.set_weights(table.policy.state_dict())
+    params = [p.detach().clone() for p in table.parameters]
+    grads = [torch.ones_like(p) for p in params]
+    for version in (1, 1):
+        assert table.apply_gradients(grads, version)["accepted"]
+    ret = table.apply_gradients(grads, 1)
+    assert not ret["accepted"] and ret["version"] == 3
+    for p, _p in zip(table.parameters, params):
+        assert torch.allclose(p, _p - 2)
+    with pytest.raises(ValueError):
+        table.apply_gradients(grads[1:], 3)
+
+    # synchronous updates average gradients of replicas
+    table = _gradient_table(num_replicas=2, max_staleness=0)
+    table.set_weights(table.policy.state_dict())
+    params = [p.detach().clone() for p in table.parameters]
+    results = [None, None]
+
+    def _replica(i):
+        grads = [torch.full_like(p, float(i)) for p in params]
+        results[i] = table.apply_gradients(grads, 1)
+
+    threads = [threading.Thread(target=_replica, args=(i,)) for i in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=10)
+    # both replicas return after the aggregated update
+    assert [ret["version"] for ret in results] == [2, 2]
+    assert sum(ret["weights"] is not None for ret in results) == 1
+    for p, _p in zip(table.parameters, params):
+        assert torch.allclose(p, _p - 0.5)
+
+
+def test_remote_optimizer():
+    if not ray.is_initialized():
+        ray.init()
+
+    server = ParameterServer.as_remote(num_cpus=0).remote()
+    strategy_spec = StrategySpec(
+        identifier="test_remote_optimizer",
+        policy_ids=["policy-0"],
+        meta_data={
+            "policy_cls": rl.dqn.DQNPolicy,
+            "optim_config": {"type": "SGD", "lr": 0.1, "max_staleness": 0},
+            "kwargs": {
+                "observation_space": spaces.Box(low=-np.inf, high=np.inf, shape=(3,)),
+                "action_space": spaces.Discrete(2),
+                "model_config": rl.dqn.DEFAULT_CONFIG["model_config"],
+                "custom_config": rl.dqn.DEFAULT_CONFIG["custom_config"],
+                "kwargs": {},
+            },
+            "experiment_tag": "test_remote_optimizer",
+        },
+    )
+    ray.get(server.create_table.remote(strategy_spec))
+    policies = [strategy_spec.gen_policy() for _ in range(2)]
+    ray.get(
+        server.set_weights.remote(
+            strategy_spec.id, "policy-0", policies[0].state_dict()
+        )
+    )
+
+    # replicas start from the weights of the parameter server
+    optimizers = [
+        RemoteOptimizer(
+            torch.optim.SGD(list(policy.critic.parameters())[:-1], lr=0.1),
+            server,
+            strategy_spec.id,
+            "policy-0",
+            policy,
+        )
+        for policy in policies
+    ]
+    for p, _p in zip(policies[0].critic.parameters(), policies[1].critic.parameters()):
+        assert torch.equal(p, _p)
+    # the last parameter is maintained locally, like target networks
+    local = list(policies[1].critic.parameters())[-1]
+    with torch.no_grad():
+        local.add_(1.0)
+    expected = local.detach().clone()
+
+    obs = torch.randn(8, 3)
+    for policy, optimizer in zip(policies, optimizers):
+        optimizer.zero_grad()
+        policy.critic(obs)[0].sum().backward()
+    # the second replica computed gradients on stale weights
+    optimizers[0].step()
+    optimizers[1].step()
+    assert [o.num_rejected for o in optimizers] == [0, 1]
+    assert optimizers[1].version == 2
+    for p, _p in zip(
+        list(policies[0].critic.parameters())[:-1],
+        list(policies[1].critic.parameters())[:-1],
+    ):
+        assert torch.equal(p, _p)
+    assert torch.equal(local, expected)
+    assert optimizers[0].param_groups[0]["lr"] == 0.1
+
+    ray.shutdown()
+
+
+def test_checkpoint(tmp_path):
+    strategy_spec = StrategySpec(
+        identifier="test_checkpoint",
+        policy_ids=["policy-0", "policy-1", "policy-2"],
+        meta_data={
+            "policy_cls": rl.dqn.DQNPolicy,
+            "kwargs": {
+                "observation_space": spaces.Box(low=-np.inf, high=np.inf, shape=(3,)),
+                "action_space": spaces.Discrete(2),
+                "model_config": rl.dqn.DEFAULT_CONFIG["model_config"],
+                "custom_config": rl.dqn.DEFAULT_CONFIG["custom_config"],
+                "kwargs": {},
+            },
+            "experiment_tag": "test_checkpoint",
+        },
+    )
+    checkpoint_dir = str(tmp_path / "params")
+    server = ParameterServer(checkpoint_dir=checkpoint_dir, checkpoint_interval=0.05)
+    server.create_table(strategy_spec)
+    policies = [strategy_spec.gen_policy() for _ in range(2)]
+    for i, policy in enumerate(policies):
+        server.set_weights(strategy_spec.id, f"policy-{i}", policy.state_dict())
+
+    # background checkpoints
+    filename = os.path.join(checkpoint_dir, strategy_spec.id, "spec.pkl")
+    start = time.time()
+    while not os.path.exists(filename) and time.time() - start < 10:
+        time.sleep(0.05)
+    assert os.path.exists(filename)
+
+    # only updated tables are written, and tables without weights are skipped
+    server.set_weights(strategy_spec.id, "policy-1", policies[1].state_dict())
+    server.shutdown()
+    assert server.checkpoint() == {}
+    server.set_weights(strategy_spec.id, "policy-1", policies[1].state_dict())
+    assert server.checkpoint() == {f"{strategy_spec.id}/policy-1": 3}
+
+    # tables are restored lazily, with their versions
+    server = ParameterServer(checkpoint_dir=checkpoint_dir)
+    server.weight_refs[f"{strategy_spec.id}/policy-0"] = (5, None)
+    specs = server.restore(checkpoint_dir)
+    # cached refs are outdated, as versions could move backward
+    assert len(server.weight_refs) == 0
+    assert [spec.policy_ids for spec in specs] == [strategy_spec.policy_ids]
+    assert server.get_versions() == {
+        f"{strategy_spec.id}/policy-0": 1,
+        f"{strategy_spec.id}/policy-1": 3,
+        f"{strategy_spec.id}/policy-2": 0,
+    }
+    table = server.tables[f"{strategy_spec.id}/policy-0"]
+    assert table.state_dict is None
+    info = server.get_weights(strategy_spec.id, "policy-0")
+    assert info["version"] == 1
+    for k, v in policies[0].state_dict().items():
+        if isinstance(v, dict):
+            for _k, _v in v.items():
+                assert torch.equal(_v, info["weights"][k][_k]), (k, _k)
+    assert server.checkpoint() == {}
+    assert server.set_weights(strategy_spec.id, "policy-0", info["weights"]) == 2
+
+    # policies are loaded from checkpoints on first access
+    policy = specs[0].load_from_checkpoint("policy-1")
+    assert policy is specs[0].load_from_checkpoint("policy-1")
+    for p, _p in zip(policy.critic.parameters(), policies[1].critic.parameters()):
+        assert torch.equal(p, _p)
+    with pytest.raises(ValueError):
+        strategy_spec.load_from_checkpoint("policy-1")
+
+
+def test_weights_many():
+    if not ray.is_initialized():
+        ray.init()
+
+    server = ParameterServer.as_remote(num_cpus=0).remote()
+    strategy_spec = StrategySpec(
+        identifier="test_weights_many",
+        policy_ids=[f"policy-{i}" for i in range(4)],
+        meta_data={
+            "policy_cls": rl.dqn.DQNPolicy,
+            "kwargs": {
+                "observation_space": spaces.Box(low=-np.inf, high=np.inf, shape=(3,)),
+                "action_space": spaces.Discrete(2),
+                "model_config": rl.dqn.DEFAULT_CONFIG["model_config"],
+                "custom_config": rl.dqn.DEFAULT_CONFIG["custom_config"],
+                "kwargs": {},
+            },
+            "experiment_tag": "test_weights_many",
+        },
+    )
+    ray.get(server.create_table.remote(strategy_spec))
+    spec_id = strategy_spec.id
+
+    weights = [{"w": torch.full((8, 8), float(i))} for i in range(4)]
+    versions = ray.get(
+        server.set_weights_many.remote(
+            [(spec_id, f"policy-{i}", w) for i, w in enumerate(weights[:3])]
+            + [(spec_id, "policy-3", ray.put(weights[3]))]
+        )
+    )
+    assert versions == [1, 1, 1, 1]
+
+    tables = [(spec_id, f"policy-{i}") for i in (2, 0, 3)]
+    infos = ray.get(server.get_weights_many.remote(tables))
+    assert [(info["spec_id"], info["spec_policy_id"]) for info in infos] == tables
+    assert [info["version"] for info in infos] == [1, 1, 1]
+    for i, state_dict in zip((2, 0, 3), ray.get([info["weights"] for info in infos])):
+        assert torch.equal(state_dict["w"], weights[i]["w"])
+
+    # refs are shared until weights are updated
+    again = ray.get(server.get_weights_many.remote(tables[:1]))
+    assert again[0]["weights"] == infos[0]["weights"]
+    ray.get(server.set_weights.remote(spec_id, "policy-2", weights[0]))
+    again = ray.get(server.get_weights_many.remote(tables[:1]))
+    assert again[0]["version"] == 2 and again[0]["weights"] != infos[0]["weights"]
+    assert torch.equal(ray.get(again[0]["weights"])["w"], weights[0]["w"])
+
+    # refs are released once weights are updated, and the least recently used ones are evicted
+    server = ParameterServer(max_cached_refs=2)
+    server.create_table(strategy_spec)
+    server.set_weights_many([(spec_id, f"policy-{i}", weights[i]) for i in range(4)])
+    server.get_weights_many([(spec_id, f"policy-{i}") for i in range(3)])
+    assert list(server.weight_refs) == [f"{spec_id}/policy-1", f"{spec_id}/policy-2"]
+    server.set_weights(spec_id, "policy-2", weights[3])
+    assert list(server.weight_refs) == [f"{spec_id}/policy-1"]
+
+    ray.shutdown()
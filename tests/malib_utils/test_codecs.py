@@ -0,0 +1,130 @@
+# MIT License
+
+# Copyright (c) 2021 MARL @ SJTU
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import pickle
+
+import pytest
+import numpy as np
+import torch
+
+from gym import spaces
+
+from malib.utils.episode import Episode
+from malib.utils.codecs import (
+    make_codec,
+    infer_codecs,
+    encode_weights,
+    decode_weights,
+)
+from malib.utils.replay_buffer import ReplayBuffer
+
+
+@pytest.mark.parametrize("name", ["uint8", "float16", "bits"])
+def test_codec_roundtrip(name: str):
+    value = (np.random.random((10, 3, 5)) > 0.5).astype(np.float64)
+    codec = make_codec(name)
+    encoded = codec.encode(value)
+    assert len(encoded) == 10 and encoded.nbytes < value.nbytes
+    # decoding works with any leading dimensions, e.g., windows
+    decoded = codec.decode(encoded[np.array([[1, 2], [3, 4]])])
+    assert decoded.dtype == value.dtype
+    assert np.all(decoded == value[np.array([[1, 2], [3, 4]])])
+
+    # a codec could be restored from its state dict
+    restored = make_codec(codec.state_dict())
+    assert np.all(restored.decode(encoded) == value)
+
+
+def test_infer_codecs():
+    obs_space = spaces.Dict({"a": spaces.Discrete(3), "b": spaces.MultiBinary(4)})
+    codecs = infer_codecs(obs_space, spaces.Discrete(5))
+    assert codecs[Episode.CUR_OBS] == "uint8"
+    assert codecs[Episode.ACTION] == "uint8"
+    assert codecs[Episode.ACTION_MASK] == codecs[Episode.DONE] == "bits"
+
+    box = spaces.Box(-1.0, 1.0, shape=(3,))
+    assert Episode.CUR_OBS not in infer_codecs(box, box)
+    assert infer_codecs(box, box, float16_obs=True)[Episode.CUR_OBS] == "float16"
+
+
+def test_replay_buffer_with_codecs(tmp_path):
+    n, obs_dim, n_action = 20, 16, 6
+    data = {
+        Episode.CUR_OBS: np.eye(obs_dim)[np.random.randint(obs_dim, size=n)],
+        Episode.ACTION_MASK: (np.random.random((n, n_action)) > 0.5).astype(np.float64),
+        Episode.ACTION: np.random.randint(n_action, size=n),
+        Episode.DONE: np.arange(n) == n - 1,
+    }
+    codecs = infer_codecs(spaces.Discrete(obs_dim), spaces.Discrete(n_action))
+    buffer = ReplayBuffer(size=32, codecs=codecs, path=str(tmp_path))
+    plain = ReplayBuffer(size=32)
+    buffer.add_batch(data)
+    plain.add_batch(data)
+    stored = sum(buffer.data[k][:32].nbytes for k in buffer.data)
+    assert stored * 4 < sum(v.nbytes for v in plain.data.values())
+
+    batch, indices = buffer.sample(8)
+    for k, v in data.items():
+        assert batch[k].dtype == v.dtype
+        assert np.all(batch[k] == v[indices])
+
+    # codecs are restored with the table
+    reopened = ReplayBuffer(size=32, path=str(tmp_path))
+    batch, indices = reopened.sample(8)
+    assert np.all(batch[Episode.CUR_OBS] == data[Episode.CUR_OBS][indices])
+
+
+@pytest.mark.parametrize("wire_format", ["full", "float16", "bfloat16", "delta"])
+def test_weights_wire_format(wire_format: str):
+    base = {
+        "net": {"weight": torch.randn(64, 64) * 0.05, "steps": torch.tensor(3)},
+        "name": "net",
+    }
+    weights = {
+        "net": {
+            "weight": base["net"]["weight"] + 1e-4 * torch.randn(64, 64),
+            "steps": torch.tensor(4),
+        },
+        "name": "net",
+    }
+    encoded = encode_weights(weights, wire_format, base)
+    decoded = decode_weights(encoded, base)
+    assert decoded["name"] == "net" and decoded["net"]["steps"] == 4
+    assert decoded["net"]["weight"].dtype == torch.float32
+    if wire_format in ("full", "delta"):
+        # lossless
+        assert torch.equal(decoded["net"]["weight"], weights["net"]["weight"])
+    else:
+        assert torch.allclose(
+            decoded["net"]["weight"], weights["net"]["weight"], atol=1e-3
+        )
+    if wire_format != "full":
+        assert len(pickle.dumps(encoded)) < 0.8 * len(pickle.dumps(weights))
+
+    if wire_format == "delta":
+        with pytest.raises(ValueError):
+            decode_weights(encoded)
+        # a delta without base is a full snapshot
+        assert torch.equal(
+            decode_weights(encode_weights(weights, "delta"))["net"]["weight"],
+            weights["net"]["weight"],
+        )
@@ -0,0 +1,477 @@
+# MIT License
+
+# Copyright (c) 2021 MARL @ SJTU
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import os
+import json
+import threading
+
+import pytest
+import numpy as np
+
+from malib.utils.episode import Episode
+from malib.utils.replay_buffer import (
+    ReplayBuffer,
+    PrioritizedReplayBuffer,
+    MultiagentReplayBuffer,
+    FIFOReplayBuffer,
+    SegmentedColumn,
+    iter_batch_info,
+    iter_episode_chunks,
+)
+from malib.utils.segment_tree import SumSegmentTree, MinSegmentTree
+
+
+def gen_batch(start: int, n: int):
+    return {
+        Episode.CUR_OBS: np.arange(start, start + n, dtype=np.float32).reshape(n, 1),
+        Episode.REWARD: np.arange(start, start + n, dtype=np.float32),
+    }
+
+
+@pytest.mark.parametrize("capacity,batch_size", [(10, 3), (10, 10), (10, 25), (7, 4)])
+def test_ring_buffer_insertion(capacity: int, batch_size: int):
+    buffer = ReplayBuffer(size=capacity)
+    total = 0
+    for _ in range(5):
+        indices = buffer.add_batch(gen_batch(total, batch_size))
+        total += batch_size
+        assert len(buffer) == min(total, capacity)
+        assert buffer.flag == total % capacity
+        # returned indices point to the latest rows
+        expected = np.arange(total - len(indices), total, dtype=np.float32)
+        assert np.all(buffer.data[Episode.REWARD][indices] == expected)
+
+    # the table keeps exactly the latest `capacity` rows
+    kept = np.sort(buffer.data[Episode.REWARD][: len(buffer)])
+    assert np.all(kept == np.arange(total - len(buffer), total))
+
+
+def test_ring_buffer_sample():
+    buffer = ReplayBuffer(size=16)
+    buffer.add_batch(gen_batch(0, 5))
+    batch, indices = buffer.sample(32)
+    assert np.all(indices < 5)
+    assert np.all(batch[Episode.CUR_OBS][:, 0] == batch[Episode.REWARD])
+
+
+@pytest.mark.parametrize("table_type", ["uniform", "prioritized", "multiagent"])
+def test_sample_many(table_type: str):
+    if table_type == "multiagent":
+        buffer = MultiagentReplayBuffer(size=16)
+        buffer.add_batch({"a": gen_batch(0, 10), "b": gen_batch(100, 10)})
+    else:
+        buffer_cls = (
+            ReplayBuffer if table_type == "uniform" else PrioritizedReplayBuffer
+        )
+        buffer = buffer_cls(size=16)
+        buffer.add_batch(gen_batch(0, 10))
+
+    block = buffer.sample_many(4, 8)
+    batch_infos = list(iter_batch_info(block))
+    assert len(batch_infos) == 4
+    for batch_info in batch_infos:
+        batch, indices = batch_info["a"] if table_type == "multiagent" else batch_info
+        assert batch[Episode.CUR_OBS].shape == (8, 1) and indices.shape == (8,)
+        assert np.all(batch[Episode.REWARD] == indices)
+        if table_type == "prioritized":
+            assert batch.weight.shape == (8,)
+
+
+def test_segment_tree():
+    size = 13
+    values = np.random.random(size)
+    sum_tree, min_tree = SumSegmentTree(size), MinSegmentTree(size)
+    sum_tree[np.arange(size)] = values
+    min_tree[np.arange(size)] = values
+
+    assert np.isclose(sum_tree.reduce(), values.sum())
+    assert np.isclose(sum_tree.reduce(3, 9), values[3:9].sum())
+    assert np.isclose(min_tree.reduce(), values.min())
+    assert np.isclose(min_tree.reduce(2, 5), values[2:5].min())
+
+    prefix = np.cumsum(values)
+    scalar = np.random.random(100) * values.sum()
+    expected = np.searchsorted(prefix, scalar, side="right")
+    assert np.all(sum_tree.get_prefix_sum_idx(scalar) == expected)
+
+
+def test_prioritized_replay_buffer():
+    buffer = PrioritizedReplayBuffer(size=8, alpha=1.0, beta=1.0)
+    buffer.add_batch(gen_batch(0, 4))
+    # only the transition with a large priority will be sampled
+    buffer.update_priorities(np.arange(4), np.array([0.0, 0.0, 1e6, 0.0]))
+    batch, indices = buffer.sample(16)
+    assert np.all(indices == 2)
+    assert np.allclose(batch["weight"], buffer.get_weight(indices))
+    # new transitions are inserted with the maximum priority
+    indices = buffer.add_batch(gen_batch(4, 2))
+    assert np.allclose(buffer._sum_tree[indices], buffer._max_prio)
+
+
+def test_lock_free_sampling():
+    # every row is filled with its global id, so a torn row has different values
+    buffer = ReplayBuffer(size=64)
+    buffer.add_batch({"x": np.zeros((64, 16384), dtype=np.int64)})
+    stop = threading.Event()
+
+    def write():
+        total = 64
+        while not stop.is_set():
+            ids = np.arange(total, total + 16)
+            buffer.add_batch({"x": np.repeat(ids[:, None], 16384, axis=1)})
+            total += 16
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    try:
+        for _ in range(500):
+            batch, indices = buffer.sample(8)
+            assert np.all(batch["x"] == batch["x"][:, :1]), indices
+    finally:
+        stop.set()
+        writer.join()
+    assert buffer.version > 1
+
+
+def test_disk_backed_replay_buffer(tmp_path):
+    path = str(tmp_path / "table")
+    buffer = ReplayBuffer(size=10, path=path, segment_size=4)
+    for start in range(0, 13, 3):
+        buffer.add_batch(gen_batch(start, 3))
+    assert isinstance(buffer.data[Episode.REWARD], SegmentedColumn)
+
+    # headers are written at most every `header_interval` seconds, and on flush
+    with open(os.path.join(path, "header.json"), "r") as f:
+        assert json.load(f)["size"] == 3
+    buffer.flush()
+    with open(os.path.join(path, "header.json"), "r") as f:
+        assert json.load(f)["size"] == 10
+
+    # reopen the table, and continue inserting
+    reopened = ReplayBuffer(size=10, path=path, segment_size=4)
+    assert (reopened.flag, reopened.size) == (buffer.flag, buffer.size)
+    for k, v in buffer.data.items():
+        assert np.all(reopened.data[k][:10] == v[:10])
+    reopened.add_batch(gen_batch(15, 3))
+    kept = np.sort(reopened.data[Episode.REWARD][:10])
+    assert np.all(kept == np.arange(8, 18))
+
+    batch, indices = reopened.sample(32)
+    assert np.all(batch[Episode.CUR_OBS][:, 0] == batch[Episode.REWARD])
+
+    with pytest.raises(ValueError):
+        ReplayBuffer(size=20, path=path)
+
+
+def test_segmented_column_reads(tmp_path):
+    path = str(tmp_path)
+    column = SegmentedColumn(path, "x", 10, 4, (2,), np.float32)
+    # reads never create segment files, and unwritten rows are zeros
+    assert np.all(column[:10] == 0)
+    assert os.listdir(path) == []
+
+    column[2:6] = np.ones((4, 2))
+    assert sorted(os.listdir(path)) == ["x.0.npy", "x.1.npy"]
+    assert np.all(column[:10].sum(axis=1) == [0, 0, 2, 2, 2, 2, 0, 0, 0, 0])
+    # readers map segments read-only
+    assert column.readers[0].mode == "r"
+
+
+@pytest.mark.parametrize("size", [10, 7])
+def test_table_snapshot(tmp_path, size: int):
+    path = str(tmp_path / "snapshot")
+    buffer = ReplayBuffer(size=10, segment_size=4, codecs={Episode.CUR_OBS: "float16"})
+    for start in range(0, size, 3):
+        batch = gen_batch(start, min(3, size - start))
+        batch[Episode.INFO] = np.array([{"step": i} for i in batch[Episode.REWARD]])
+        buffer.add_batch(batch)
+    buffer.save(path)
+
+    # copy into in-memory and disk-backed tables, or open the snapshot directly
+    loaded = [ReplayBuffer(size=10), ReplayBuffer(size=10, path=str(tmp_path / "disk"))]
+    for table in loaded:
+        table.load(path)
+    loaded.append(ReplayBuffer(size=10, path=path))
+    for table in loaded:
+        assert (table.flag, table.size) == (buffer.flag, buffer.size)
+        for k, v in buffer.data.items():
+            assert np.all(table.data[k][:size] == v[:size]), k
+        batch, indices = table.sample(16)
+        assert np.all(batch[Episode.CUR_OBS][:, 0] == batch[Episode.REWARD])
+        assert [info["step"] for info in batch[Episode.INFO]] == list(
+            batch[Episode.REWARD]
+        )
+        # insertions continue from the loaded cursor
+        indices = table.add_batch(gen_batch(100, 2))
+        assert np.all(indices == (buffer.flag + np.arange(2)) % 10)
+
+    joint = MultiagentReplayBuffer(size=10)
+    joint.add_batch({"a": gen_batch(0, 4), "b": gen_batch(10, 4)})
+    joint.save(str(tmp_path / "joint"))
+    loaded = MultiagentReplayBuffer(size=10)
+    loaded.load(str(tmp_path / "joint"))
+    assert loaded.agents == ["a", "b"] and len(loaded) == 4
+    assert np.all(loaded.data[Episode.REWARD][:4] == joint.data[Episode.REWARD][:4])
+
+    with pytest.raises(ValueError):
+        ReplayBuffer(size=20).load(path)
+
+
+def gen_episode(start: int, n: int):
+    batch = gen_batch(start, n)
+    batch[Episode.NEXT_OBS] = batch[Episode.CUR_OBS] + 1
+    batch[Episode.DONE] = np.arange(n) == n - 1
+    return batch
+
+
+@pytest.mark.parametrize("sample_avail", [False, True])
+def test_sequence_sampling(sample_avail: bool):
+    buffer = ReplayBuffer(size=32, stack_num=4, sample_avail=sample_avail)
+    # episodes of length 3, 5 and 6, the first one is shorter than the window
+    for start, n in [(0, 3), (3, 5), (8, 6)]:
+        buffer.add_batch(gen_episode(start, n))
+
+    batch, indices = buffer.sample(256)
+    assert indices.shape == (256, 4)
+    assert batch[Episode.REWARD].shape == batch.mask.shape == (256, 4)
+    rew = batch[Episode.REWARD]
+    # valid steps are consecutive, and padded steps repeat the last valid step
+    assert np.all(np.diff(rew, axis=1)[batch.mask[:, 1:]] == 1)
+    assert np.all(np.diff(rew, axis=1)[~batch.mask[:, 1:]] == 0)
+    # windows stop at episode ends
+    ends = np.array([2, 7, 13])
+    for row, mask in zip(rew, batch.mask):
+        assert not np.isin(row[mask][:-1], ends).any()
+    if sample_avail:
+        assert np.all(batch.mask)
+        assert not np.isin(rew[:, 0], [0, 1, 2, 5, 6, 7, 11, 12, 13]).any()
+
+
+@pytest.mark.parametrize("per_step", [False, True])
+def test_prioritized_windows(per_step: bool):
+    buffer = PrioritizedReplayBuffer(size=32, alpha=1.0, beta=1.0, stack_num=4)
+    for start, n in [(0, 3), (3, 5), (8, 6)]:
+        buffer.add_batch(gen_episode(start, n))
+    batch, indices = buffer.sample(16)
+    assert indices.shape == (16, 4)
+
+    # windows are prioritized by their start steps
+    starts = indices[:, 0]
+    td_errors = np.where(starts == starts[0], 1e6, 0.0)
+    if per_step:
+        # per-step errors are reduced by the maximum over steps
+        td_errors = np.stack([np.zeros(16), td_errors, np.zeros(16), td_errors], 1)
+    buffer.update_priorities(indices, td_errors)
+    assert np.isclose(buffer._sum_tree[starts[0]], 1e6 + buffer._eps)
+    batch, indices = buffer.sample(16)
+    assert np.all(indices[:, 0] == starts[0])
+
+
+def test_prioritized_sample_avail():
+    buffer = PrioritizedReplayBuffer(size=32, stack_num=4, sample_avail=True)
+    for start in range(0, 30, 5):
+        buffer.add_batch(gen_episode(start, 5))
+    # invalid starts have zero priorities, even after updates
+    buffer.update_priorities(np.arange(30), np.full(30, 10.0))
+    batch, indices = buffer.sample(512)
+    assert np.all(batch.mask)
+    assert set(np.unique(indices[:, 0] % 5)) == {0, 1}
+    assert np.all(np.isfinite(batch.weight))
+
+
+def test_ignore_obs_next_and_last_obs():
+    buffer = ReplayBuffer(size=16, ignore_obs_next=True, save_only_last_obs=True)
+    for start in (0, 5):
+        episode = gen_episode(start, 5)
+        # stacked observations with 2 frames
+        for k in (Episode.CUR_OBS, Episode.NEXT_OBS):
+            episode[k] = np.repeat(episode[k][:, None], 2, axis=1)
+        buffer.add_batch(episode)
+    assert Episode.NEXT_OBS not in buffer.data
+    assert buffer.data[Episode.CUR_OBS].shape == (16, 1)
+
+    batch, indices = buffer.sample(64)
+    obs, obs_next = batch[Episode.CUR_OBS][:, 0], batch[Episode.NEXT_OBS][:, 0]
+    done = np.isin(indices, [4, 9])
+    assert np.all(obs_next[~done] == obs[~done] + 1)
+    # the last step of an episode takes its own observation
+    assert np.all(obs_next[done] == obs[done])
+
+
+def test_compact_episode_storage():
+    episode = Episode(agents=["agent"])
+    for t in range(6):
+        transition = {
+            Episode.CUR_OBS: np.full(4, t, dtype=np.float32),
+            Episode.PRE_REWARD: float(t),
+            Episode.PRE_DONE: t == 5,
+        }
+        if t < 5:
+            transition[Episode.ACTION] = t
+        episode.record({"agent": transition}, agent_first=True)
+
+    full = episode.to_numpy()["agent"]
+    compact = episode.to_numpy(compact=True)["agent"]
+    assert Episode.NEXT_OBS not in compact
+    assert sum(v.nbytes for v in compact.values()) < sum(
+        v.nbytes for v in full.values()
+    )
+
+    buffer = ReplayBuffer(size=16, ignore_obs_next=True)
+    buffer.add_batch(compact)
+    batch, indices = buffer.sample(64)
+    not_done = ~batch[Episode.DONE]
+    assert np.all(
+        batch[Episode.NEXT_OBS][not_done] == full[Episode.NEXT_OBS][indices[not_done]]
+    )
+
+
+@pytest.mark.parametrize("stack_num", [1, 3])
+def test_multiagent_replay_buffer(tmp_path, stack_num: int):
+    path = str(tmp_path / "joint")
+    buffer = MultiagentReplayBuffer(size=16, stack_num=stack_num, path=path)
+    for start in (0, 6, 12):
+        # rewards of agent i are shifted by 100 * i
+        buffer.add_batch(
+            {
+                f"agent_{i}": {
+                    k: v + 100 * i if k == Episode.REWARD else v
+                    for k, v in gen_episode(start, 6).items()
+                }
+                for i in (1, 0)
+            }
+        )
+    assert buffer.agents == ["agent_0", "agent_1"]
+    assert buffer.data[Episode.REWARD].shape == (16, 2)
+
+    buffer.flush()
+    reopened = MultiagentReplayBuffer(size=16, stack_num=stack_num, path=path)
+    assert reopened.agents == buffer.agents and len(reopened) == 16
+
+    agent_batches = reopened.sample(32)
+    (batch_0, indices_0), (batch_1, indices_1) = (
+        agent_batches["agent_0"],
+        agent_batches["agent_1"],
+    )
+    # joint transitions are aligned across agents
+    assert indices_0 is indices_1
+    assert np.all(batch_1[Episode.REWARD] == batch_0[Episode.REWARD] + 100)
+    assert batch_0[Episode.CUR_OBS].shape == indices_0.shape + (1,)
+    if stack_num > 1:
+        assert np.all(batch_0.mask == batch_1.mask)
+
+
+def test_fifo_replay_buffer():
+    buffer = FIFOReplayBuffer(size=16)
+    buffer.add_batch(gen_episode(0, 6))
+    buffer.add_batch(gen_episode(6, 6))
+    # rows are consumed exactly once, in insertion order
+    batch, indices = buffer.sample(8)
+    assert np.all(batch[Episode.REWARD] == np.arange(8)) and len(buffer) == 4
+    batch, indices = buffer.sample(8)
+    assert np.all(batch[Episode.REWARD] == np.arange(8, 12)) and len(buffer) == 0
+    # unconsumed rows which are overwritten are dropped
+    buffer.add_batch(gen_episode(12, 20))
+    assert len(buffer) == 16 and buffer.dropped == 4
+    batch, _ = buffer.sample(16)
+    assert np.all(batch[Episode.REWARD] == np.arange(16, 32))
+
+    # blocks of batches, until rows run out
+    buffer.add_batch(gen_episode(32, 10))
+    batch_infos = list(iter_batch_info(buffer.sample_many(4, 4)))
+    assert [len(indices) for _, indices in batch_infos] == [4, 4, 2]
+    assert np.all(batch_infos[-1][0][Episode.REWARD] == np.arange(40, 42))
+    assert buffer.sample_many(4, 4) == ([], [])
+
+    # whole episodes, rows tagged with stale versions are dropped
+    buffer = FIFOReplayBuffer(size=32, episodic=True, max_staleness=1)
+    for start, n, version in [(0, 3, 0), (3, 4, 1), (7, 5, 2), (12, 9, 2)]:
+        episode = gen_episode(start, n)
+        episode[Episode.POLICY_VERSION] = np.full(n, version)
+        buffer.add_batch(episode)
+    batch, _ = buffer.sample(10)
+    assert np.all(batch[Episode.REWARD] == np.arange(3, 7)) and buffer.dropped == 3
+    batch, _ = buffer.sample(10)
+    assert np.all(batch[Episode.REWARD] == np.arange(7, 12))
+    # an episode longer than the batch size is consumed as a whole
+    batch, _ = buffer.sample(4)
+    assert np.all(batch[Episode.REWARD] == np.arange(12, 21)) and len(buffer) == 0
+
+    # staleness is measured against the learner version, even without newer rows
+    buffer = FIFOReplayBuffer(size=16, max_staleness=1)
+    for start, version in [(0, 2), (4, 3)]:
+        episode = gen_episode(start, 4)
+        episode[Episode.POLICY_VERSION] = np.full(4, version)
+        buffer.add_batch(episode)
+    buffer.set_learner_version(4)
+    buffer.set_learner_version(1)
+    batch, _ = buffer.sample(8)
+    assert np.all(batch[Episode.REWARD] == np.arange(4, 8)) and buffer.dropped == 4
+
+
+def test_iter_episode_chunks(tmp_path, monkeypatch):
+    # episodes of length 3, 5 and 4, without next observations
+    episodes = [gen_episode(0, 3), gen_episode(3, 5), gen_episode(8, 4)]
+    columns = {
+        k: np.concatenate([e[k] for e in episodes])
+        for k in (Episode.CUR_OBS, Episode.REWARD, Episode.DONE)
+    }
+    np.savez(tmp_path / "episodes.npz", **columns)
+
+    chunks = list(
+        iter_episode_chunks(str(tmp_path / "episodes.npz"), 7, complete_next=True)
+    )
+    # chunks end at episode ends, and an episode longer than the chunk size is kept whole
+    assert [len(c[Episode.REWARD]) for c in chunks] == [3, 5, 4]
+    for chunk, episode in zip(chunks, episodes):
+        expected = np.concatenate(
+            [episode[Episode.CUR_OBS][1:], episode[Episode.CUR_OBS][-1:]]
+        )
+        assert np.all(chunk[Episode.NEXT_OBS] == expected)
+
+    np.savez(
+        tmp_path / "agents.npz",
+        **{f"agent_{i}/{k}": v for i in range(2) for k, v in columns.items()},
+    )
+    chunks = list(iter_episode_chunks(str(tmp_path / "agents.npz"), 8))
+    assert list(chunks[0].keys()) == ["agent_0", "agent_1"]
+    assert [len(c["agent_0"][Episode.REWARD]) for c in chunks] == [8, 4]
+
+    # uncompressed columns are memory-mapped rather than loaded, compressed ones are loaded on first access
+    np.savez_compressed(tmp_path / "compressed.npz", **columns)
+    for name in ("episodes.npz", "compressed.npz"):
+        with monkeypatch.context() as m:
+            if name == "episodes.npz":
+                m.setattr(np, "load", None)
+            chunks = list(iter_episode_chunks(str(tmp_path / name), 7))
+        for k, v in columns.items():
+            assert np.all(np.concatenate([c[k] for c in chunks]) == v), (name, k)
+
+    # snapshots are read in insertion order from the cursor of a full ring
+    buffer = ReplayBuffer(size=10, segment_size=4)
+    for episode in episodes:
+        buffer.add_batch(episode)
+    buffer.save(str(tmp_path / "snapshot"))
+    chunks = list(iter_episode_chunks(str(tmp_path / "snapshot"), 6))
+    rewards = np.concatenate([c[Episode.REWARD] for c in chunks])
+    assert np.all(rewards == np.arange(2, 12))
+    assert [len(c[Episode.REWARD]) for c in chunks] == [6, 4]
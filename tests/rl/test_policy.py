@@ -25,12 +25,23 @@
 from typing import Dict, Any
 from functools import partial
 
+import pickle
+
 import pytest
 import gym
+import torch
+import torch.nn as nn
 
 from gym import spaces
 
 from malib.rl.common.policy import Policy
+from malib.utils.codecs import encode_weights, decode_weights
+from malib.utils.general import (
+    FlatStateDict,
+    pack_state_dict,
+    save_weights,
+    load_weights,
+)
 
 
 class FakePolicy(Policy):
@@ -111,3 +122,97 @@ def test_interface_calling(
         for device in ["cpu", "cuda"]:
             for use_copy in [True, False]:
                 policy.to(device=device, use_copy=use_copy)
+
+
+def test_flat_state_dict():
+    def make_policy():
+        policy = FakePolicy(
+            spaces.Box(-1.0, 1.0, shape=(4,)), spaces.Discrete(3), {}, {}
+        )
+        policy.net = nn.Sequential(nn.Linear(4, 8), nn.BatchNorm1d(8))
+        policy.register_state(policy.net, "net")
+        policy.register_state(0.5, "_eps")
+        return policy
+
+    policy, other = make_policy(), make_policy()
+    flat = policy.flat_state_dict()
+    assert set(flat.buffers) == {"float32", "int64"}
+    assert flat.extras == {("_eps",): 0.5}
+
+    # after binding, parameters are views of the flat buffers, and updates are visible
+    optimizer = torch.optim.SGD(policy.net.parameters(), lr=0.1)
+    policy.net(torch.randn(5, 4)).sum().backward()
+    optimizer.step()
+    policy._eps = 0.1
+    flat = pickle.loads(pickle.dumps(policy.flat_state_dict()))
+    other.load_state_dict(flat)
+    for k, v in policy.net.state_dict().items():
+        assert torch.equal(v, other.net.state_dict()[k])
+    assert other._eps == 0.1
+
+    # loading with the same layout is a copy into the bound buffers
+    buffer = other.flat_state_dict(copy=False).buffers["float32"]
+    other.load_state_dict(make_policy().flat_state_dict())
+    assert other.flat_state_dict(copy=False).buffers["float32"] is buffer
+
+    # rebind once the modules are replaced
+    policy.net = nn.Linear(4, 2)
+    policy.register_state(policy.net, "net")
+    assert len(policy.flat_state_dict().layout) == 2
+
+    # packed state dicts are encoded as buffers
+    encoded = encode_weights(flat, "delta", flat)
+    decoded = decode_weights(encoded, flat)
+    assert isinstance(decoded, FlatStateDict)
+    assert torch.equal(decoded.buffers["float32"], flat.buffers["float32"])
+
+
+def test_checkpoint_weights(tmp_path):
+    net = nn.Sequential(nn.Linear(4, 8), nn.BatchNorm1d(8))
+    state_dict = {"net": net.state_dict(), "_eps": 0.5}
+    filename = str(tmp_path / "policy.pt")
+    save_weights(filename, state_dict, version=3)
+    # checkpoints hold only tensors and plain containers
+    torch.load(filename, weights_only=True)
+
+    weights, version = load_weights(filename)
+    assert version == 3 and weights["_eps"] == 0.5
+    for k, v in net.state_dict().items():
+        assert torch.equal(weights["net"][k], v)
+
+    # packed weights are loaded packed
+    flat = pack_state_dict(state_dict)
+    save_weights(filename, flat, version=4)
+    weights, version = load_weights(filename)
+    assert isinstance(weights, FlatStateDict) and version == 4
+    assert weights.layout == flat.layout
+    assert torch.equal(weights.buffers["float32"], flat.buffers["float32"])
+
+
+def test_flat_state_dict_shared_parameters():
+    from malib.rl import a2c
+
+    policy = a2c.A2CPolicy(
+        observation_space=spaces.Box(-1.0, 1.0, shape=(4,)),
+        action_space=spaces.Discrete(3),
+        model_config=a2c.DEFAULT_CONFIG["model_config"],
+        custom_config=a2c.DEFAULT_CONFIG["custom_config"],
+    )
+    flat = policy.flat_state_dict(copy=False)
+    # the preprocess net shared by the actor and the critic is packed once
+    num_params = sum(
+        p.numel()
+        for p in {
+            id(p): p for m in (policy.actor, policy.critic) for p in m.parameters()
+        }.values()
+    )
+    assert flat.buffers["float32"].numel() == num_params
+
+    # bound buffers are reused, and shared parameters stay views of them
+    buffer = flat.buffers["float32"]
+    policy.load_state_dict(policy.flat_state_dict())
+    assert policy.flat_state_dict(copy=False).buffers["float32"] is buffer
+    shared = next(policy.actor.preprocess.parameters())
+    assert shared.data_ptr() in {
+        view.data_ptr() for _, view in policy._flat_binding["views"]
+    }